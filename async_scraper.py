@@ -0,0 +1,264 @@
+"""
+Asyncio scraping engine with several browser sessions in one event loop.
+
+Selenium's client is blocking, so each browser session owns a single
+worker thread and every WebDriver command is awaited through it. Waiting
+is done in the event loop: conditions from waits.py are polled with
+``await asyncio.sleep`` between polls instead of blocking a thread in
+WebDriverWait, so many sessions can sit in their waits at once. Country
+files are written on a separate writer thread while the sessions move on
+to the next country.
+
+Usage:
+    python async_scraper.py --country ALL --sessions 3 --format both
+"""
+
+import argparse
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium.common.exceptions import TimeoutException
+
+import cdp_capture
+import records
+import scrape_restaurants
+import waits
+from page_snapshots import snapshotter
+from scrape_restaurants import (
+    EXTRACTION_MODES,
+    OUTPUT_FORMATS,
+    SELECTED_COUNTRY_JS,
+    SUB_LOCATION_MODES,
+    SWITCH_COUNTRY_JS,
+    extract_restaurants_from_page_source,
+    extract_restaurants_with_script,
+    extract_restaurants_with_selenium,
+    fetch_sub_locations_in_bulk,
+    get_available_countries,
+    load_website,
+    location_div_tags,
+    save_page_html,
+    save_restaurants,
+)
+
+
+class AsyncSession:
+    """A browser session whose blocking WebDriver calls run on its own thread."""
+
+    def __init__(self, index, headless=True, capture_network=False, lean=False):
+        self.index = index
+        self.headless = headless
+        self.capture_network = capture_network
+        self.lean = lean
+        self.driver = None
+        # One thread per driver: WebDriver sessions are not safe to share between threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'session-{index}')
+
+    async def call(self, func, *args, **kwargs):
+        """Run a blocking function on this session's thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def start(self):
+        self.driver = await self.call(load_website, headless=self.headless, capture_network=self.capture_network,
+                                      lean=self.lean)
+        return self
+
+    async def close(self):
+        if self.driver is not None:
+            await self.call(self.driver.quit)
+            self.driver = None
+        self._executor.shutdown(wait=False)
+
+    async def until(self, condition, timeout=None):
+        """Poll a waits.py condition without blocking the event loop."""
+        timeout = waits.DEFAULT_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            result = await self.call(condition, self.driver)
+            if result:
+                return result
+            if time.monotonic() >= deadline:
+                raise TimeoutException(f"Condition not met within {timeout}s")
+            await asyncio.sleep(waits.POLL_FREQUENCY)
+
+
+async def switch_country_async(session, country_code):
+    print(f"[session {session.index}] Switching to country code: {country_code}")
+    before = (await session.call(waits.page_state, session.driver))['mutations']
+    changed = await session.call(session.driver.execute_script, SWITCH_COUNTRY_JS, country_code)
+    if changed:
+        try:
+            await session.until(waits.dom_changed(before))
+        except TimeoutException:
+            print(f"[session {session.index}] Warning: The restaurant list did not change for {country_code}.")
+    try:
+        await session.until(waits.page_idle())
+    except TimeoutException:
+        print(f"[session {session.index}] Warning: The page did not settle for {country_code}.")
+    try:
+        await session.until(waits.present(location_div_tags['restaurant']))
+    except TimeoutException:
+        print(f"[session {session.index}] Warning: Content update timed out or no restaurants found for {country_code}.")
+
+
+async def load_all_tiles_async(session, tile_selector, max_scrolls=20):
+    """Coroutine version of waits.load_all_tiles."""
+    driver = session.driver
+    await session.call(waits.install_observer, driver)
+    state = await session.call(waits.tile_state, driver, tile_selector)
+    if waits.list_complete(driver, state):
+        return state['tiles']
+
+    initial = count = state['tiles']
+    for _ in range(max_scrolls):
+        await session.call(driver.execute_script, waits.SCROLL_PAST_LAST_TILE_JS, tile_selector)
+        try:
+            state = await session.until(waits.tiles_grew_or_idle(tile_selector, count))
+        except TimeoutException:
+            state = await session.call(waits.tile_state, driver, tile_selector)
+        if state['tiles'] <= count:
+            break
+        count = state['tiles']
+        if state['total'] is not None and count >= state['total']:
+            break
+    waits.learn_list_size(driver, initial, count)
+    await session.call(driver.execute_script, "window.scrollTo(0, 0);")
+    return count
+
+
+async def scrape_restaurants_async(session, country_code, country_name, extraction='html', sub_location_mode='modal'):
+    """Coroutine version of scrape_restaurants."""
+    driver = session.driver
+    try:
+        if extraction == 'cdp':
+            # Keep the page-load traffic if the country is already selected
+            selected = await session.call(driver.execute_script, SELECTED_COUNTRY_JS)
+            if selected != country_code:
+                await session.call(cdp_capture.drain_performance_log, driver)
+
+        await switch_country_async(session, country_code)
+
+        if extraction == 'cdp':
+            payloads = await session.call(cdp_capture.capture_json_responses, driver)
+            restaurants = cdp_capture.records_from_payloads(payloads, country_code, country_name)
+            if restaurants:
+                return restaurants
+            print(f"[session {session.index}] No restaurant data in network responses, falling back to page parsing")
+            extraction = 'html'
+
+        await load_all_tiles_async(session, location_div_tags['restaurant'])
+
+        sub_locations = {}
+        if sub_location_mode == 'bulk':
+            try:
+                sub_locations = await session.call(fetch_sub_locations_in_bulk, driver, country_code, country_name)
+            except Exception as e:
+                print(f"[session {session.index}] Bulk sub-location fetch failed: {e}")
+
+        extract = {
+            'html': extract_restaurants_from_page_source,
+            'js': extract_restaurants_with_script,
+        }.get(extraction, extract_restaurants_with_selenium)
+        restaurants = await session.call(extract, driver, country_code, country_name, sub_locations)
+        print(f"[session {session.index}] Found {len(restaurants)} restaurants for {country_code}")
+        return restaurants
+    except Exception:
+        await session.call(save_page_html, driver, f'_{country_code}', error=True)
+        raise
+
+
+async def scrape_countries_async(country_codes=None, sessions=2, headless=True, extraction='html',
+                                 sub_location_mode='modal', output_format='csv', lean=False):
+    """
+    Scrape countries with several sessions in one event loop.
+
+    country_codes=None scrapes every available country. Returns a dict of
+    country code -> row count (None for countries that failed).
+    """
+    capture_network = extraction == 'cdp'
+    first = await AsyncSession(0, headless, capture_network, lean).start()
+    available = await first.call(get_available_countries, first.driver)
+    codes = list(available) if country_codes is None else [c for c in country_codes if c in available]
+    for missing in set(country_codes or []) - set(available):
+        print(f"Error: Country '{missing}' not found in available countries.")
+
+    # Start the remaining sessions concurrently
+    count = max(1, min(sessions, len(codes)))
+    started = await asyncio.gather(
+        *(AsyncSession(i, headless, capture_network, lean).start() for i in range(1, count)),
+        return_exceptions=True,
+    )
+    session_list = [first] + [s for s in started if isinstance(s, AsyncSession)]
+    for error in (s for s in started if isinstance(s, BaseException)):
+        print(f"Could not start a browser session: {error}")
+
+    queue = asyncio.Queue()
+    for code in codes:
+        queue.put_nowait(code)
+
+    results = {}
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+    writes = []
+    loop = asyncio.get_running_loop()
+
+    async def worker(session):
+        while True:
+            try:
+                code = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                restaurants = await scrape_restaurants_async(session, code, available[code], extraction, sub_location_mode)
+                restaurants, _ = records.resolve_duplicates(restaurants)
+                results[code] = len(restaurants)
+                # Write on the writer thread while this session moves on
+                writes.append(loop.run_in_executor(writer, save_restaurants, restaurants, code, output_format))
+            except Exception as e:
+                print(f"Failed to scrape {code}: {e}")
+                results[code] = None
+
+    try:
+        await asyncio.gather(*(worker(session) for session in session_list))
+        await asyncio.gather(*writes)
+    finally:
+        await asyncio.gather(*(session.close() for session in session_list), return_exceptions=True)
+        writer.shutdown(wait=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrape AMEX Dining Benefits with the asyncio engine')
+    parser.add_argument('--country', type=str, default='GB', help='Comma-separated country codes or "ALL"')
+    parser.add_argument('--sessions', type=int, default=2, help='Browser sessions kept in flight. Default: 2')
+    parser.add_argument('--extraction', choices=EXTRACTION_MODES, default='html', help='Extraction mode. Default: html')
+    parser.add_argument('--sub-locations', choices=SUB_LOCATION_MODES, default='modal', help='Sub-location mode. Default: modal')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help='Output format. Default: csv')
+    parser.add_argument('--wait-timeout', type=float, default=waits.DEFAULT_TIMEOUT, help=f'Seconds to wait for the page to settle. Default: {waits.DEFAULT_TIMEOUT}')
+    parser.add_argument('--visible', action='store_true', help='Run with visible browser windows')
+    parser.add_argument('--lean', action='store_true', help='Lightweight browser profile (block images, fonts and trackers, eager page loads)')
+    parser.add_argument('--debug', action='store_true', help='Enable debug output')
+    args = parser.parse_args()
+
+    scrape_restaurants.debug = args.debug
+    waits.DEFAULT_TIMEOUT = args.wait_timeout
+    target = args.country.upper()
+    country_codes = None if target == 'ALL' else [c.strip() for c in target.split(',') if c.strip()]
+
+    try:
+        results = asyncio.run(scrape_countries_async(
+            country_codes, sessions=args.sessions, headless=not args.visible, extraction=args.extraction,
+            sub_location_mode=args.sub_locations, output_format=args.format, lean=args.lean,
+        ))
+        failed = [code for code, rows in results.items() if rows is None]
+        print(f"\nScraped {len(results) - len(failed)} countries" + (f", failed: {', '.join(failed)}" if failed else ""))
+    except KeyboardInterrupt:
+        print("\nScraping interrupted by user.")
+    finally:
+        snapshotter.flush()
+
+
+if __name__ == "__main__":
+    main()
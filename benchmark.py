@@ -0,0 +1,362 @@
+"""
+Offline benchmark for the extraction and combine hot paths.
+
+Builds a synthetic dining benefit page (or loads saved page_source*.html
+snapshots), serves it from a local HTTP server and times:
+
+- offline HTML parsing of every tile (no browser needed)
+- scrape_restaurants in each extraction mode against the synthetic page,
+  including switch_country, scrolling and chain modals (needs Chrome)
+- combine_csv_files over generated per-country CSVs
+- startup of the scrape_restaurants.py commands (combine, query, report),
+  each in a fresh interpreter against a couple of tiny country files
+
+Each phase reports wall time, WebDriver commands sent and peak Python
+memory, so there is a baseline to compare performance work against.
+
+Usage:
+    python benchmark.py --tiles 2000 --chains 100
+    python benchmark.py --snapshot page_source_GB_20250101-120000-000000.html.gz --no-browser
+"""
+
+import argparse
+import csv
+import functools
+import glob
+import html
+import http.server
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import scrape_restaurants
+from csv_utils import combine_csv_files
+from page_snapshots import read_snapshot
+from restaurant_parsing import extract_restaurants_from_html
+from scrape_restaurants import (
+    close_locations_button,
+    location_div_tags,
+    sub_location_div_tags,
+    view_locations_button,
+)
+
+
+CUISINES = ['Italian', 'French', 'Japanese', 'Indian', 'British', 'Thai', 'Mexican', 'Chinese']
+
+
+def _open_tag(selector, extra=''):
+    # 'div.sc-kOPcWz' -> '<div class="sc-kOPcWz">'
+    tag, _, classes = selector.partition('.')
+    return f'<{tag} class="{classes.replace(".", " ")}"{extra}>', f'</{tag}>'
+
+
+def _tile_html(div_tags, index, name, new=False, asterisk=False, chain_index=None):
+    tile_open, tile_close = _open_tag(div_tags['restaurant'])
+    name_open, name_close = _open_tag(div_tags['name'])
+    address_open, address_close = _open_tag(div_tags['address'])
+    cuisine_open, cuisine_close = _open_tag(div_tags['cuisine'])
+
+    flags = '<div id="flags">NEW</div>' if new else '<div id="flags"></div>'
+    star = '<div>*</div>' if asterisk else ''
+    parts = [
+        tile_open,
+        f'{name_open}{flags}{html.escape(name)}{star}{name_close}',
+        f'{cuisine_open}<svg width="8" height="8"></svg>{CUISINES[index % len(CUISINES)]}{cuisine_close}',
+    ]
+    if chain_index is None:
+        parts.append(f'{address_open}{index} High Street<br>Town {index % 50}<br>AB{index % 90} 1CD{address_close}')
+        parts.append(f'<a href="https://www.google.com/maps/search/?api=1&amp;query={index}">Map</a>')
+    else:
+        button_open, button_close = _open_tag(view_locations_button, f' data-chain="{chain_index}"')
+        parts.append(f'{button_open}View locations{button_close}')
+    parts.append(tile_close)
+    return ''.join(parts)
+
+
+def synthetic_country(country_code, tiles, chains, sub_locations):
+    """Return (tiles_html, [modal_html per chain]) for one synthetic country."""
+    tile_html = []
+    modals = []
+    chain_every = max(1, tiles // chains) if chains else 0
+    for i in range(tiles):
+        name = f'{country_code} Restaurant {i}'
+        if chains and i % chain_every == 0 and len(modals) < chains:
+            tile_html.append(_tile_html(location_div_tags, i, name, chain_index=len(modals)))
+            subs = ''.join(
+                _tile_html(sub_location_div_tags, i * 1000 + j, f'{name} Site {j}')
+                for j in range(sub_locations)
+            )
+            close_open, close_close = _open_tag(close_locations_button)
+            modals.append(f'<div id="modal">{close_open}Close{close_close}{subs}</div>')
+        else:
+            tile_html.append(_tile_html(location_div_tags, i, name, new=(i % 7 == 0), asterisk=(i % 11 == 0)))
+    return ''.join(tile_html), modals
+
+
+def synthetic_page(countries, tiles, chains, sub_locations):
+    """An interactive page with a #country select, tile list and chain modals."""
+    data = {code: synthetic_country(code, tiles, chains, sub_locations) for code in countries}
+    options = ''.join(f'<option value="{code}">{code} Country</option>' for code in countries)
+    tiles_js = json.dumps({code: value[0] for code, value in data.items()})
+    modals_js = json.dumps({code: value[1] for code, value in data.items()})
+    return f"""<!DOCTYPE html>
+<html><head><title>Benchmark</title></head><body>
+<select id="country">{options}</select>
+<div id="list"></div>
+<div id="modal-root"></div>
+<script>
+const TILES = {tiles_js};
+const MODALS = {modals_js};
+const select = document.getElementById('country');
+function render() {{
+    document.getElementById('list').innerHTML = TILES[select.value];
+}}
+select.addEventListener('change', () => setTimeout(render, 50));
+document.addEventListener('click', (event) => {{
+    const open = event.target.closest({json.dumps(view_locations_button)});
+    if (open) {{
+        const modal = MODALS[select.value][Number(open.dataset.chain)];
+        setTimeout(() => {{ document.getElementById('modal-root').innerHTML = modal; }}, 20);
+    }}
+    if (event.target.closest({json.dumps(close_locations_button)})) {{
+        setTimeout(() => {{ document.getElementById('modal-root').innerHTML = ''; }}, 20);
+    }}
+}});
+render();
+</script>
+</body></html>"""
+
+
+def static_page(country_code, tiles, chains, sub_locations):
+    """A page with the tiles already rendered, as a saved page_source would be."""
+    tiles_html, _ = synthetic_country(country_code, tiles, chains, sub_locations)
+    return f'<!DOCTYPE html><html><body><div id="list">{tiles_html}</div></body></html>'
+
+
+class PhaseTimer:
+    """Collects wall time, WebDriver commands and peak memory per phase."""
+
+    def __init__(self):
+        self.results = []
+        self.webdriver_calls = 0
+
+    def count_webdriver_calls(self, driver):
+        original = driver.execute
+
+        @functools.wraps(original)
+        def counting_execute(*args, **kwargs):
+            self.webdriver_calls += 1
+            return original(*args, **kwargs)
+
+        driver.execute = counting_execute
+
+    def run(self, phase, func, *args, **kwargs):
+        calls_before = self.webdriver_calls
+        tracemalloc.start()
+        started = time.perf_counter()
+        error = None
+        result = None
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            error = str(e)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows = len(result) if isinstance(result, list) else None
+        self.results.append({
+            'phase': phase,
+            'seconds': round(elapsed, 4),
+            'webdriver_calls': self.webdriver_calls - calls_before,
+            'peak_mb': round(peak / 1024 / 1024, 2),
+            'rows': rows,
+            'error': error,
+        })
+        return result
+
+    def record(self, phase, seconds, error=None):
+        """Add a phase measured elsewhere, e.g. in a subprocess."""
+        self.results.append({
+            'phase': phase,
+            'seconds': round(seconds, 4),
+            'webdriver_calls': 0,
+            'peak_mb': None,
+            'rows': None,
+            'error': error,
+        })
+
+    def report(self):
+        print(f"\n{'phase':<40} {'seconds':>9} {'wd calls':>9} {'peak MB':>9} {'rows':>7}")
+        for r in self.results:
+            rows = '' if r['rows'] is None else r['rows']
+            peak = '' if r['peak_mb'] is None else f"{r['peak_mb']:.2f}"
+            line = f"{r['phase']:<40} {r['seconds']:>9.3f} {r['webdriver_calls']:>9} {peak:>9} {rows:>7}"
+            if r['error']:
+                line += f"  ERROR: {r['error']}"
+            print(line)
+
+
+def serve_directory(directory):
+    """Serve directory on an ephemeral localhost port; returns (server, base_url)."""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def bench_offline_parsing(timer, pages):
+    for label, page in pages:
+        timer.run(f'html parse [{label}]', extract_restaurants_from_html,
+                  page, location_div_tags, 'XX', 'Benchmark')
+
+
+def bench_browser(timer, directory, base_url, countries, modes, sub_location_modes, headless=True):
+    try:
+        driver = scrape_restaurants.setup_driver(headless=headless)
+    except Exception as e:
+        print(f"Skipping browser benchmarks: {e}")
+        return
+    timer.count_webdriver_calls(driver)
+    try:
+        timer.run('load synthetic page', driver.get, f'{base_url}/synthetic.html')
+        for mode in modes:
+            for sub_mode in sub_location_modes:
+                # Alternate countries so every run really switches
+                for code in countries:
+                    timer.run(f'scrape_restaurants [{mode}/{sub_mode}] {code}',
+                              scrape_restaurants.scrape_restaurants,
+                              driver, code, f'{code} Country', extraction=mode, sub_location_mode=sub_mode)
+        for snapshot in sorted(glob.glob(os.path.join(directory, 'snapshot_*.html'))):
+            name = os.path.basename(snapshot)
+            timer.run(f'load {name}', driver.get, f'{base_url}/{name}')
+            timer.run(f'selenium extract [{name}]',
+                      scrape_restaurants.extract_restaurants_with_selenium, driver, 'XX', 'Snapshot')
+            timer.run(f'js extract [{name}]',
+                      scrape_restaurants.extract_restaurants_with_script, driver, 'XX', 'Snapshot')
+    finally:
+        driver.quit()
+
+
+def bench_combine(timer, directory, files, rows):
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f'amex_restaurants_{i:02d}.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Name', 'Address', 'Cuisine', 'Status', 'Google_Maps_Link', 'CountryCode'])
+            for j in range(rows):
+                writer.writerow([f'R{i}-{j}', f'R{i}-{j}, {j} High Street, Town {i}, Country', CUISINES[j % 8], '',
+                                 f'https://www.google.com/maps/search/?api=1&query={j}', f'{i:02d}'])
+        paths.append(path)
+    output = os.path.join(directory, 'amex_restaurants_ALL.csv')
+    timer.run(f'combine_csv_files [{files}x{rows}]', combine_csv_files, paths, output, dedupe=False)
+    timer.run(f'combine_csv_files dedupe [{files}x{rows}]', combine_csv_files, paths, output, dedupe=True)
+
+
+STARTUP_COMMANDS = [
+    ('python (no imports)', ['-c', 'pass']),
+    ('selenium + pandas imports', ['-c', 'import selenium.webdriver, webdriver_manager.chrome, pandas']),
+    ('scrape --help', ['scrape_restaurants.py', '--help']),
+    ('combine', ['scrape_restaurants.py', 'combine']),
+    ('--combine', ['scrape_restaurants.py', '--combine']),
+    ('query', ['scrape_restaurants.py', 'query', '--near', '51.5,-0.1', '--limit', '1']),
+    ('report', ['scrape_restaurants.py', 'report']),
+]
+
+
+def bench_startup(timer, directory, repeats):
+    """Best-of-repeats wall time of each command in a fresh interpreter."""
+    workdir = os.path.join(directory, 'startup')
+    os.makedirs(workdir)
+    for code in ('AA', 'BB'):
+        with open(os.path.join(workdir, f'amex_restaurants_{code}.csv'), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Name', 'Address', 'Cuisine', 'Status', 'Google_Maps_Link', 'CountryCode'])
+            writer.writerow([f'R{code}', f'R{code}, 1 High Street, London', 'Italian', '',
+                             'https://www.google.com/maps/search/?api=1&query=51.5,-0.1', code])
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    for label, command in STARTUP_COMMANDS:
+        if command[0].endswith('.py'):
+            command = [os.path.join(here, command[0])] + command[1:]
+        best = None
+        error = None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            completed = subprocess.run([sys.executable] + command, cwd=workdir, capture_output=True, text=True)
+            elapsed = time.perf_counter() - started
+            if completed.returncode != 0:
+                error = (completed.stderr.strip().splitlines() or [f'exit code {completed.returncode}'])[-1]
+                break
+            best = elapsed if best is None else min(best, elapsed)
+        timer.record(f'startup [{label}]', best or 0.0, error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark extraction and combine hot paths offline')
+    parser.add_argument('--tiles', type=int, default=1000, help='Tiles per synthetic country. Default: 1000')
+    parser.add_argument('--chains', type=int, default=50, help='Multi-site chains per synthetic country. Default: 50')
+    parser.add_argument('--sub-locations', type=int, default=5, help='Sites per chain. Default: 5')
+    parser.add_argument('--countries', type=str, default='AA,BB', help='Synthetic country codes. Default: AA,BB')
+    parser.add_argument('--snapshot', action='append', default=[], help='Saved page_source*.html[.gz|.zst] to benchmark (repeatable)')
+    parser.add_argument('--modes', type=str, default='html,js,selenium', help='Extraction modes to time in the browser')
+    parser.add_argument('--sub-location-modes', type=str, default='modal,bulk', help='Sub-location modes to time in the browser')
+    parser.add_argument('--no-browser', action='store_true', help='Only run the offline phases')
+    parser.add_argument('--visible', action='store_true', help='Run the browser with a visible window')
+    parser.add_argument('--csv-files', type=int, default=50, help='Per-country CSVs for the combine benchmark. Default: 50')
+    parser.add_argument('--csv-rows', type=int, default=2000, help='Rows per CSV for the combine benchmark. Default: 2000')
+    parser.add_argument('--startup-repeats', type=int, default=5, help='Runs per command for the startup benchmark (best is kept), 0 to skip. Default: 5')
+    parser.add_argument('--output', type=str, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    scrape_restaurants.debug = False
+    countries = [c.strip().upper() for c in args.countries.split(',') if c.strip()]
+    timer = PhaseTimer()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pages = [(f'synthetic {args.tiles} tiles',
+                  static_page(countries[0], args.tiles, args.chains, args.sub_locations))]
+        for i, snapshot in enumerate(args.snapshot):
+            page = read_snapshot(snapshot)
+            pages.append((os.path.basename(snapshot), page))
+            with open(os.path.join(directory, f'snapshot_{i}.html'), 'w', encoding='utf-8') as f:
+                f.write(page)
+
+        bench_offline_parsing(timer, pages)
+
+        if not args.no_browser:
+            with open(os.path.join(directory, 'synthetic.html'), 'w', encoding='utf-8') as f:
+                f.write(synthetic_page(countries, args.tiles, args.chains, args.sub_locations))
+            server, base_url = serve_directory(directory)
+            try:
+                bench_browser(timer, directory, base_url, countries,
+                              [m.strip() for m in args.modes.split(',') if m.strip()],
+                              [m.strip() for m in args.sub_location_modes.split(',') if m.strip()],
+                              headless=not args.visible)
+            finally:
+                server.shutdown()
+
+        bench_combine(timer, directory, args.csv_files, args.csv_rows)
+
+        if args.startup_repeats > 0:
+            bench_startup(timer, directory, args.startup_repeats)
+
+    timer.report()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(timer.results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
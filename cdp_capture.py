@@ -0,0 +1,174 @@
+"""
+Build restaurant records from the JSON the page fetches, via Chrome's
+performance log and the DevTools protocol.
+
+The restaurant tiles are rendered client-side from an XHR/fetch payload.
+When the performance log is enabled we can read that payload directly after
+switch_country fires the change event, which skips scrolling, modal
+clicking and DOM parsing altogether.
+
+The payload's exact shape is not documented, so records are located
+heuristically: the largest list of objects that carry both a name-like and
+an address-like field wins. If nothing suitable is found the caller falls
+back to DOM extraction.
+"""
+
+import base64
+import json
+
+from restaurant_parsing import GOOGLE_MAPS_PATTERNS, format_restaurant_record
+
+
+NAME_KEYS = ['name', 'restaurantName', 'restaurant_name', 'merchantName', 'title']
+ADDRESS_KEYS = ['address', 'fullAddress', 'formattedAddress', 'addressLines', 'location']
+CUISINE_KEYS = ['cuisine', 'cuisineType', 'cuisines', 'category']
+NEW_KEYS = ['isNew', 'new', 'newRestaurant']
+ASTERISK_KEYS = ['asterisk', 'hasAsterisk', 'restricted', 'termsApply']
+SUB_LOCATION_KEYS = ['locations', 'subLocations', 'sites', 'venues', 'branches']
+
+JSON_RESOURCE_TYPES = {'XHR', 'Fetch'}
+
+
+def enable_performance_logging(chrome_options):
+    """Ask chromedriver to record network events in the performance log."""
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+
+def drain_performance_log(driver):
+    """Discard buffered performance log entries so the next capture only sees new traffic."""
+    try:
+        driver.get_log('performance')
+    except Exception as e:
+        print(f"Warning: Could not read performance log: {e}")
+
+
+def capture_json_responses(driver):
+    """Return the decoded JSON bodies of XHR/fetch responses since the last drain."""
+    payloads = []
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        print(f"Warning: Could not read performance log: {e}")
+        return payloads
+
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        if message.get('method') != 'Network.responseReceived':
+            continue
+        params = message.get('params', {})
+        response = params.get('response', {})
+        if params.get('type') not in JSON_RESOURCE_TYPES or 'json' not in response.get('mimeType', ''):
+            continue
+        try:
+            result = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': params['requestId']})
+            body = result.get('body', '')
+            if result.get('base64Encoded'):
+                body = base64.b64decode(body).decode('utf-8')
+            payloads.append((response.get('url', ''), json.loads(body)))
+        except Exception:
+            # Bodies of redirected or evicted responses are no longer available
+            continue
+    return payloads
+
+
+def _first(item, keys):
+    for key in keys:
+        if key in item and item[key] not in (None, ''):
+            return item[key]
+    return None
+
+
+def _looks_like_restaurant(item):
+    return isinstance(item, dict) and _first(item, NAME_KEYS) is not None and (
+        _first(item, ADDRESS_KEYS) is not None or _first(item, SUB_LOCATION_KEYS) is not None
+    )
+
+
+def find_restaurant_list(payload):
+    """Return the largest list of restaurant-like objects anywhere in payload."""
+    best = []
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            matches = [item for item in node if _looks_like_restaurant(item)]
+            if len(matches) > len(best):
+                best = matches
+            stack.extend(node)
+    return best
+
+
+def _as_text(value):
+    if isinstance(value, list):
+        return ', '.join(_as_text(v) for v in value if v not in (None, ''))
+    if isinstance(value, dict):
+        # Address objects: keep the order the API gives us, skip coordinates
+        return ', '.join(
+            _as_text(v) for k, v in value.items()
+            if v not in (None, '') and not isinstance(v, (int, float)) and k.lower() not in ('lat', 'lng', 'lon', 'latitude', 'longitude')
+        )
+    return str(value).strip()
+
+
+def _find_maps_link(item):
+    stack = [item]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, str) and any(x in node for x in GOOGLE_MAPS_PATTERNS):
+            return node.replace('&amp;', '&')
+    return ""
+
+
+def record_from_item(item):
+    """Map one API object to the Name/Address/Cuisine/Status/Google_Maps_Link dict."""
+    status = []
+    if _first(item, NEW_KEYS) is True:
+        status.append("NEW")
+    if _first(item, ASTERISK_KEYS) is True:
+        status.append("*")
+
+    cuisine = _first(item, CUISINE_KEYS)
+    address = _first(item, ADDRESS_KEYS)
+    return {
+        'Name': _as_text(_first(item, NAME_KEYS)),
+        'Address': _as_text(address) if address is not None else '',
+        'Cuisine': _as_text(cuisine) if cuisine is not None else '',
+        'Status': ', '.join(status),
+        'Google_Maps_Link': _find_maps_link(item),
+    }
+
+
+def records_from_payloads(payloads, country_code, country_name):
+    """Build restaurant records from captured payloads, expanding multi-site chains."""
+    best = []
+    for url, payload in payloads:
+        items = find_restaurant_list(payload)
+        if len(items) > len(best):
+            best = items
+            print(f"Using {len(items)} restaurants from {url}")
+
+    restaurants = []
+    for item in best:
+        sub_locations = _first(item, SUB_LOCATION_KEYS)
+        if isinstance(sub_locations, list) and sub_locations:
+            for sub_item in sub_locations:
+                if not isinstance(sub_item, dict):
+                    continue
+                # Sub-locations inherit the chain's fields they don't override
+                merged = {k: v for k, v in item.items() if k not in SUB_LOCATION_KEYS}
+                merged.update(sub_item)
+                restaurant_data = record_from_item(merged)
+                restaurants.append(format_restaurant_record(restaurant_data, country_code, country_name))
+        else:
+            restaurant_data = record_from_item(item)
+            restaurants.append(format_restaurant_record(restaurant_data, country_code, country_name))
+    return restaurants
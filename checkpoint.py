@@ -0,0 +1,92 @@
+"""
+Checkpoint manifest for multi-country runs.
+
+Records, per country, whether it finished, how many rows it produced, which
+files were written and how many attempts it took. The manifest is
+rewritten after every country, so an ALL run that crashes or is
+interrupted can be picked up again with --resume: finished countries
+(whose files are still there) are skipped, failed and unstarted ones are
+scraped. A run without --resume starts its countries afresh but keeps the
+entries of every other country.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+
+DEFAULT_MANIFEST = 'amex_restaurants_manifest.json'
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class Checkpoint:
+    """Thread-safe per-country progress manifest stored as JSON."""
+
+    def __init__(self, path=DEFAULT_MANIFEST, resume=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self.countries = {}
+        # Countries started by this run, which summary() reports on
+        self.run_countries = set()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.countries = json.load(f).get('countries', {})
+            if resume:
+                print(f"Resuming from {path}: {len(self.completed())} countries already done")
+        except FileNotFoundError:
+            if resume:
+                print(f"No checkpoint at {path}, starting a new run")
+        except ValueError as e:
+            print(f"Warning: Ignoring unreadable checkpoint {path}: {e}")
+        self.started_at = _now()
+        self._save()
+
+    def completed(self):
+        """Country codes that finished and whose output files still exist."""
+        with self._lock:
+            return {
+                code for code, entry in self.countries.items()
+                if entry.get('status') == 'done' and all(os.path.exists(f) for f in entry.get('files', []))
+            }
+
+    def mark_started(self, code):
+        # Replace the entry, so nothing from an earlier run is left behind
+        with self._lock:
+            self.run_countries.add(code)
+            self.countries[code] = {'status': 'running', 'started_at': _now()}
+            self._save_locked()
+
+    def mark_done(self, code, rows, files, attempts=1):
+        self._update(code, status='done', rows=rows, files=list(files), attempts=attempts,
+                     finished_at=_now(), error=None)
+
+    def mark_failed(self, code, error, attempts):
+        self._update(code, status='failed', attempts=attempts, finished_at=_now(), error=error)
+
+    def summary(self):
+        """Countries of this run that finished and that failed."""
+        with self._lock:
+            entries = [(c, e) for c, e in self.countries.items() if c in self.run_countries]
+            done = [c for c, e in entries if e.get('status') == 'done']
+            failed = [c for c, e in entries if e.get('status') == 'failed']
+        return done, failed
+
+    def _update(self, code, **fields):
+        with self._lock:
+            self.countries.setdefault(code, {}).update(fields)
+            self._save_locked()
+
+    def _save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        # Write then rename so a crash never leaves a half-written manifest
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'updated_at': _now(), 'started_at': self.started_at, 'countries': self.countries}, f, indent=2)
+        os.replace(tmp, self.path)
@@ -1,38 +1,170 @@
-import pandas as pd
+import csv
 import glob
+import json
+import os
 
-def combine_csv_files(file_paths, output_file):
+from records import identity_key
+
+
+def read_csv_header(file_path):
+    """Return the column names of a CSV file without reading its rows."""
+    with open(file_path, newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f), [])
+
+
+def align_columns(headers):
+    """
+    Union of the given column lists, in first-seen order.
+
+    Older files may lack columns such as CountryCode or Status; their rows
+    are written with those columns left empty.
+    """
+    columns = []
+    seen = set()
+    for header in headers:
+        for column in header:
+            if column not in seen:
+                seen.add(column)
+                columns.append(column)
+    return columns
+
+
+def combine_csv_files(file_paths, output_file, dedupe=True, file_codes=None):
     """
     Combine multiple CSV files into a single CSV file.
     
+    Rows are streamed from each input straight to the output, so memory use
+    doesn't grow with the number or size of the files.
+
     Args:
         file_paths (list): List of file paths to the CSV files.
         output_file (str): Path to the output CSV file.
+        dedupe (bool): Skip rows whose normalised name, address and maps
+                       link match a row already written (first one wins).
+                       Only a 16-byte digest per row is kept.
+        file_codes (dict, optional): File path -> country code, used to fill
+                       CountryCode for older files without that column.
+
+    Returns:
+        bool: True if every file was read completely, False if any file
+              could not be read (the output then holds the others).
     """
     if not file_paths:
         print("No file paths provided for combination.")
-        return
+        return False
 
+    complete = True
     try:
-        combined_df = pd.DataFrame()
-        
+        headers = {}
         for file in file_paths:
             try:
-                df = pd.read_csv(file)
-                combined_df = pd.concat([combined_df, df], ignore_index=True)
-                print(f"Loaded {len(df)} rows from {file}")
+                headers[file] = read_csv_header(file)
             except Exception as e:
                 print(f"Error reading {file}: {e}")
-        
-        combined_df.to_csv(output_file, index=False, encoding='utf-8')
+                complete = False
+        columns = align_columns(headers.values())
+        file_codes = file_codes or {}
+        if file_codes and 'CountryCode' not in columns:
+            columns.append('CountryCode')
+
+        total_rows = 0
+        duplicates = 0
+        seen = set()
+        with open(output_file, 'w', newline='', encoding='utf-8') as out:
+            writer = csv.DictWriter(out, fieldnames=columns, restval='', extrasaction='ignore')
+            writer.writeheader()
+
+            for file in headers:
+                rows = 0
+                # Older files lack CountryCode; take it from the file name
+                country_code = file_codes.get(file) if 'CountryCode' not in headers[file] else None
+                try:
+                    with open(file, newline='', encoding='utf-8-sig') as f:
+                        for row in csv.DictReader(f):
+                            if country_code:
+                                row['CountryCode'] = country_code
+                            if dedupe:
+                                digest = identity_key(row)
+                                if digest in seen:
+                                    duplicates += 1
+                                    continue
+                                seen.add(digest)
+                            writer.writerow(row)
+                            rows += 1
+                    print(f"Loaded {rows} rows from {file}")
+                except Exception as e:
+                    print(f"Error reading {file}: {e}")
+                    complete = False
+                total_rows += rows
+
         print(f"\nSuccessfully combined {len(file_paths)} files into {output_file}")
-        print(f"Total rows: {len(combined_df)}")
+        print(f"Total rows: {total_rows}")
+        if dedupe:
+            print(f"Duplicate rows skipped: {duplicates}")
+        return complete
         
     except Exception as e:
         print(f"Error combining CSV files: {e}")
+        return False
+
+
+def _sources_signature(file_paths, dedupe):
+    return {'dedupe': dedupe, 'files': {f: [os.path.getsize(f), os.path.getmtime(f)] for f in file_paths}}
+
+
+def combine_if_changed(file_paths, output_file, dedupe=True, file_codes=None):
+    """
+    Combine file_paths into output_file unless it was already built from
+    exactly these files (same sizes and modification times).
+
+    The inputs are recorded next to the output in '<output_file>.sources.json',
+    so repeated combines while new country files arrive only rewrite the
+    output when something changed. The record is only written after a
+    combine that read every file, so failed files are retried next time.
+    Returns True if the output was rewritten.
+    """
+    signature_file = f'{output_file}.sources.json'
+    signature = _sources_signature(file_paths, dedupe)
+    try:
+        with open(signature_file, encoding='utf-8') as f:
+            if os.path.exists(output_file) and json.load(f) == signature:
+                print(f"{output_file} is up to date")
+                return False
+    except (OSError, ValueError):
+        pass
+    if not combine_csv_files(file_paths, output_file, dedupe=dedupe, file_codes=file_codes):
+        # Don't let a partial combine look up to date
+        if os.path.exists(signature_file):
+            os.remove(signature_file)
+        return True
+    tmp = f'{signature_file}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(signature, f)
+    os.replace(tmp, signature_file)
+    return True
+
+
+def find_country_files(country_codes=None, extension='csv'):
+    """
+    Find per-country output files.
+
+    Returns a dict of country code -> 'amex_restaurants_{code}.{extension}'.
+    """
+    files = {}
+    if country_codes:
+        for code in country_codes:
+            f = f'amex_restaurants_{code}.{extension}'
+            if glob.glob(f):
+                files[code] = f
+    else:
+        # Find all files matching the pattern amex_restaurants_??.{extension}
+        for f in sorted(glob.glob(f'amex_restaurants_??.{extension}')):
+            code = f[len('amex_restaurants_'):-len(extension) - 1]
+            files[code] = f
+    return files
 
 
-def combine_amex_restaurants(country_codes=None, output_suffix='ALL'):
+def combine_amex_restaurants(country_codes=None, output_suffix='ALL', dedupe=True, output_format='csv'):
     """
     Combine Amex restaurant CSV files.
     
@@ -41,31 +173,41 @@ def combine_amex_restaurants(country_codes=None, output_suffix='ALL'):
                                         If None, combines all matching 'amex_restaurants_??.csv'.
         output_suffix (str): Suffix for the output file. Default is 'ALL'.
                              Output file will be 'amex_restaurants_{output_suffix}.csv'.
+        dedupe (bool): Drop rows for the same restaurant (see records.identity_key).
+        output_format (str): 'csv', 'parquet' or 'both'. Parquet output is a
+                             country-partitioned dataset in
+                             'amex_restaurants_{output_suffix}_parquet/'.
     """
     if country_codes:
-        print(f"Combining CSV files for countries: {', '.join(country_codes)}")
-        files = []
-        for code in country_codes:
-            f = f'amex_restaurants_{code}.csv'
-            # We could check if file exists here, or let combine_csv_files handle/skip it.
-            # glob might be better to verify existence, but let's just construct the list
-            # and verify existence before passing to combine_csv_files if strictness is needed.
-            # However, glob.glob with specific names works too.
-            matches = glob.glob(f)
-            if matches:
-                files.extend(matches)
-            else:
-                print(f"Warning: File for {code} not found ({f})")
+        print(f"Combining files for countries: {', '.join(country_codes)}")
     else:
-        print("Combining all country CSV files...")
-        # Find all files matching the pattern amex_restaurants_??.csv
-        files = glob.glob('amex_restaurants_??.csv')
-    
-    output_file = f'amex_restaurants_{output_suffix}.csv'
-    
-    if not files:
-        print("No country CSV files found to combine.")
-        return
+        print("Combining all country files...")
+
+    csv_files = find_country_files(country_codes, 'csv')
+
+    if output_format in ('csv', 'both'):
+        if country_codes:
+            for code in country_codes:
+                if code not in csv_files:
+                    print(f"Warning: File for {code} not found (amex_restaurants_{code}.csv)")
+
+        files = list(csv_files.values())
+        output_file = f'amex_restaurants_{output_suffix}.csv'
+
+        if not files:
+            print("No country CSV files found to combine.")
+        else:
+            print(f"Found {len(files)} files to combine: {files}")
+            combine_if_changed(files, output_file, dedupe=dedupe,
+                               file_codes={f: code for code, f in csv_files.items()})
+
+    if output_format in ('parquet', 'both'):
+        from parquet_utils import combine_to_parquet_dataset
 
-    print(f"Found {len(files)} files to combine: {files}")
-    combine_csv_files(files, output_file)
+        # Prefer Parquet sources (copied without reparsing), fall back to CSV
+        sources = dict(csv_files)
+        sources.update(find_country_files(country_codes, 'parquet'))
+        if not sources:
+            print("No country files found to combine.")
+            return
+        combine_to_parquet_dataset(sources, output_suffix=output_suffix)
@@ -0,0 +1,433 @@
+"""
+Distributed scraping: a coordinator splits countries into shards, workers
+on any number of hosts pull shards from a shared SQLite job table and
+publish their country files to a shared output directory.
+
+The job table and output directory just need to be reachable by every
+worker (e.g. a network share). Shards are leased: a worker that dies
+without finishing loses its lease after --lease seconds and the shard is
+picked up by another worker. Countries that fail are requeued as a new
+shard until --max-attempts is reached. Files are written in a private
+working directory and moved into the output directory once complete, so
+combine never sees a half-written file.
+
+Usage (one machine, three local worker processes):
+    python distributed.py coordinator --jobs-db jobs.sqlite --output-dir out --shard-size 3 --local-workers 3 --combine
+    python distributed.py worker --jobs-db jobs.sqlite --output-dir out      # on each further host
+    python distributed.py status --jobs-db jobs.sqlite
+"""
+
+import argparse
+import json
+import os
+import secrets
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    countries TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    results TEXT,
+    error TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shards_status ON shards (status);
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class JobTable:
+    """Shard queue stored in a SQLite file shared by the coordinator and workers."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        # Autocommit mode; claims use explicit BEGIN IMMEDIATE transactions
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create_run(self, countries, shard_size, options, attempts=0):
+        """Split countries ({code: name}) into shards of shard_size. Returns the run id."""
+        # The random suffix keeps runs created in the same second apart
+        run_id = f"{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+        codes = list(countries)
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for start in range(0, len(codes), max(1, shard_size)):
+                shard = {code: countries[code] for code in codes[start:start + shard_size]}
+                conn.execute(
+                    "INSERT INTO shards (run_id, countries, options, status, attempts, updated_at) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (run_id, json.dumps(shard), json.dumps(options), attempts, _now()),
+                )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return run_id
+
+    def claim(self, worker, lease_seconds):
+        """Lease the next queued (or abandoned) shard to worker. Returns the shard row or None."""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT * FROM shards WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1", (time.time(),)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            if row['status'] == 'running':
+                print(f"Reclaiming shard {row['id']} abandoned by {row['worker']}")
+            conn.execute(
+                "UPDATE shards SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                (worker, time.time() + lease_seconds, _now(), row['id']),
+            )
+            conn.execute('COMMIT')
+            return dict(row, attempts=row['attempts'] + 1, countries=json.loads(row['countries']),
+                        options=json.loads(row['options']))
+        finally:
+            conn.close()
+
+    def heartbeat(self, shard_id, worker, lease_seconds):
+        """Extend the lease while the worker makes progress."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE shards SET lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ?",
+                (time.time() + lease_seconds, _now(), shard_id, worker),
+            )
+        finally:
+            conn.close()
+
+    def finish(self, shard, results, max_attempts):
+        """
+        Record a shard's per-country results.
+
+        Countries that failed are requeued as a new shard of the same run
+        while the shard has attempts left.
+        """
+        failed = {code: shard['countries'][code] for code, result in results.items() if result.get('rows') is None}
+        retry = failed and shard['attempts'] < max_attempts
+        status = 'done' if not failed else ('retried' if retry else 'failed')
+        error = f"Failed: {', '.join(failed)}" if failed else None
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                "UPDATE shards SET status = ?, results = ?, error = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ?",
+                (status, json.dumps(results), error, _now(), shard['id']),
+            )
+            if retry:
+                conn.execute(
+                    "INSERT INTO shards (run_id, countries, options, status, attempts, updated_at) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (shard['run_id'], json.dumps(failed), json.dumps(shard['options']), shard['attempts'], _now()),
+                )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return status
+
+    def pending(self, run_id=None):
+        """Number of shards still queued or running."""
+        conn = self._connect()
+        try:
+            query = "SELECT COUNT(*) FROM shards WHERE status IN ('queued', 'running')"
+            args = ()
+            if run_id:
+                query += " AND run_id = ?"
+                args = (run_id,)
+            return conn.execute(query, args).fetchone()[0]
+        finally:
+            conn.close()
+
+    def latest_run(self):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT run_id FROM shards ORDER BY id DESC LIMIT 1").fetchone()
+            return row['run_id'] if row else None
+        finally:
+            conn.close()
+
+    def shards(self, run_id):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT * FROM shards WHERE run_id = ? ORDER BY id", (run_id,)).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def country_results(self, run_id):
+        """Latest result per country for a run: {code: {'rows', 'files' or 'error'}}."""
+        results = {}
+        for shard in self.shards(run_id):
+            for code, result in json.loads(shard['results'] or '{}').items():
+                if result.get('rows') is not None or code not in results:
+                    results[code] = result
+        return results
+
+
+def publish(filenames, output_dir):
+    """Move finished files into the shared output directory without exposing partial files."""
+    published = []
+    for filename in filenames:
+        if not os.path.exists(filename):
+            continue
+        target = os.path.join(output_dir, os.path.basename(filename))
+        tmp = f'{target}.{socket.gethostname()}.{os.getpid()}.tmp'
+        shutil.copyfile(filename, tmp)
+        os.replace(tmp, target)
+        os.remove(filename)
+        published.append(target)
+    return published
+
+
+def run_worker(jobs_db, output_dir, worker=None, lease_seconds=1800, max_attempts=3, poll_seconds=5.0,
+               headless=True, lean=False, retries=1, backoff=5.0, exit_when_idle=True):
+    """
+    Pull shards from the job table until none are left (or forever with
+    exit_when_idle=False). One browser session is kept warm across shards.
+    """
+    # Imported here so the coordinator and status commands don't need Selenium
+    import scrape_restaurants
+    from page_snapshots import snapshotter
+
+    worker = worker or f'{socket.gethostname()}-{os.getpid()}'
+    # Resolve paths before switching to the scratch directory below
+    table = JobTable(os.path.abspath(jobs_db))
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    # Country files are written to the working directory; keep partial ones
+    # out of output_dir. Page snapshots go straight to output_dir so they
+    # outlive the scratch directory.
+    previous = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='amex-worker-')
+    os.chdir(workdir)
+    snapshotter.directory = output_dir
+    print(f"[{worker}] Working in {workdir}, publishing to {output_dir}")
+
+    driver = None
+    try:
+        while True:
+            shard = table.claim(worker, lease_seconds)
+            if shard is None:
+                if exit_when_idle and table.pending() == 0:
+                    print(f"[{worker}] No shards left")
+                    return
+                time.sleep(poll_seconds)
+                continue
+
+            options = shard['options']
+            print(f"[{worker}] Shard {shard['id']} (attempt {shard['attempts']}): {', '.join(shard['countries'])}")
+
+            def restart():
+                return scrape_restaurants.load_website(
+                    headless=headless, capture_network=(options.get('extraction') == 'cdp'), lean=lean
+                )
+
+            results = {}
+            for code, country_name in shard['countries'].items():
+                driver, restaurants = scrape_restaurants.scrape_country_with_retries(
+                    driver, code, country_name, restart, retries=retries, backoff=backoff, **options
+                )
+                if restaurants is None:
+                    results[code] = {'rows': None, 'error': f'Scrape of {code} failed'}
+                else:
+                    files = scrape_restaurants.output_filenames(code, options.get('output_format', 'csv'))
+                    results[code] = {'rows': len(restaurants), 'files': publish(files, output_dir)}
+                table.heartbeat(shard['id'], worker, lease_seconds)
+
+            status = table.finish(shard, results, max_attempts)
+            print(f"[{worker}] Shard {shard['id']} {status}")
+    finally:
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        snapshotter.flush()
+        os.chdir(previous)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def list_countries(headless=True):
+    """Load the site once to read the available countries."""
+    import scrape_restaurants
+
+    driver = scrape_restaurants.load_website(headless=headless)
+    try:
+        return scrape_restaurants.get_available_countries(driver)
+    finally:
+        driver.quit()
+
+
+def combine_output(output_dir, output_suffix='ALL', output_format='csv'):
+    """Merge the published country files in output_dir."""
+    from csv_utils import combine_amex_restaurants
+
+    previous = os.getcwd()
+    os.chdir(output_dir)
+    try:
+        combine_amex_restaurants(output_suffix=output_suffix, output_format=output_format)
+    finally:
+        os.chdir(previous)
+
+
+def print_status(table, run_id=None):
+    run_id = run_id or table.latest_run()
+    if run_id is None:
+        print("No runs in the job table.")
+        return
+    counts = {}
+    for shard in table.shards(run_id):
+        counts[shard['status']] = counts.get(shard['status'], 0) + 1
+    results = table.country_results(run_id)
+    done = sorted(code for code, result in results.items() if result.get('rows') is not None)
+    failed = sorted(code for code, result in results.items() if result.get('rows') is None)
+    print(f"Run {run_id}: shards {', '.join(f'{k}={v}' for k, v in sorted(counts.items()))}")
+    print(f"  countries done: {len(done)} ({sum(results[c]['rows'] for c in done)} rows)")
+    if failed:
+        print(f"  countries failed: {', '.join(failed)}")
+
+
+def worker_arguments(args):
+    """Command line for a local worker process with the same settings."""
+    command = [
+        sys.executable, os.path.abspath(__file__), 'worker',
+        '--jobs-db', os.path.abspath(args.jobs_db), '--output-dir', os.path.abspath(args.output_dir),
+        '--lease', str(args.lease), '--max-attempts', str(args.max_attempts),
+        '--retries', str(args.retries), '--retry-backoff', str(args.retry_backoff),
+    ]
+    if args.visible:
+        command.append('--visible')
+    if args.lean:
+        command.append('--lean')
+    return command
+
+
+def run_coordinator(args):
+    table = JobTable(args.jobs_db)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    countries = list_countries(headless=not args.visible)
+    target = args.country.upper()
+    if target != 'ALL':
+        wanted = [c.strip() for c in target.split(',') if c.strip()]
+        for missing in set(wanted) - set(countries):
+            print(f"Error: Country '{missing}' not found in available countries.")
+        countries = {code: countries[code] for code in wanted if code in countries}
+    if not countries:
+        print("No countries to scrape.")
+        return
+
+    options = {'extraction': args.extraction, 'sub_location_mode': args.sub_locations, 'output_format': args.format}
+    run_id = table.create_run(countries, args.shard_size, options)
+    print(f"Run {run_id}: queued {len(countries)} countries in shards of {args.shard_size}")
+
+    processes = [subprocess.Popen(worker_arguments(args)) for _ in range(args.local_workers)]
+    if args.local_workers:
+        print(f"Started {args.local_workers} local worker processes")
+    if not (args.wait or processes):
+        return
+
+    # Combine as shards finish so the merged output is usable before the run ends
+    combined = set()
+    try:
+        while True:
+            finished = {s['id'] for s in table.shards(run_id) if s['status'] not in ('queued', 'running')}
+            if args.combine and finished - combined:
+                combine_output(args.output_dir, args.combine_suffix, args.format)
+                combined = finished
+            if table.pending(run_id) == 0:
+                break
+            if processes and all(p.poll() is not None for p in processes) and not args.wait:
+                print("All local workers exited with shards still pending")
+                break
+            time.sleep(args.poll)
+    finally:
+        for process in processes:
+            process.wait()
+    print_status(table, run_id)
+
+
+def main():
+    from scrape_restaurants import EXTRACTION_MODES, OUTPUT_FORMATS, SUB_LOCATION_MODES
+
+    parser = argparse.ArgumentParser(description='Distributed AMEX Dining Benefits scraping with a shared SQLite job table')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def common(sub):
+        sub.add_argument('--jobs-db', type=str, required=True, help='Shared SQLite job table')
+        sub.add_argument('--output-dir', type=str, default='.', help='Shared directory for country files. Default: .')
+
+    def browser(sub):
+        sub.add_argument('--lease', type=float, default=1800, help='Seconds a claimed shard stays leased without progress. Default: 1800')
+        sub.add_argument('--max-attempts', type=int, default=3, help='Attempts per country across workers. Default: 3')
+        sub.add_argument('--retries', type=int, default=1, help='In-worker retries per country with a fresh browser. Default: 1')
+        sub.add_argument('--retry-backoff', type=float, default=5.0, help='Seconds before the first in-worker retry. Default: 5')
+        sub.add_argument('--visible', action='store_true', help='Run with visible browser windows')
+        sub.add_argument('--lean', action='store_true', help='Lightweight browser profile')
+
+    coordinator = subparsers.add_parser('coordinator', help='Queue a run and optionally start local workers')
+    common(coordinator)
+    browser(coordinator)
+    coordinator.add_argument('--country', type=str, default='ALL', help='Comma-separated country codes or "ALL". Default: ALL')
+    coordinator.add_argument('--shard-size', type=int, default=3, help='Countries per shard. Default: 3')
+    coordinator.add_argument('--extraction', choices=EXTRACTION_MODES, default='html', help='Extraction mode. Default: html')
+    coordinator.add_argument('--sub-locations', choices=SUB_LOCATION_MODES, default='modal', help='Sub-location mode. Default: modal')
+    coordinator.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help='Output format. Default: csv')
+    coordinator.add_argument('--local-workers', type=int, default=0, help='Worker processes to start on this machine. Default: 0')
+    coordinator.add_argument('--wait', action='store_true', help='Wait until every shard has finished')
+    coordinator.add_argument('--combine', action='store_true', help='Combine the output directory as shards finish')
+    coordinator.add_argument('--combine-suffix', type=str, default='ALL', help='Suffix for the combined file. Default: ALL')
+    coordinator.add_argument('--poll', type=float, default=5.0, help='Seconds between job table checks. Default: 5')
+
+    worker = subparsers.add_parser('worker', help='Scrape shards from the job table')
+    common(worker)
+    browser(worker)
+    worker.add_argument('--forever', action='store_true', help='Keep polling for new runs instead of exiting when idle')
+    worker.add_argument('--poll', type=float, default=5.0, help='Seconds between job table checks when idle. Default: 5')
+
+    status = subparsers.add_parser('status', help='Show the progress of a run')
+    common(status)
+    status.add_argument('--run', type=str, help='Run id. Default: the latest run')
+
+    args = parser.parse_args()
+    if args.command == 'coordinator':
+        run_coordinator(args)
+    elif args.command == 'worker':
+        run_worker(args.jobs_db, args.output_dir, lease_seconds=args.lease, max_attempts=args.max_attempts,
+                   poll_seconds=args.poll, headless=not args.visible, lean=args.lean, retries=args.retries,
+                   backoff=args.retry_backoff, exit_when_idle=not args.forever)
+    else:
+        print_status(JobTable(args.jobs_db), args.run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Enrichment stage: coordinates, place IDs and split addresses for scraped rows.
+
+Adds Street, City, Postcode, Latitude, Longitude, Place_ID and Geo_Source
+columns to restaurant records. Coordinates and place IDs are parsed out of
+Google_Maps_Link where the link carries them; otherwise an optional
+resolver (a local CSV stand-in, or Nominatim) is asked. Results are
+memoised in a SQLite cache keyed by the normalised address, so only new or
+changed restaurants are processed on later runs.
+
+Usage:
+    python enrichment.py --country GB,FR
+    python enrichment.py --country ALL --resolver local --resolver-file places.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+import run_cache
+from snapshot_store import normalize_text
+
+
+ENRICHED_COLUMNS = ['Street', 'City', 'Postcode', 'Latitude', 'Longitude', 'Place_ID', 'Geo_Source']
+
+RESOLVERS = ['none', 'local', 'nominatim']
+
+# Bump when the parsing below changes so cached results are recomputed
+ENRICHMENT_VERSION = 1
+
+# Cache file, set from --enrich-cache (defaults to the run cache directory)
+CACHE_PATH = None
+
+# Callable used when a maps link carries no coordinates, set from --resolver
+RESOLVER = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS enrichment (
+    address_key TEXT PRIMARY KEY,
+    maps_link TEXT,
+    version INTEGER NOT NULL,
+    fields TEXT NOT NULL,
+    enriched_at TEXT NOT NULL
+);
+"""
+
+# Postcode formats for countries where a bare number would be ambiguous;
+# anything else falls back to DEFAULT_POSTCODE_PATTERN
+POSTCODE_PATTERNS = {
+    'GB': r'\b[A-Z]{1,2}\d[A-Z\d]?\s*\d[A-Z]{2}\b',
+    'IE': r'\b[AC-FHKNPRTV-Y]\d{2}\s?[AC-FHKNPRTV-Y\d]{4}\b',
+    'US': r'\b\d{5}(?:-\d{4})?\b',
+    'CA': r'\b[A-Z]\d[A-Z]\s?\d[A-Z]\d\b',
+    'NL': r'\b\d{4}\s?[A-Z]{2}\b',
+    'SE': r'\b\d{3}\s?\d{2}\b',
+    'JP': r'\b\d{3}-\d{4}\b',
+    'PT': r'\b\d{4}-\d{3}\b',
+    'PL': r'\b\d{2}-\d{3}\b',
+}
+DEFAULT_POSTCODE_PATTERN = r'\b\d{4,6}\b'
+
+_COORDINATES = r'(-?\d{1,3}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)'
+_COORDINATE_PARAMS = ['query', 'q', 'll', 'center', 'destination', 'daddr', 'sll']
+
+
+def _valid_coordinates(lat, lon):
+    lat, lon = float(lat), float(lon)
+    if -90 <= lat <= 90 and -180 <= lon <= 180 and (lat, lon) != (0.0, 0.0):
+        return lat, lon
+    return None
+
+
+def parse_maps_link(link):
+    """
+    Pull coordinates and a place ID out of a Google Maps link.
+
+    Returns a dict with Latitude, Longitude and Place_ID (None when the link
+    doesn't carry them, e.g. maps.app.goo.gl short links).
+    """
+    result = {'Latitude': None, 'Longitude': None, 'Place_ID': None}
+    if not link:
+        return result
+    parsed = urllib.parse.urlparse(link.replace('&amp;', '&'))
+    params = urllib.parse.parse_qs(parsed.query)
+    path = urllib.parse.unquote(parsed.path)
+
+    coordinates = None
+    # Marker position in /maps/place/...!3d<lat>!4d<lon>, preferred over the viewport
+    match = re.search(r'!3d(-?\d+(?:\.\d+)?)!4d(-?\d+(?:\.\d+)?)', path)
+    if match:
+        coordinates = _valid_coordinates(*match.groups())
+    if coordinates is None:
+        for name in _COORDINATE_PARAMS:
+            for value in params.get(name, []):
+                match = re.fullmatch(_COORDINATES, value.strip())
+                if match:
+                    coordinates = _valid_coordinates(*match.groups())
+                    break
+            if coordinates:
+                break
+    if coordinates is None:
+        # Viewport centre in /maps/.../@<lat>,<lon>,<zoom>z
+        match = re.search(r'@' + _COORDINATES, path)
+        if match:
+            coordinates = _valid_coordinates(*match.groups())
+    if coordinates:
+        result['Latitude'], result['Longitude'] = coordinates
+
+    for name in ('query_place_id', 'place_id', 'destination_place_id'):
+        if params.get(name):
+            result['Place_ID'] = params[name][0]
+            break
+    else:
+        for value in params.get('q', []) + params.get('query', []):
+            match = re.match(r'place_id:(\S+)', value)
+            if match:
+                result['Place_ID'] = match.group(1)
+                break
+        else:
+            if params.get('cid'):
+                result['Place_ID'] = f"cid:{params['cid'][0]}"
+    return result
+
+
+def split_address(address, name='', country_code=''):
+    """
+    Split a scraped address into street, city and postcode.
+
+    Scraped addresses look like "<Name>, <street lines>, <city/postcode>,
+    <Country>"; the name prefix and country suffix are dropped first. The
+    postcode is looked for in the last three parts, and the city is the
+    text next to it (or the last part when there is no postcode).
+    """
+    parts = [p.strip() for p in (address or '').split(',') if p.strip()]
+    if name and address.startswith(f"{name}, "):
+        # Formatted by format_restaurant_record: drop the name and the country
+        name_parts = len([p for p in name.split(',') if p.strip()])
+        parts = parts[name_parts:-1] if len(parts) > name_parts + 1 else parts[name_parts:]
+
+    street, city, postcode = '', '', ''
+    pattern = POSTCODE_PATTERNS.get((country_code or '').upper(), DEFAULT_POSTCODE_PATTERN)
+    city_index = None
+    for index in range(len(parts) - 1, max(len(parts) - 4, -1), -1):
+        # Skip the first part when there are several: a leading number is a house number
+        if index == 0 and len(parts) > 1:
+            break
+        match = re.search(pattern, parts[index].upper())
+        if not match:
+            continue
+        postcode = parts[index][match.start():match.end()].strip()
+        rest = (parts[index][:match.start()] + parts[index][match.end():]).strip(' -')
+        if len(rest) <= 3 and rest.isalpha() and rest.isupper():
+            # A state/province code ("IL 62701"), the city is the part before
+            rest = ''
+        if rest:
+            city, city_index = rest, index
+        elif index > 0:
+            city, city_index = parts[index - 1], index - 1
+        else:
+            city_index = index
+        parts = parts[:index] + parts[index + 1:] if not rest else parts
+        break
+    if not postcode and len(parts) > 1:
+        city, city_index = parts[-1], len(parts) - 1
+
+    if city_index is not None:
+        street = ', '.join(parts[:city_index])
+    else:
+        street = ', '.join(parts)
+    return {'Street': street, 'City': city, 'Postcode': postcode}
+
+
+class LocalResolver:
+    """
+    Offline stand-in for a geocoder, backed by a CSV file.
+
+    The file needs Address, Latitude and Longitude columns (Place_ID is
+    optional). Lookups match on the normalised address, then on postcode.
+    """
+
+    name = 'local'
+
+    def __init__(self, path):
+        self.by_address = {}
+        self.by_postcode = {}
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                entry = {
+                    'Latitude': float(row['Latitude']),
+                    'Longitude': float(row['Longitude']),
+                    'Place_ID': row.get('Place_ID') or None,
+                }
+                self.by_address[normalize_text(row.get('Address', ''))] = entry
+                if row.get('Postcode'):
+                    self.by_postcode[normalize_text(row['Postcode'])] = entry
+
+    def __call__(self, query):
+        entry = self.by_address.get(normalize_text(query['address']))
+        if entry is None and query.get('postcode'):
+            entry = self.by_postcode.get(normalize_text(query['postcode']))
+        return entry
+
+
+class NominatimResolver:
+    """Geocode through OpenStreetMap Nominatim, at most one request per second."""
+
+    name = 'nominatim'
+    URL = 'https://nominatim.openstreetmap.org/search'
+
+    def __init__(self, user_agent='amex-dining-scraper', min_interval=1.0):
+        self.user_agent = user_agent
+        self.min_interval = min_interval
+        self._last_request = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, query):
+        import urllib.request
+
+        text = ', '.join(p for p in (query['street'], query['city'], query['postcode'], query['country_code']) if p)
+        url = f"{self.URL}?{urllib.parse.urlencode({'q': text or query['address'], 'format': 'json', 'limit': 1})}"
+        with self._lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request = time.monotonic()
+        request = urllib.request.Request(url, headers={'User-Agent': self.user_agent})
+        with urllib.request.urlopen(request, timeout=15) as response:
+            results = json.load(response)
+        if not results:
+            return None
+        return {
+            'Latitude': float(results[0]['lat']),
+            'Longitude': float(results[0]['lon']),
+            'Place_ID': f"osm:{results[0].get('osm_type', '')}/{results[0].get('osm_id', '')}",
+        }
+
+
+def make_resolver(kind, path=None):
+    """Build a resolver for --resolver; 'none' returns None."""
+    if kind == 'local':
+        if not path:
+            raise ValueError("The local resolver needs --resolver-file")
+        return LocalResolver(path)
+    if kind == 'nominatim':
+        return NominatimResolver()
+    return None
+
+
+def configure(cache_path=None, resolver=None):
+    global CACHE_PATH, RESOLVER
+    if cache_path is not None:
+        CACHE_PATH = cache_path
+    if resolver is not None:
+        RESOLVER = resolver
+
+
+def connect(cache_path=None):
+    """Open (and create if needed) the enrichment cache."""
+    cache_path = cache_path or CACHE_PATH or os.path.join(run_cache.CACHE_DIR, 'enrichment.sqlite')
+    directory = os.path.dirname(cache_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def enrich_record(restaurant, resolver=None):
+    """Compute the enriched fields for one restaurant (no caching)."""
+    country_code = restaurant.get('CountryCode', '')
+    fields = split_address(restaurant.get('Address', ''), restaurant.get('Name', ''), country_code)
+    fields.update(parse_maps_link(restaurant.get('Google_Maps_Link', '')))
+    fields['Geo_Source'] = 'maps_link' if fields['Latitude'] is not None else ''
+
+    if fields['Latitude'] is None and resolver is not None:
+        query = {
+            'address': restaurant.get('Address', ''),
+            'street': fields['Street'],
+            'city': fields['City'],
+            'postcode': fields['Postcode'],
+            'country_code': country_code,
+            'maps_link': restaurant.get('Google_Maps_Link', ''),
+        }
+        try:
+            resolved = resolver(query)
+            # Remember who answered "not found", so the miss isn't sent again
+            fields['Tried_Resolver'] = getattr(resolver, 'name', 'resolver')
+        except Exception as e:
+            # Errors (e.g. offline) are not cached as misses
+            print(f"Could not resolve '{query['address']}': {e}")
+            resolved = None
+        if resolved:
+            fields['Latitude'] = resolved['Latitude']
+            fields['Longitude'] = resolved['Longitude']
+            fields['Place_ID'] = fields['Place_ID'] or resolved.get('Place_ID')
+            fields['Geo_Source'] = getattr(resolver, 'name', 'resolver')
+    return fields
+
+
+def _is_usable(cached, link, resolver):
+    if cached is None:
+        return False
+    cached_link, version, fields = cached
+    if version != ENRICHMENT_VERSION or cached_link != link:
+        return False
+    # Entries without coordinates are retried when a resolver that hasn't
+    # tried them yet is available; known misses stay cached
+    if fields['Latitude'] is not None or resolver is None:
+        return True
+    return fields.get('Tried_Resolver') == getattr(resolver, 'name', 'resolver')
+
+
+def enrich_restaurants(restaurants, cache_path=None, resolver=None):
+    """
+    Add the enriched columns to every restaurant record, in place.
+
+    Only restaurants whose normalised address is new, or whose maps link
+    changed since they were cached, are parsed or sent to the resolver.
+    Addresses a resolver could not find are only sent again to a different
+    kind of resolver (or after the link or ENRICHMENT_VERSION changes).
+    Returns the same list.
+    """
+    resolver = RESOLVER if resolver is None else resolver
+    conn = connect(cache_path)
+    hits = computed = 0
+    try:
+        keys = [normalize_text(r.get('Address', '')) or normalize_text(r.get('Name', '')) for r in restaurants]
+        cached = {}
+        unique_keys = list(set(keys))
+        # Look the keys up in batches below SQLite's variable limit
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT address_key, maps_link, version, fields FROM enrichment "
+                f"WHERE address_key IN ({','.join('?' * len(batch))})", batch
+            )
+            for key, link, version, fields in rows:
+                cached[key] = (link, version, json.loads(fields))
+
+        now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        for key, restaurant in zip(keys, restaurants):
+            link = restaurant.get('Google_Maps_Link', '') or ''
+            entry = cached.get(key)
+            if _is_usable(entry, link, resolver):
+                fields = entry[2]
+                hits += 1
+            else:
+                fields = enrich_record(restaurant, resolver)
+                cached[key] = (link, ENRICHMENT_VERSION, fields)
+                conn.execute(
+                    "INSERT OR REPLACE INTO enrichment (address_key, maps_link, version, fields, enriched_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, link, ENRICHMENT_VERSION, json.dumps(fields), now),
+                )
+                computed += 1
+            for column in ENRICHED_COLUMNS:
+                value = fields.get(column)
+                restaurant[column] = '' if value is None else value
+        conn.commit()
+    finally:
+        conn.close()
+    located = sum(1 for r in restaurants if r.get('Latitude') != '')
+    print(f"Enriched {len(restaurants)} restaurants ({computed} processed, {hits} from cache, {located} with coordinates)")
+    return restaurants
+
+
+def enrich_csv_file(filename, cache_path=None, resolver=None):
+    """Enrich a per-country CSV file in place."""
+    with open(filename, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        columns = list(reader.fieldnames or [])
+        restaurants = list(reader)
+    enrich_restaurants(restaurants, cache_path, resolver)
+    columns += [c for c in ENRICHED_COLUMNS if c not in columns]
+    tmp = f'{filename}.tmp'
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, restval='', extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(restaurants)
+    os.replace(tmp, filename)
+    print(f"Updated {filename}")
+
+
+def main():
+    from csv_utils import find_country_files
+
+    parser = argparse.ArgumentParser(description='Add coordinates, place IDs and split addresses to scraped country files')
+    parser.add_argument('--country', type=str, default='ALL', help='Comma-separated country codes or "ALL". Default: ALL')
+    parser.add_argument('--resolver', choices=RESOLVERS, default='none', help='Geocoder for restaurants whose maps link has no coordinates. Default: none')
+    parser.add_argument('--resolver-file', type=str, help='CSV with Address, Latitude, Longitude (and optional Postcode, Place_ID) columns for --resolver local')
+    parser.add_argument('--enrich-cache', type=str, help='SQLite file for cached results. Default: enrichment.sqlite in the run cache directory')
+    args = parser.parse_args()
+
+    target = args.country.upper()
+    codes = None if target == 'ALL' else [c.strip() for c in target.split(',') if c.strip()]
+    files = find_country_files(codes)
+    if not files:
+        print("No country files found to enrich.")
+        return
+    resolver = make_resolver(args.resolver, args.resolver_file)
+    for filename in files.values():
+        enrich_csv_file(filename, args.enrich_cache, resolver)
+
+
+if __name__ == "__main__":
+    main()
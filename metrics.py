@@ -0,0 +1,180 @@
+"""
+Per-phase timing and counters for scrape runs.
+
+Code wraps its phases in ``metrics.phase('scroll')`` and bumps counters with
+``metrics.count('wait_timeouts')``. Everything recorded inside
+``metrics.country('GB')`` is attributed to that country (per thread, so
+parallel workers don't mix), anything else goes to the run-level scope.
+At the end the report is written as JSON lines or a Prometheus text file.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+METRICS_FORMATS = ['jsonl', 'prometheus']
+
+
+class _Scope:
+
+    def __init__(self, country_code=None):
+        self.country_code = country_code
+        self.phases = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.rows = None
+        self.success = None
+        self.error = None
+
+    def as_dict(self):
+        return {
+            'country': self.country_code,
+            'seconds': round(self.seconds if self.seconds is not None else time.perf_counter() - self.started, 4),
+            'success': self.success,
+            'rows': self.rows,
+            'error': self.error,
+            'phases': {name: round(value, 4) for name, value in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+
+
+class RunMetrics:
+    """Collects phase timings and counters for one scraper run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.run = _Scope()
+        self.countries = []
+
+    def _scope(self):
+        return getattr(self._local, 'scope', None) or self.run
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block and add it to the current scope's phase total."""
+        scope = self._scope()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                scope.phases[name] = scope.phases.get(name, 0.0) + elapsed
+
+    def count(self, name, amount=1):
+        """Increment a counter in the current scope."""
+        scope = self._scope()
+        with self._lock:
+            scope.counters[name] = scope.counters.get(name, 0) + amount
+
+    @contextmanager
+    def country(self, country_code):
+        """Attribute everything recorded in this thread to country_code."""
+        scope = _Scope(country_code)
+        previous = getattr(self._local, 'scope', None)
+        self._local.scope = scope
+        try:
+            yield scope
+        except BaseException as e:
+            scope.success = False
+            scope.error = str(e)
+            raise
+        finally:
+            scope.seconds = time.perf_counter() - scope.started
+            if scope.success is None:
+                scope.success = True
+            self._local.scope = previous
+            with self._lock:
+                self.countries.append(scope)
+
+    def clear_countries(self):
+        """Forget the finished per-country scopes, for processes that never write a report."""
+        with self._lock:
+            self.countries.clear()
+
+    def instrument_driver(self, driver):
+        """Count every WebDriver command sent through driver."""
+        original = driver.execute
+
+        def counting_execute(driver_command, *args, **kwargs):
+            self.count('webdriver_commands')
+            self.count(f'webdriver_command:{driver_command}')
+            return original(driver_command, *args, **kwargs)
+
+        driver.execute = counting_execute
+        return driver
+
+    def report(self):
+        """Return the run-level record followed by one record per country."""
+        run = self.run.as_dict()
+        run.update(type='run', started_at=self.started_at, country=None)
+        records = [run]
+        for scope in self.countries:
+            record = scope.as_dict()
+            record.update(type='country', started_at=self.started_at)
+            records.append(record)
+        return records
+
+    def write_jsonl(self, path):
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in self.report():
+                f.write(json.dumps(record) + '\n')
+
+    def write_prometheus(self, path):
+        lines = [
+            '# HELP amex_scrape_phase_seconds Time spent per scrape phase.',
+            '# TYPE amex_scrape_phase_seconds gauge',
+        ]
+        records = self.report()
+        for record in records:
+            country = record['country'] or 'run'
+            for phase, seconds in record['phases'].items():
+                lines.append(f'amex_scrape_phase_seconds{{country="{country}",phase="{phase}"}} {seconds}')
+        lines += [
+            '# HELP amex_scrape_events_total WebDriver commands, waits, timeouts and other events.',
+            '# TYPE amex_scrape_events_total counter',
+        ]
+        for record in records:
+            country = record['country'] or 'run'
+            for name, value in record['counters'].items():
+                lines.append(f'amex_scrape_events_total{{country="{country}",event="{name}"}} {value}')
+        lines += [
+            '# HELP amex_scrape_country_seconds Total time per country.',
+            '# TYPE amex_scrape_country_seconds gauge',
+        ]
+        for record in records[1:]:
+            lines.append(f'amex_scrape_country_seconds{{country="{record["country"]}"}} {record["seconds"]}')
+        lines += [
+            '# HELP amex_scrape_rows Restaurants scraped per country.',
+            '# TYPE amex_scrape_rows gauge',
+            '# HELP amex_scrape_success Whether the country scraped successfully.',
+            '# TYPE amex_scrape_success gauge',
+        ]
+        for record in records[1:]:
+            lines.append(f'amex_scrape_rows{{country="{record["country"]}"}} {record["rows"] or 0}')
+            lines.append(f'amex_scrape_success{{country="{record["country"]}"}} {1 if record["success"] else 0}')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def write(self, path, metrics_format=None):
+        """Write the report; format defaults to prometheus for .prom files, JSON lines otherwise."""
+        metrics_format = metrics_format or ('prometheus' if path.endswith('.prom') else 'jsonl')
+        if metrics_format == 'prometheus':
+            self.write_prometheus(path)
+        else:
+            self.write_jsonl(path)
+        print(f"Metrics written to {path}")
+
+
+# Shared by the whole process; main() writes it out at the end of the run
+metrics = RunMetrics()
+
+phase = metrics.phase
+count = metrics.count
+country = metrics.country
@@ -0,0 +1,271 @@
+"""
+Structural discovery of the page's styled-components selectors.
+
+The tile, name, address, cuisine and button selectors are hashed class
+names that change whenever Amex redeploys. discover_selectors() infers them
+in one in-browser pass from things that survive a redeploy: tiles are the
+repeated elements holding a Google Maps link, the name is the element
+around #flags, the address the one split with <br>, and the modal
+selectors come from opening one chain's "view locations" modal.
+
+Resolved selectors are cached per page fingerprint (the deployed script
+and stylesheet URLs) by run_cache.cached_selectors, so discovery only runs
+when the cached selectors stop matching the page. The modal selectors are
+checked against a real modal the first time one is opened.
+"""
+
+import hashlib
+import json
+
+import waits
+
+
+# Hashes the bundle URLs, which change with every deploy
+_FINGERPRINT_JS = """
+const urls = Array.from(document.querySelectorAll('script[src], link[rel="stylesheet"][href]'),
+                        el => el.getAttribute('src') || el.getAttribute('href'));
+return [location.host + location.pathname].concat(urls.sort());
+"""
+
+_MATCHES_JS = """
+const s = arguments[0];
+let tiles;
+try { tiles = Array.from(document.querySelectorAll(s.location.restaurant)).slice(0, 20); } catch (e) { return false; }
+if (!tiles.length) return false;
+const good = tiles.filter(t => t.querySelector(s.location.name) &&
+                               (t.querySelector(s.location.address) || t.querySelector(s.location.cuisine)));
+if (good.length * 2 < tiles.length) return false;
+// Chains (tiles with a "view locations" button) must be found by the button selector
+const chains = tiles.filter(t => Array.from(t.querySelectorAll('button')).some(b => /location/i.test(b.innerText)));
+if (!chains.length) return true;
+try { return chains.every(t => s.view_locations_button && t.querySelector(s.view_locations_button)); } catch (e) { return false; }
+"""
+
+# Opens the first chain's modal and checks the sub-location tiles and the
+# close button, then closes it again (with the first new button if the close
+# selector is wrong, as discovery does). True when the page has no chains.
+_MODAL_MATCHES_JS = """
+const [s, timeoutMs, done] = arguments;
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+const query = sel => { try { return sel ? document.querySelector(sel) : null; } catch (e) { return null; } };
+const queryAll = sel => { try { return sel ? Array.from(document.querySelectorAll(sel)) : []; } catch (e) { return []; } };
+async function waitFor(condition) {
+    const start = performance.now();
+    while (performance.now() - start < timeoutMs) {
+        const result = condition();
+        if (result) return result;
+        await sleep(100);
+    }
+    return null;
+}
+async function run() {
+    const button = queryAll(s.location.restaurant).map(t => {
+        try { return t.querySelector(s.view_locations_button); } catch (e) { return null; }
+    }).find(Boolean);
+    if (!button) return true;
+    const buttonsBefore = new Set(document.querySelectorAll('button'));
+    button.click();
+    const sub = s.sub_location;
+    const tiles = await waitFor(() => { const t = queryAll(sub.restaurant); return t.length ? t : null; });
+    const good = (tiles || []).filter(t => t.querySelector(sub.name) &&
+                                           (t.querySelector(sub.address) || t.querySelector(sub.cuisine)));
+    const close = query(s.close_locations_button);
+    const ok = Boolean(tiles) && good.length * 2 >= tiles.length && Boolean(close);
+    const fallback = Array.from(document.querySelectorAll('button')).filter(b => !buttonsBefore.has(b));
+    const closeButton = close || fallback.find(b => /close|×|✕/i.test(b.getAttribute('aria-label') || b.innerText)) || fallback[0];
+    if (closeButton) {
+        closeButton.click();
+        await waitFor(() => !document.body.contains(closeButton));
+    }
+    return ok;
+}
+run().then(done, e => done(false));
+"""
+
+_DISCOVER_JS = """
+const [timeoutMs, done] = arguments;
+const MAPS = ['google.com/maps', 'goo.gl/maps', 'maps.app.goo.gl'];
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+const isMapsLink = a => MAPS.some(p => (a.getAttribute('href') || '').includes(p));
+const mapsLinks = root => Array.from(root.querySelectorAll('a[href]')).filter(isMapsLink);
+const country = document.getElementById('country');
+
+function selectorFor(el) {
+    const classes = Array.from(el.classList);
+    const cls = classes.find(c => c.startsWith('sc-')) || classes[0];
+    return cls ? el.tagName.toLowerCase() + '.' + CSS.escape(cls) : null;
+}
+
+function mostCommon(values) {
+    const counts = new Map();
+    for (const v of values) if (v) counts.set(v, (counts.get(v) || 0) + 1);
+    let best = null, bestCount = 0;
+    for (const [v, c] of counts) if (c > bestCount) { best = v; bestCount = c; }
+    return best;
+}
+
+// The tile holding a maps link: the first ancestor repeated among its
+// siblings, or failing that the highest ancestor with only this one link
+function tileFor(link, root) {
+    let fallback = null;
+    for (let el = link.parentElement; el && el !== root && el !== document.body; el = el.parentElement) {
+        if (mapsLinks(el).length > 1) break;
+        const sel = selectorFor(el);
+        if (!sel) continue;
+        fallback = el;
+        const siblings = el.parentElement ? Array.from(el.parentElement.children) : [];
+        if (siblings.filter(s => s !== el && selectorFor(s) === sel).length) return el;
+    }
+    return fallback;
+}
+
+function tileSelector(links, root) {
+    return mostCommon(links.filter(a => !(country && country.contains(a))).map(a => {
+        const tile = tileFor(a, root);
+        return tile && selectorFor(tile);
+    }));
+}
+
+// Nearest ancestor of el (inside tile) that has a selector
+function styled(el, tile) {
+    for (; el && el !== tile; el = el.parentElement) if (selectorFor(el)) return el;
+    return null;
+}
+
+function fieldSelectors(tiles) {
+    const names = [], addresses = [], cuisines = [], buttons = [];
+    for (const tile of tiles.slice(0, 30)) {
+        let nameEl = null;
+        const flags = tile.querySelector('#flags');
+        if (flags) {
+            // Climb until the element holds more text than the flags themselves
+            for (let el = flags.parentElement; el && el !== tile; el = el.parentElement) {
+                if (el.innerText.trim().length > flags.innerText.trim().length) { nameEl = styled(el, tile); break; }
+            }
+        }
+        if (!nameEl) nameEl = styled(tile.querySelector('h1, h2, h3, h4, h5, h6'), tile);
+        const br = tile.querySelector('br');
+        const addressEl = br ? styled(br.parentElement, tile) : null;
+        names.push(nameEl && selectorFor(nameEl));
+        addresses.push(addressEl && selectorFor(addressEl));
+
+        // Cuisine: a styled element with its own text, outside name, address, links and buttons
+        for (const el of tile.querySelectorAll('*')) {
+            if (!selectorFor(el) || el.closest('a, button')) continue;
+            if ((nameEl && (nameEl.contains(el) || el.contains(nameEl))) ||
+                (addressEl && (addressEl.contains(el) || el.contains(addressEl)))) continue;
+            const ownText = Array.from(el.childNodes).some(n => n.nodeType === 3 && n.nodeValue.trim());
+            if (ownText) { cuisines.push(selectorFor(el)); break; }
+        }
+        for (const button of tile.querySelectorAll('button')) {
+            if (/location/i.test(button.innerText)) buttons.push(selectorFor(button));
+        }
+    }
+    return {
+        name: mostCommon(names), address: mostCommon(addresses),
+        cuisine: mostCommon(cuisines), button: mostCommon(buttons),
+    };
+}
+
+async function waitFor(condition) {
+    const start = performance.now();
+    while (performance.now() - start < timeoutMs) {
+        const result = condition();
+        if (result) return result;
+        await sleep(100);
+    }
+    return null;
+}
+
+async function run() {
+    const result = {location: {}, sub_location: {}, view_locations_button: null, close_locations_button: null};
+    const restaurant = tileSelector(mapsLinks(document), document.body);
+    if (!restaurant) return result;
+    const tiles = Array.from(document.querySelectorAll(restaurant));
+    const fields = fieldSelectors(tiles);
+    result.location = {restaurant: restaurant, name: fields.name, address: fields.address, cuisine: fields.cuisine};
+    result.view_locations_button = fields.button;
+    if (!fields.button) return result;
+
+    // Open one chain's modal to find the sub-location and close selectors
+    const button = tiles.map(t => t.querySelector(fields.button)).find(Boolean);
+    const buttonsBefore = new Set(document.querySelectorAll('button'));
+    button.click();
+    const modalLinks = await waitFor(() => {
+        const links = mapsLinks(document).filter(a => !tiles.some(t => t.contains(a)));
+        return links.length ? links : null;
+    });
+    if (modalLinks) {
+        const subRestaurant = tileSelector(modalLinks, document.body);
+        if (subRestaurant) {
+            const subFields = fieldSelectors(Array.from(document.querySelectorAll(subRestaurant)));
+            result.sub_location = {restaurant: subRestaurant, name: subFields.name,
+                                   address: subFields.address, cuisine: subFields.cuisine};
+        }
+    }
+    const newButtons = Array.from(document.querySelectorAll('button')).filter(b => !buttonsBefore.has(b));
+    const close = newButtons.find(b => /close|×|✕/i.test(b.getAttribute('aria-label') || b.innerText)) || newButtons[0];
+    if (close) {
+        result.close_locations_button = selectorFor(close);
+        close.click();
+        await waitFor(() => !document.querySelector(result.close_locations_button));
+    }
+    return result;
+}
+run().then(done, e => done({error: String(e)}));
+"""
+
+
+def page_fingerprint(driver):
+    """Short hash identifying the deployed version of the page."""
+    parts = driver.execute_script(_FINGERPRINT_JS)
+    return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def selectors_match(driver, selectors):
+    """
+    Whether selectors find tiles that mostly contain a name and an address or
+    cuisine, and find the "view locations" button of every chain among them.
+    """
+    return bool(driver.execute_script(_MATCHES_JS, selectors))
+
+
+def modal_selectors_match(driver, selectors, timeout=None):
+    """
+    Whether the sub-location and close selectors match a chain's modal.
+
+    Opens and closes the first chain's modal, so it is only worth calling
+    once per page version. True if the page has no chains.
+    """
+    timeout = waits.DEFAULT_TIMEOUT if timeout is None else timeout
+    driver.set_script_timeout(timeout * 2 + 10)
+    return bool(driver.execute_async_script(_MODAL_MATCHES_JS, selectors, int(timeout * 1000)))
+
+
+def discover_selectors(driver, current, timeout=None):
+    """
+    Infer the page's selectors structurally in one in-browser pass.
+
+    Returns a mapping shaped like current, with anything that could not be
+    found (e.g. the modal selectors on a page without chains) taken from
+    current, or None if no restaurant tiles were found at all.
+    """
+    timeout = waits.DEFAULT_TIMEOUT if timeout is None else timeout
+    driver.set_script_timeout(timeout * 2 + 10)
+    found = driver.execute_async_script(_DISCOVER_JS, int(timeout * 1000))
+    if not found or found.get('error') or not found['location'].get('restaurant'):
+        if found and found.get('error'):
+            print(f"Selector discovery failed: {found['error']}")
+        return None
+
+    selectors = {
+        'location': dict(current['location']),
+        'sub_location': dict(current['sub_location']),
+        'view_locations_button': found['view_locations_button'] or current['view_locations_button'],
+        'close_locations_button': found['close_locations_button'] or current['close_locations_button'],
+    }
+    for group in ('location', 'sub_location'):
+        for field, selector in found[group].items():
+            if selector:
+                selectors[group][field] = selector
+    return selectors
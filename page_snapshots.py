@@ -0,0 +1,116 @@
+"""
+Debug snapshots of the rendered page, captured according to a policy.
+
+driver.page_source has to be read on the scraping thread, but compressing
+and writing the (multi-MB) snapshot happens on a background thread so it
+never holds up the next country. Old snapshots beyond the retention limit
+are deleted.
+"""
+
+import glob
+import gzip
+import os
+import threading
+from datetime import datetime
+
+
+SNAPSHOT_POLICIES = ['off', 'on-error', 'always']
+SNAPSHOT_COMPRESSIONS = ['gzip', 'zstd', 'none']
+
+_EXTENSIONS = {'gzip': '.html.gz', 'zstd': '.html.zst', 'none': '.html'}
+
+
+class PageSnapshotter:
+    """Writes page_source snapshots asynchronously according to a policy."""
+
+    def __init__(self, policy='on-error', compression='gzip', retention=20, directory='.'):
+        self.configure(policy, compression, retention, directory)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def configure(self, policy='on-error', compression='gzip', retention=20, directory='.'):
+        if policy not in SNAPSHOT_POLICIES:
+            raise ValueError(f"Unknown snapshot policy: {policy}")
+        if compression not in SNAPSHOT_COMPRESSIONS:
+            raise ValueError(f"Unknown snapshot compression: {compression}")
+        if compression == 'zstd':
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                raise ImportError("zstd snapshots require zstandard. Install it with: pip install zstandard")
+        self.policy = policy
+        self.compression = compression
+        self.retention = retention
+        self.directory = directory
+
+    def wants(self, error=False):
+        """Whether a snapshot should be taken for a normal (or failed) page."""
+        return self.policy == 'always' or (self.policy == 'on-error' and error)
+
+    def capture(self, driver, filename_params='', error=False):
+        """Read page_source now and write it in the background. Returns the target filename."""
+        if not self.wants(error):
+            return None
+        page_source = driver.page_source
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        filename = os.path.join(
+            self.directory, f'page_source{filename_params}_{timestamp}{_EXTENSIONS[self.compression]}'
+        )
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='page-snapshots')
+            self._executor.submit(self._write, page_source, filename)
+        return filename
+
+    def _write(self, page_source, filename):
+        try:
+            data = page_source.encode('utf-8')
+            if self.compression == 'gzip':
+                data = gzip.compress(data, compresslevel=6)
+            elif self.compression == 'zstd':
+                import zstandard
+                data = zstandard.ZstdCompressor().compress(data)
+            with open(filename, 'wb') as f:
+                f.write(data)
+            print(f"Page HTML saved to '{filename}' for debugging.")
+            self._prune()
+        except Exception as e:
+            print(f"Warning: Could not save HTML file: {e}")
+
+    def _prune(self):
+        if not self.retention or self.retention < 0:
+            return
+        snapshots = sorted(
+            glob.glob(os.path.join(self.directory, 'page_source*.html*')),
+            key=lambda f: (os.path.getmtime(f), f),
+        )
+        for old in snapshots[:-self.retention]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def flush(self):
+        """Wait for pending snapshot writes to finish."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def read_snapshot(filename):
+    """Read a (possibly compressed) snapshot back as text."""
+    if filename.endswith('.gz'):
+        with gzip.open(filename, 'rt', encoding='utf-8') as f:
+            return f.read()
+    if filename.endswith('.zst'):
+        import zstandard
+        with open(filename, 'rb') as f:
+            return zstandard.ZstdDecompressor().decompressobj().decompress(f.read()).decode('utf-8')
+    with open(filename, encoding='utf-8') as f:
+        return f.read()
+
+
+# Shared by the whole process; configured from the command line in main()
+snapshotter = PageSnapshotter()
@@ -0,0 +1,167 @@
+"""
+Columnar (Parquet) output for per-country files and the combined dataset.
+
+CountryCode, Cuisine and Status are stored as categoricals (dictionary
+encoded), so repeated strings cost almost nothing and dtypes survive the
+round trip. The combined output is a directory with one file per country,
+which lets readers load a subset of columns or countries and lets the
+combine step add or refresh a single country without touching the rest.
+
+Requires pyarrow (pip install pyarrow).
+"""
+
+import glob
+import os
+import shutil
+
+import pandas as pd
+
+
+CATEGORICAL_COLUMNS = ['CountryCode', 'Cuisine', 'Status']
+
+# Coordinates added by --enrich (see enrichment.ENRICHED_COLUMNS), stored as
+# float64 with nulls where no coordinates were found
+FLOAT_COLUMNS = ['Latitude', 'Longitude']
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("Parquet output requires pyarrow. Install it with: pip install pyarrow")
+
+
+def restaurants_to_frame(restaurants):
+    """Build a DataFrame with the low-cardinality columns as categoricals."""
+    df = restaurants if isinstance(restaurants, pd.DataFrame) else pd.DataFrame(restaurants)
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].fillna('').astype('category')
+    return df
+
+
+def _write_parquet(df, filename):
+    # Use the same dictionary index width in every file so partitions can be
+    # read together (pandas would pick int8 or int16 depending on cardinality)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = []
+    for column in df.columns:
+        if column in CATEGORICAL_COLUMNS:
+            fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+        elif column in FLOAT_COLUMNS:
+            fields.append(pa.field(column, pa.float64()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    df = df.astype({c: str for c in df.columns if c not in CATEGORICAL_COLUMNS and c not in FLOAT_COLUMNS})
+    for column in FLOAT_COLUMNS:
+        if column in df.columns:
+            # '' (no coordinates) becomes NaN, written as null
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+    table = pa.Table.from_pandas(df, schema=pa.schema(fields), preserve_index=False)
+    pq.write_table(table, filename)
+
+
+def _has_current_schema(filename):
+    # Files written before coordinates were stored as floats have them as strings
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(filename)
+    return all(schema.field(c).type == pa.float64() for c in FLOAT_COLUMNS if c in schema.names)
+
+
+def save_to_parquet(restaurants, country_code):
+    """Save restaurant data to amex_restaurants_{country_code}.parquet."""
+    if not restaurants:
+        print(f"No restaurants to save for {country_code}.")
+        return None
+    _require_pyarrow()
+
+    filename = f'amex_restaurants_{country_code}.parquet'
+    _write_parquet(restaurants_to_frame(restaurants), filename)
+    print(f"\nSuccessfully saved {len(restaurants)} restaurants to {filename}")
+    return filename
+
+
+def dataset_path(output_suffix='ALL'):
+    """Directory holding the combined, country-partitioned Parquet dataset."""
+    return f'amex_restaurants_{output_suffix}_parquet'
+
+
+def _partition_file(output_dir, country_code):
+    return os.path.join(output_dir, f'part-{country_code}.parquet')
+
+
+def combine_to_parquet_dataset(country_files, output_suffix='ALL'):
+    """
+    Add per-country files to the combined Parquet dataset.
+
+    Args:
+        country_files (dict): Country code -> per-country .parquet or .csv file.
+        output_suffix (str): Dataset is written to amex_restaurants_{output_suffix}_parquet/.
+
+    Parquet inputs are copied as-is (no reparsing). CSV inputs, and Parquet
+    files from before coordinates were stored as floats, are converted once.
+    Partitions newer than their source are left alone, so repeated combines
+    only pay for countries that were re-scraped.
+    """
+    _require_pyarrow()
+    output_dir = dataset_path(output_suffix)
+    os.makedirs(output_dir, exist_ok=True)
+
+    updated = 0
+    for country_code, source in sorted(country_files.items()):
+        target = _partition_file(output_dir, country_code)
+        try:
+            if (os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source)
+                    and _has_current_schema(target)):
+                continue
+            if source.endswith('.parquet') and _has_current_schema(source):
+                shutil.copyfile(source, target)
+            else:
+                if source.endswith('.parquet'):
+                    df = pd.read_parquet(source)
+                else:
+                    df = pd.read_csv(source, dtype=str, keep_default_na=False)
+                if 'CountryCode' not in df.columns:
+                    df['CountryCode'] = country_code
+                _write_parquet(restaurants_to_frame(df), target)
+            updated += 1
+            print(f"Updated partition {target} from {source}")
+        except Exception as e:
+            print(f"Error adding {source} to {output_dir}: {e}")
+
+    print(f"\nParquet dataset {output_dir}: {updated} partitions updated, "
+          f"{len(country_files) - updated} unchanged")
+    return output_dir
+
+
+def read_restaurants(path, columns=None, country_codes=None):
+    """
+    Load restaurants from a Parquet file or combined dataset directory.
+
+    Only the requested columns (and countries, for a dataset) are read.
+    """
+    _require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if os.path.isdir(path):
+        if country_codes:
+            files = [_partition_file(path, code) for code in country_codes]
+            files = [f for f in files if os.path.exists(f)]
+        else:
+            files = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+        if not files:
+            return pd.DataFrame(columns=columns or [])
+        # Older partitions may lack columns such as Status; read them as nulls
+        schema = pa.unify_schemas([ds.dataset(f, format='parquet').schema for f in files])
+        dataset = ds.dataset(files, schema=schema, format='parquet')
+    else:
+        dataset = ds.dataset(path, format='parquet')
+
+    if columns:
+        columns = [c for c in columns if c in dataset.schema.names]
+    return dataset.to_table(columns=columns).to_pandas()
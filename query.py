@@ -0,0 +1,318 @@
+"""
+Nearby-restaurant queries over the combined dataset.
+
+Builds a persistent index next to the combined output: a lat/lon grid for
+radius and k-nearest searches plus inverted indexes on Cuisine,
+CountryCode and Status for filters. Coordinates come from the enrichment
+columns when present, otherwise they are parsed from Google_Maps_Link. The
+index is rebuilt only when the source file changes, so each query just
+loads it and touches a handful of grid cells.
+
+Usage:
+    python query.py --near 51.5074,-0.1278 --radius 2 --cuisine Indian
+    python query.py --near 48.8566,2.3522 --limit 5 --country FR
+    python query.py --status NEW --country GB
+"""
+
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+
+from enrichment import parse_maps_link
+from snapshot_store import normalize_text
+
+
+INDEX_VERSION = 3
+
+# Grid cell size in degrees (~28 km north-south)
+CELL_SIZE = 0.25
+
+EARTH_RADIUS_KM = 6371.0088
+
+INDEXED_COLUMNS = ['Cuisine', 'CountryCode', 'Status']
+
+# Columns kept in the index and shown in results
+RESULT_COLUMNS = ['Name', 'Address', 'Cuisine', 'Status', 'CountryCode', 'Google_Maps_Link']
+
+
+def index_path(source):
+    """Index file stored next to a combined CSV or Parquet dataset."""
+    return f"{source.rstrip(os.sep)}.index.json"
+
+
+def _source_signature(source):
+    # Size and mtime of the file, or of every partition of a dataset
+    files = sorted(glob.glob(os.path.join(source, 'part-*.parquet'))) if os.path.isdir(source) else [source]
+    return [[os.path.basename(f), os.path.getsize(f), os.path.getmtime(f)] for f in files]
+
+
+def _read_source(source):
+    if os.path.isdir(source) or source.endswith('.parquet'):
+        from parquet_utils import read_restaurants
+        df = read_restaurants(source, columns=RESULT_COLUMNS + ['Latitude', 'Longitude'])
+        return df.fillna('').astype(str).to_dict('records')
+    with open(source, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+
+def _coordinates(row):
+    try:
+        if row.get('Latitude') not in (None, '') and row.get('Longitude') not in (None, ''):
+            return float(row['Latitude']), float(row['Longitude'])
+    except ValueError:
+        pass
+    parsed = parse_maps_link(row.get('Google_Maps_Link', ''))
+    if parsed['Latitude'] is None:
+        return None
+    return parsed['Latitude'], parsed['Longitude']
+
+
+def _columns(cell_size):
+    return round(360 / cell_size)
+
+
+def _wrap_column(j, cell_size):
+    # Longitude wraps around: -180 and 180 are the same column
+    columns = _columns(cell_size)
+    return (j + columns // 2) % columns - columns // 2
+
+
+def _cell(lat, lon, cell_size):
+    return math.floor(lat / cell_size), _wrap_column(math.floor(lon / cell_size), cell_size)
+
+
+def _terms(value):
+    """Index terms for a value; multi-cuisine values are indexed per cuisine as well."""
+    terms = {normalize_text(value)}
+    terms.update(normalize_text(part) for part in value.replace('/', ',').split(','))
+    terms.discard('')
+    return terms
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+class RestaurantIndex:
+    """Grid plus inverted indexes over the restaurants of a combined dataset."""
+
+    def __init__(self, rows, coordinates, cell_size=CELL_SIZE):
+        self.rows = rows
+        self.coordinates = coordinates
+        self.cell_size = cell_size
+        self.grid = {}
+        self.inverted = {column: {} for column in INDEXED_COLUMNS}
+        for row_id, (row, point) in enumerate(zip(rows, coordinates)):
+            if point is not None:
+                self.grid.setdefault(_cell(point[0], point[1], cell_size), []).append(row_id)
+            for column in INDEXED_COLUMNS:
+                for term in _terms(row.get(column, '')):
+                    self.inverted[column].setdefault(term, []).append(row_id)
+
+    @classmethod
+    def build(cls, source, cell_size=CELL_SIZE):
+        source_rows = _read_source(source)
+        # Coordinates come from the full row, which may carry enriched Latitude/Longitude
+        coordinates = [_coordinates(row) for row in source_rows]
+        rows = [{c: row.get(c, '') or '' for c in RESULT_COLUMNS} for row in source_rows]
+        return cls(rows, coordinates, cell_size)
+
+    def save(self, path, signature=None):
+        data = {
+            'version': INDEX_VERSION,
+            'signature': signature,
+            'cell_size': self.cell_size,
+            'rows': [[row[c] for c in RESULT_COLUMNS] for row in self.rows],
+            'coordinates': self.coordinates,
+            'grid': [[cell[0], cell[1], ids] for cell, ids in self.grid.items()],
+            'inverted': self.inverted,
+        }
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls.__new__(cls)
+        index.rows = [dict(zip(RESULT_COLUMNS, values)) for values in data['rows']]
+        index.coordinates = [tuple(point) if point else None for point in data['coordinates']]
+        index.cell_size = data['cell_size']
+        index.grid = {(i, j): ids for i, j, ids in data['grid']}
+        index.inverted = data['inverted']
+        index.signature = data.get('signature')
+        index.version = data.get('version')
+        return index
+
+    def matching(self, cuisine=None, country=None, status=None):
+        """Row ids passing every given filter (each a list of accepted values), or None for no filter."""
+        selected = None
+        for column, values in (('Cuisine', cuisine), ('CountryCode', country), ('Status', status)):
+            if not values:
+                continue
+            ids = set()
+            for value in values:
+                ids.update(self.inverted[column].get(normalize_text(value), []))
+            selected = ids if selected is None else selected & ids
+        return selected
+
+    def _cells_within(self, lat, lon, radius_km):
+        lat_span = radius_km / 111.32
+        lon_span = radius_km / max(111.32 * math.cos(math.radians(lat)), 1e-6)
+        min_i, max_i = math.floor((lat - lat_span) / self.cell_size), math.floor((lat + lat_span) / self.cell_size)
+        # Unwrapped column range; may run past the antimeridian
+        min_j, max_j = math.floor((lon - lon_span) / self.cell_size), math.floor((lon + lon_span) / self.cell_size)
+        columns = _columns(self.cell_size)
+        if max_j - min_j >= columns:
+            min_j, max_j = 0, columns - 1
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                yield from self.grid.get((i, _wrap_column(j, self.cell_size)), ())
+
+    def radius(self, lat, lon, radius_km, limit=None, **filters):
+        """Restaurants within radius_km of (lat, lon), nearest first, as (distance_km, row) pairs."""
+        allowed = self.matching(**filters)
+        results = []
+        for row_id in self._cells_within(lat, lon, radius_km):
+            if allowed is not None and row_id not in allowed:
+                continue
+            distance = haversine_km(lat, lon, *self.coordinates[row_id])
+            if distance <= radius_km:
+                results.append((distance, row_id))
+        results.sort()
+        return [(d, self.rows[i]) for d, i in results[:limit]]
+
+    def _ring(self, origin_i, origin_j, ring):
+        cell = lambda i, j: self.grid.get((i, _wrap_column(j, self.cell_size)), ())
+        if ring == 0:
+            yield from cell(origin_i, origin_j)
+            return
+        for j in range(origin_j - ring, origin_j + ring + 1):
+            yield from cell(origin_i - ring, j)
+            yield from cell(origin_i + ring, j)
+        for i in range(origin_i - ring + 1, origin_i + ring):
+            yield from cell(i, origin_j - ring)
+            yield from cell(i, origin_j + ring)
+
+    def nearest(self, lat, lon, k=10, **filters):
+        """The k restaurants nearest to (lat, lon), searching outwards ring by ring of grid cells."""
+        allowed = self.matching(**filters)
+        origin_i, origin_j = _cell(lat, lon, self.cell_size)
+        found = []
+        ring = 0
+        while True:
+            if (2 * ring + 1) ** 2 > len(self.grid) or 2 * ring + 1 > _columns(self.cell_size):
+                # Sparse data far away (or the ring would wrap onto itself): check every point
+                found = [
+                    (haversine_km(lat, lon, *point), row_id)
+                    for row_id, point in enumerate(self.coordinates)
+                    if point is not None and (allowed is None or row_id in allowed)
+                ]
+                break
+            for row_id in self._ring(origin_i, origin_j, ring):
+                if allowed is None or row_id in allowed:
+                    found.append((haversine_km(lat, lon, *self.coordinates[row_id]), row_id))
+            if len(found) >= k:
+                found.sort()
+                # Anything outside the searched square is at least this far away
+                edge_lat = min(abs(lat) + ring * self.cell_size, 89.9)
+                covered_km = ring * self.cell_size * 111.32 * math.cos(math.radians(edge_lat))
+                if found[k - 1][0] <= covered_km:
+                    break
+            ring += 1
+        found.sort()
+        return [(d, self.rows[i]) for d, i in found[:k]]
+
+    def filter(self, limit=None, **filters):
+        """Restaurants matching the filters, in file order."""
+        allowed = self.matching(**filters)
+        ids = range(len(self.rows)) if allowed is None else sorted(allowed)
+        return [(None, self.rows[i]) for i in list(ids)[:limit]]
+
+
+def load_index(source, rebuild=False):
+    """Load the persisted index for source, rebuilding it when the source changed."""
+    path = index_path(source)
+    signature = _source_signature(source)
+    if not rebuild and os.path.exists(path):
+        try:
+            index = RestaurantIndex.load(path)
+            if index.version == INDEX_VERSION and index.signature == signature:
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+    print(f"Building index for {source}...")
+    index = RestaurantIndex.build(source)
+    index.save(path, signature)
+    located = sum(1 for point in index.coordinates if point is not None)
+    print(f"Indexed {len(index.rows)} restaurants ({located} with coordinates) in {path}")
+    return index
+
+
+def default_source(output_suffix='ALL'):
+    """The combined CSV if it exists, otherwise the combined Parquet dataset."""
+    csv_file = f'amex_restaurants_{output_suffix}.csv'
+    if os.path.exists(csv_file):
+        return csv_file
+    from parquet_utils import dataset_path
+    return dataset_path(output_suffix)
+
+
+def _split(value):
+    return [v.strip() for v in value.split(',') if v.strip()] if value else None
+
+
+def run_query(source=None, near=None, radius_km=None, limit=None, cuisine=None, country=None, status=None,
+              rebuild=False):
+    """Run one query and print the results. Returns the (distance_km, row) pairs."""
+    source = source or default_source()
+    if not os.path.exists(source):
+        print(f"No combined dataset found at {source}. Run with --combine first.")
+        return []
+    index = load_index(source, rebuild=rebuild)
+    filters = {'cuisine': _split(cuisine), 'country': _split(country), 'status': _split(status)}
+
+    if near:
+        lat, lon = (float(v) for v in near.split(','))
+        if radius_km is not None:
+            results = index.radius(lat, lon, radius_km, limit=limit, **filters)
+        else:
+            results = index.nearest(lat, lon, k=limit or 10, **filters)
+    else:
+        results = index.filter(limit=limit, **filters)
+
+    for distance, row in results:
+        prefix = f"{distance:8.2f} km  " if distance is not None else ''
+        print(f"{prefix}{row['Name']} [{row['Cuisine']}] ({row['CountryCode']}) - {row['Address']}")
+    print(f"{len(results)} restaurants")
+    return results
+
+
+def add_query_arguments(parser, country_flag='--country'):
+    parser.add_argument(country_flag, dest='query_country', type=str, help='Comma-separated country codes to keep')
+    parser.add_argument('--near', type=str, help='Latitude,longitude to search around (e.g. 51.5074,-0.1278)')
+    parser.add_argument('--radius', type=float, help='With --near, return every restaurant within this many km')
+    parser.add_argument('--limit', type=int, help='Maximum results (with --near and no --radius: the k nearest, default 10)')
+    parser.add_argument('--cuisine', type=str, help='Comma-separated cuisines to keep')
+    parser.add_argument('--status', type=str, help='Comma-separated statuses to keep (e.g. NEW)')
+    parser.add_argument('--rebuild-index', action='store_true', help='Rebuild the index even if the source has not changed')
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Query the combined AMEX Dining Benefits dataset')
+    parser.add_argument('--source', type=str, help='Combined CSV or Parquet dataset. Default: amex_restaurants_ALL.csv')
+    add_query_arguments(parser)
+    args = parser.parse_args(argv)
+    run_query(args.source, args.near, args.radius, args.limit, args.cuisine, args.query_country, args.status,
+              rebuild=args.rebuild_index)
+
+
+if __name__ == "__main__":
+    main()
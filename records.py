@@ -0,0 +1,133 @@
+"""
+Compact restaurant records and identity resolution.
+
+Scraped rows are kept as slotted Restaurant objects instead of plain dicts,
+with the repetitive values (names of chains, cuisines, statuses, country
+codes) interned so thousands of rows share one copy of each string. A
+Restaurant behaves like a read/write mapping, so pandas, csv.DictWriter
+and the rest of the code can keep treating rows as dicts.
+
+Duplicates are resolved on the normalised name + address + maps link:
+within a country when a chain shows up both as a tile and in its
+"view locations" modal, and across countries when combining.
+"""
+
+import hashlib
+import sys
+from collections.abc import MutableMapping
+
+from snapshot_store import normalize_text
+
+
+FIELDS = ['Name', 'Address', 'Cuisine', 'Status', 'Google_Maps_Link', 'CountryCode']
+
+# Low-cardinality values worth sharing between rows
+INTERNED_FIELDS = {'Name', 'Cuisine', 'Status', 'CountryCode'}
+
+_SLOTS = {name: f'_{name}' for name in FIELDS}
+
+
+class Restaurant(MutableMapping):
+    """One restaurant row with fixed slots for the scraped columns."""
+
+    __slots__ = tuple(_SLOTS.values()) + ('_extra',)
+
+    def __init__(self, data=None, **fields):
+        for slot in _SLOTS.values():
+            object.__setattr__(self, slot, None)
+        self._extra = None
+        if data:
+            self.update(data)
+        if fields:
+            self.update(fields)
+
+    def __getitem__(self, key):
+        slot = _SLOTS.get(key)
+        if slot is not None:
+            value = getattr(self, slot)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        slot = _SLOTS.get(key)
+        if slot is not None:
+            if isinstance(value, str) and key in INTERNED_FIELDS:
+                value = sys.intern(value)
+            setattr(self, slot, value)
+        else:
+            # Columns added later, e.g. by enrichment
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        slot = _SLOTS.get(key)
+        if slot is not None:
+            if getattr(self, slot) is None:
+                raise KeyError(key)
+            setattr(self, slot, None)
+        elif self._extra is not None:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for name, slot in _SLOTS.items():
+            if getattr(self, slot) is not None:
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Restaurant({dict(self)!r})"
+
+
+def compact(restaurants):
+    """Convert dict rows to Restaurant records (records are passed through)."""
+    return [r if isinstance(r, Restaurant) else Restaurant(r) for r in restaurants]
+
+
+def identity_key(restaurant):
+    """Fixed-size key for a restaurant: digest of normalised name, address and maps link."""
+    key = '\x1f'.join(normalize_text(restaurant.get(column) or '')
+                      for column in ('Name', 'Address', 'Google_Maps_Link'))
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+def _merge(kept, duplicate):
+    # Fill gaps from the duplicate and keep every status flag either row had
+    for column, value in duplicate.items():
+        if value and not kept.get(column):
+            kept[column] = value
+    flags = [f for f in (kept.get('Status') or '').split(', ') if f]
+    flags += [f for f in (duplicate.get('Status') or '').split(', ') if f and f not in flags]
+    kept['Status'] = ', '.join(flags)
+
+
+def resolve_duplicates(restaurants):
+    """
+    Merge rows with the same identity_key, keeping the first row's position.
+
+    Empty fields of the kept row are filled from its duplicates and their
+    status flags are combined. Returns (records, number of rows merged).
+    """
+    resolved = []
+    by_key = {}
+    merged = 0
+    for restaurant in compact(restaurants):
+        key = identity_key(restaurant)
+        kept = by_key.get(key)
+        if kept is None:
+            by_key[key] = restaurant
+            resolved.append(restaurant)
+        else:
+            _merge(kept, restaurant)
+            merged += 1
+    return resolved, merged
@@ -0,0 +1,155 @@
+"""
+Summary of the scraped data, for cron jobs and dashboards.
+
+For every per-country output file: its row count and age, the checkpoint
+manifest's status for the country and, with a snapshot database, how many
+restaurants are active and how many were added, removed or modified in
+the latest scrape (or since --since). Only reads files, so it needs
+neither a browser nor pandas.
+
+Usage:
+    python scrape_restaurants.py report
+    python scrape_restaurants.py report --snapshot-db restaurants.db --since 2025-01-01 --output report.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+from datetime import datetime
+
+from checkpoint import DEFAULT_MANIFEST
+from csv_utils import find_country_files
+
+
+REPORT_COLUMNS = ['Country', 'Rows', 'Updated', 'Status', 'Attempts', 'Active', 'Added', 'Removed', 'Modified']
+
+
+def count_rows(path):
+    """Data rows in a CSV file (quoted line breaks count as one row)."""
+    with open(path, newline='', encoding='utf-8') as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+
+def load_manifest(path):
+    """Per-country entries of a checkpoint manifest, or {} if there is none."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('countries', {})
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"Warning: Ignoring unreadable checkpoint {path}: {e}")
+        return {}
+
+
+def snapshot_counts(db_path, since=None):
+    """
+    Active restaurants and change counts per country from a snapshot database.
+
+    Changes are counted from the latest scrape of each country, or from
+    every scrape at or after since (an ISO timestamp). Returns
+    {code: {'Active': n, 'Added': n, 'Removed': n, 'Modified': n}}.
+    """
+    import snapshot_store
+
+    counts = {}
+    if not os.path.exists(db_path):
+        print(f"Warning: Snapshot database {db_path} not found")
+        return counts
+    conn = snapshot_store.connect(db_path)
+    try:
+        for row in conn.execute(
+            "SELECT country_code, COUNT(*) FROM restaurants WHERE removed_at IS NULL GROUP BY country_code"
+        ):
+            counts.setdefault(row[0], {})['Active'] = row[1]
+        if since:
+            changes = conn.execute(
+                "SELECT country_code, change, COUNT(*) FROM changes WHERE scraped_at >= ? "
+                "GROUP BY country_code, change", (since,)
+            )
+        else:
+            changes = conn.execute(
+                "SELECT c.country_code, c.change, COUNT(*) FROM changes c "
+                "JOIN (SELECT country_code, MAX(scraped_at) AS latest FROM changes GROUP BY country_code) l "
+                "ON c.country_code = l.country_code AND c.scraped_at = l.latest "
+                "GROUP BY c.country_code, c.change"
+            )
+        for code, change, count in changes:
+            counts.setdefault(code, {})[change.capitalize()] = count
+    finally:
+        conn.close()
+    return counts
+
+
+def build_report(country_codes=None, manifest=DEFAULT_MANIFEST, snapshot_db=None, since=None):
+    """One row per country with output files, manifest entries or snapshot data."""
+    csv_files = find_country_files(country_codes, 'csv')
+    parquet_files = find_country_files(country_codes, 'parquet')
+    countries = load_manifest(manifest)
+    snapshots = snapshot_counts(snapshot_db, since) if snapshot_db else {}
+
+    codes = set(csv_files) | set(parquet_files) | set(countries) | set(snapshots)
+    if country_codes:
+        codes &= set(country_codes)
+
+    rows = []
+    for code in sorted(codes):
+        entry = countries.get(code, {})
+        path = csv_files.get(code) or parquet_files.get(code)
+        row = {
+            'Country': code,
+            'Rows': count_rows(path) if code in csv_files else entry.get('rows', ''),
+            'Updated': datetime.fromtimestamp(os.path.getmtime(path)).isoformat(sep=' ', timespec='minutes') if path else '',
+            'Status': entry.get('status', ''),
+            'Attempts': entry.get('attempts', ''),
+        }
+        for column in ('Active', 'Added', 'Removed', 'Modified'):
+            row[column] = snapshots.get(code, {}).get(column, 0 if snapshot_db else '')
+        rows.append(row)
+    return rows
+
+
+def print_report(rows):
+    if not rows:
+        print("No country files, checkpoint entries or snapshots found.")
+        return
+    columns = [c for c in REPORT_COLUMNS if any(row[c] != '' for row in rows)]
+    widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print('  '.join(str(row[c]).ljust(widths[c]) for c in columns))
+    failed = [row['Country'] for row in rows if row['Status'] == 'failed']
+    print(f"{len(rows)} countries, {sum(row['Rows'] or 0 for row in rows)} rows")
+    if failed:
+        print(f"Failed in the last run: {', '.join(failed)}")
+
+
+def write_report(rows, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Report written to {path}")
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Summarise scraped AMEX Dining Benefits data per country')
+    parser.add_argument('--country', type=str, default='ALL', help='Comma-separated country codes or "ALL". Default: ALL')
+    parser.add_argument('--checkpoint', type=str, default=DEFAULT_MANIFEST, help=f'Checkpoint manifest to read the run status from. Default: {DEFAULT_MANIFEST}')
+    parser.add_argument('--snapshot-db', type=str, help='Snapshot database to count active restaurants and changes from')
+    parser.add_argument('--since', type=str, help='With --snapshot-db, count changes at or after this ISO timestamp instead of in the latest scrape')
+    parser.add_argument('--output', type=str, help='Also write the report to this CSV file')
+    args = parser.parse_args(argv)
+
+    country_codes = None
+    if args.country.upper() != 'ALL':
+        country_codes = [c.strip().upper() for c in args.country.split(',')]
+    rows = build_report(country_codes, manifest=args.checkpoint, snapshot_db=args.snapshot_db, since=args.since)
+    print_report(rows)
+    if args.output:
+        write_report(rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Offline parsing of restaurant tiles from a saved page source.
+
+Selenium's per-element lookups are an HTTP round-trip to chromedriver each,
+so extracting a few hundred tiles element by element is dominated by IPC.
+This module parses ``driver.page_source`` once with the standard library
+HTML parser and applies the same clean-up rules as
+``extract_details_from_restuarant_container`` so the CSV output is unchanged.
+"""
+
+import html
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+
+
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr',
+}
+
+# Elements that Selenium's .text puts on their own line
+BLOCK_ELEMENTS = {
+    'address', 'article', 'aside', 'blockquote', 'dd', 'div', 'dl', 'dt',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+    'section', 'table', 'tr', 'ul',
+}
+
+# Elements whose contents are never rendered as text
+HIDDEN_ELEMENTS = {'script', 'style', 'template', 'title', 'noscript'}
+
+GOOGLE_MAPS_PATTERNS = ['google.com/maps', 'goo.gl/maps', 'maps.app.goo.gl']
+
+
+class Element:
+    """Minimal DOM node supporting the selectors used by the scraper."""
+
+    __slots__ = ('tag', 'attrs', 'children', 'parent')
+
+    def __init__(self, tag, attrs=None, parent=None):
+        self.tag = tag
+        self.attrs = dict(attrs or {})
+        self.children = []
+        self.parent = parent
+
+    @property
+    def classes(self):
+        return (self.attrs.get('class') or '').split()
+
+    def get(self, attr, default=None):
+        return self.attrs.get(attr, default)
+
+    def iter(self):
+        """Yield all descendant elements in document order."""
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Element):
+                yield node
+                stack.extend(reversed(node.children))
+
+    def matches(self, simple_selector):
+        """Match a compound selector such as ``div.sc-kOPcWz`` or ``#flags``."""
+        tag, ids, classes = _parse_simple_selector(simple_selector)
+        if tag and tag != '*' and self.tag != tag:
+            return False
+        if ids and self.attrs.get('id') not in ids:
+            return False
+        if classes:
+            own = self.classes
+            if any(c not in own for c in classes):
+                return False
+        return True
+
+    def select(self, selector):
+        """Return descendants matching a (descendant-combinator) CSS selector."""
+        parts = selector.split()
+        candidates = [self]
+        for part in parts:
+            seen = set()
+            matched = []
+            for candidate in candidates:
+                for node in candidate.iter():
+                    if id(node) not in seen and node.matches(part):
+                        seen.add(id(node))
+                        matched.append(node)
+            candidates = matched
+        return candidates
+
+    def select_one(self, selector):
+        if ' ' not in selector.strip():
+            # Simple selector: stop at the first match instead of collecting all
+            return next((node for node in self.iter() if node.matches(selector)), None)
+        found = self.select(selector)
+        return found[0] if found else None
+
+    def find_by_id(self, element_id):
+        for node in self.iter():
+            if node.attrs.get('id') == element_id:
+                return node
+        return None
+
+    @property
+    def text(self):
+        """Approximate Selenium's rendered ``.text`` for this element."""
+        chunks = []
+        _collect_text(self, chunks)
+        lines = []
+        for line in ''.join(chunks).split('\n'):
+            line = re.sub(r'[ \t\r\f\v]+', ' ', line).strip()
+            if line:
+                lines.append(line)
+        return '\n'.join(lines)
+
+    @property
+    def inner_html(self):
+        """Serialise children the way Chrome's ``innerHTML`` does."""
+        return ''.join(_serialise(child) for child in self.children)
+
+
+@lru_cache(maxsize=None)
+def _parse_simple_selector(simple_selector):
+    tag = ''
+    ids = []
+    classes = []
+    for token in re.findall(r'[#.]?[^#.]+', simple_selector):
+        if token.startswith('#'):
+            ids.append(token[1:])
+        elif token.startswith('.'):
+            classes.append(token[1:])
+        else:
+            tag = token.lower()
+    return tag, ids, classes
+
+
+def _collect_text(node, chunks):
+    for child in node.children:
+        if isinstance(child, str):
+            chunks.append(child.replace('\n', ' ').replace('\xa0', ' '))
+            continue
+        if child.tag in HIDDEN_ELEMENTS:
+            continue
+        if child.tag == 'br':
+            chunks.append('\n')
+            continue
+        block = child.tag in BLOCK_ELEMENTS
+        if block:
+            chunks.append('\n')
+        _collect_text(child, chunks)
+        if block:
+            chunks.append('\n')
+
+
+def _escape_text(text):
+    return html.escape(text, quote=False).replace('\xa0', '&nbsp;')
+
+
+def _serialise(node):
+    if isinstance(node, str):
+        return _escape_text(node)
+    attrs = ''.join(
+        f' {name}="{html.escape(value or "", quote=True)}"'
+        if value is not None else f' {name}=""'
+        for name, value in node.attrs.items()
+    )
+    if node.tag in VOID_ELEMENTS:
+        return f'<{node.tag}{attrs}>'
+    inner = ''.join(_serialise(child) for child in node.children)
+    return f'<{node.tag}{attrs}>{inner}</{node.tag}>'
+
+
+class _TreeBuilder(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Element('#document')
+        self.current = self.root
+
+    def handle_starttag(self, tag, attrs):
+        element = Element(tag, attrs, parent=self.current)
+        self.current.children.append(element)
+        if tag not in VOID_ELEMENTS:
+            self.current = element
+
+    def handle_startendtag(self, tag, attrs):
+        element = Element(tag, attrs, parent=self.current)
+        self.current.children.append(element)
+
+    def handle_endtag(self, tag):
+        # Walk up to the matching open element; ignore stray end tags
+        node = self.current
+        while node is not None and node.tag != tag:
+            node = node.parent
+        if node is not None and node.parent is not None:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        self.current.children.append(data)
+
+
+def parse_html(page_source):
+    """Parse an HTML document into an ``Element`` tree."""
+    builder = _TreeBuilder()
+    builder.feed(page_source)
+    builder.close()
+    return builder.root
+
+
+def clean_restaurant_name(full_text, status):
+    """Strip the NEW / * markers from a tile's name text."""
+    # The text usually appears as "NEW\nRestaurantName\n*"
+    if "NEW" in status:
+        full_text = full_text.replace("NEW", "", 1)
+    if "*" in status:
+        full_text = full_text.replace("*", "", 1)
+
+    name = full_text.strip()
+    name = name.replace('\n', ' - ')  # In case there are still newlines
+    return name.strip(" -")
+
+
+def clean_address(address_html):
+    """Turn an address ``innerHTML`` into a single comma separated line."""
+    return address_html.strip().replace('<br>', ', ')
+
+
+def find_google_maps_link(hrefs):
+    """Return the first href that looks like a Google Maps link."""
+    for href in hrefs:
+        if href and any(x in href for x in GOOGLE_MAPS_PATTERNS):
+            # Decode HTML entities if any
+            return href.replace('&amp;', '&')
+    return ""
+
+
+def format_restaurant_record(restaurant_data, country_code, country_name):
+    """Prefix the address with the name, suffix it with the country and tag the country code."""
+    current_address = restaurant_data.get('Address', '')
+    restaurant_name = restaurant_data.get('Name', '')
+    # Only format if we have an address
+    if current_address:
+        restaurant_data['Address'] = f"{restaurant_name}, {current_address}, {country_name}"
+    restaurant_data['CountryCode'] = country_code
+    return restaurant_data
+
+
+def _has_asterisk_div(name_element):
+    # Mirrors the XPath .//div[contains(text(), '*')], which only looks at
+    # the first text node of each div
+    for node in name_element.iter():
+        if node.tag != 'div':
+            continue
+        first_text = next((c for c in node.children if isinstance(c, str)), None)
+        if first_text is not None and '*' in first_text:
+            return True
+    return False
+
+
+def extract_details_from_element(container, div_tags):
+    """Parsed-HTML equivalent of ``extract_details_from_restuarant_container``."""
+    name = ""
+    status = []
+
+    name_div = container.select_one(div_tags['name'])
+    if name_div is not None:
+        flag_div = name_div.find_by_id('flags')
+        if flag_div is not None and "NEW" in flag_div.text:
+            status.append("NEW")
+        if _has_asterisk_div(name_div):
+            status.append("*")
+        name = clean_restaurant_name(name_div.text, status)
+
+    address = ""
+    address_div = container.select_one(div_tags['address'])
+    if address_div is not None:
+        address = clean_address(address_div.inner_html)
+
+    cuisine = ""
+    cuisine_div = container.select_one(div_tags['cuisine'])
+    if cuisine_div is not None:
+        cuisine = cuisine_div.text
+
+    google_maps_link = find_google_maps_link(a.get('href') for a in container.select('a'))
+
+    return {
+        'Name': name,
+        'Address': address,
+        'Cuisine': cuisine,
+        'Status': ', '.join(status),
+        'Google_Maps_Link': google_maps_link,
+    }
+
+
+def extract_restaurants_from_html(page_source, div_tags, country_code, country_name):
+    """Extract every tile matching ``div_tags['restaurant']`` from a page source."""
+    root = parse_html(page_source) if isinstance(page_source, str) else page_source
+    restaurants = []
+    for container in root.select(div_tags['restaurant']):
+        restaurant_data = extract_details_from_element(container, div_tags)
+        restaurants.append(format_restaurant_record(restaurant_data, country_code, country_name))
+    return restaurants
@@ -0,0 +1,155 @@
+"""
+On-disk cache for start-up work that rarely changes between runs.
+
+Caches the chromedriver path resolved by ChromeDriverManager and the
+contents of robots.txt, each with a TTL. A stale entry is still used when
+refreshing fails (e.g. offline), so repeated cron runs and parallel workers
+start without touching the network. Page selectors are cached per page
+fingerprint and kept for as long as they match the page.
+
+The cache lives in ~/.cache/amex_dining_scraper unless
+AMEX_SCRAPER_CACHE_DIR is set.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+CACHE_DIR = os.environ.get(
+    'AMEX_SCRAPER_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'amex_dining_scraper'),
+)
+
+# Seconds before a cached entry is refreshed (set from --cache-ttl)
+TTL = 24 * 60 * 60
+
+# Ignore cached entries and resolve everything again (set from --refresh-cache)
+REFRESH = False
+
+
+def configure(ttl_hours=None, refresh=None, cache_dir=None):
+    global TTL, REFRESH, CACHE_DIR
+    if ttl_hours is not None:
+        TTL = ttl_hours * 60 * 60
+    if refresh is not None:
+        REFRESH = refresh
+    if cache_dir is not None:
+        CACHE_DIR = cache_dir
+
+
+def _path(name):
+    return os.path.join(CACHE_DIR, name)
+
+
+def _load(name):
+    try:
+        with open(_path(name), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store(name, entry):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    entry = dict(entry, cached_at=time.time())
+    # Write then rename so parallel workers never read a half-written file;
+    # the temp name is per thread as --workers sessions store concurrently
+    tmp = _path(f'{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(entry, f)
+    os.replace(tmp, _path(name))
+
+
+def _is_fresh(entry):
+    return entry is not None and not REFRESH and time.time() - entry.get('cached_at', 0) < TTL
+
+
+def cached_driver_path(install):
+    """
+    Return the chromedriver path, calling install() only when the cache is
+    missing, expired or points at a file that no longer exists.
+    """
+    entry = _load('chromedriver.json')
+    if _is_fresh(entry) and os.path.exists(entry['path']):
+        return entry['path']
+
+    try:
+        path = install()
+    except Exception as e:
+        if entry is not None and os.path.exists(entry['path']):
+            print(f"Could not resolve chromedriver ({e}), using cached {entry['path']}")
+            return entry['path']
+        raise
+    _store('chromedriver.json', {'path': path})
+    return path
+
+
+def cached_selectors(fingerprint, current, matches, discover):
+    """
+    Return the page selectors for the page version identified by fingerprint.
+
+    Uses the cached mapping if it still matches the page, then current,
+    and only calls discover() when neither does. Returns (selectors, source)
+    where source is 'cache', 'current', 'discovered' or None if nothing
+    matched (current is returned unchanged).
+    """
+    name = f'selectors-{fingerprint}.json'
+    entry = _load(name)
+    if entry is not None and not REFRESH and matches(entry['selectors']):
+        return entry['selectors'], 'cache'
+    if matches(current):
+        _store(name, {'selectors': current})
+        return current, 'current'
+    discovered = discover()
+    if discovered and matches(discovered):
+        _store(name, {'selectors': discovered})
+        return discovered, 'discovered'
+    return current, None
+
+
+def _fetch_robots(robots_url):
+    """Fetch robots.txt, mirroring RobotFileParser.read()'s handling of HTTP errors."""
+    # Imported here: urllib.request is slow to import and only needed when scraping
+    import urllib.error
+    import urllib.request
+
+    try:
+        with urllib.request.urlopen(robots_url, timeout=10) as response:
+            return {'status': 200, 'lines': response.read().decode('utf-8').splitlines()}
+    except urllib.error.HTTPError as err:
+        # 401/403 disallow everything, other 4xx allow everything
+        if 400 <= err.code < 500:
+            return {'status': err.code, 'lines': []}
+        raise
+
+
+def _parser_from_entry(robots_url, entry):
+    import urllib.robotparser
+
+    rp = urllib.robotparser.RobotFileParser()
+    rp.set_url(robots_url)
+    if entry['status'] in (401, 403):
+        rp.disallow_all = True
+    elif entry['status'] >= 400:
+        rp.allow_all = True
+    else:
+        rp.parse(entry['lines'])
+    return rp
+
+
+def cached_robots_parser(robots_url):
+    """Return a RobotFileParser for robots_url, from the cache when it is fresh."""
+    name = f"robots-{hashlib.sha1(robots_url.encode('utf-8')).hexdigest()[:16]}.json"
+    entry = _load(name)
+    if not _is_fresh(entry):
+        try:
+            entry = _fetch_robots(robots_url)
+            _store(name, entry)
+        except Exception as e:
+            if entry is None:
+                raise
+            print(f"Could not refresh robots.txt ({e}), using cached copy")
+    return _parser_from_entry(robots_url, entry)
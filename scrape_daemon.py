@@ -0,0 +1,309 @@
+"""
+Long-running scraper daemon with warm browser sessions.
+
+Keeps one or more Chrome sessions loaded on the dining benefit page and
+accepts scrape jobs over a small local HTTP API, so repeated country
+refreshes skip the cold start (browser launch, cookie banner, initial
+scroll). Each job reuses switch_country/scrape_restaurants on a warm
+session. Jobs for the same country run one at a time, since they write
+the same output files. Sessions are recycled after a number of jobs or
+after a failed scrape. Only the most recent finished jobs are kept for GET /jobs.
+
+Usage:
+    python scrape_daemon.py --sessions 2 --port 8765
+
+API:
+    POST /jobs        {"country": "GB", "format": "csv"}  -> 202 {"id": ..., "status": "queued"}
+    GET  /jobs        list queued, running and recent finished jobs
+    GET  /jobs/<id>   one job's status, row count and error
+    GET  /health      sessions and queue length
+"""
+
+import argparse
+import itertools
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import scrape_restaurants
+import waits
+from metrics import metrics
+from page_snapshots import snapshotter
+from scrape_restaurants import (
+    EXTRACTION_MODES,
+    OUTPUT_FORMATS,
+    SUB_LOCATION_MODES,
+    get_available_countries,
+    load_website,
+    scrape_country,
+)
+
+
+class Job:
+
+    _ids = itertools.count(1)
+
+    def __init__(self, country_code, output_format='csv', extraction=None, sub_location_mode=None):
+        self.id = next(self._ids)
+        self.country_code = country_code
+        self.output_format = output_format
+        self.extraction = extraction
+        self.sub_location_mode = sub_location_mode
+        self.status = 'queued'
+        self.rows = None
+        self.error = None
+        self.session = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'country': self.country_code,
+            'format': self.output_format,
+            'extraction': self.extraction,
+            'sub_locations': self.sub_location_mode,
+            'status': self.status,
+            'rows': self.rows,
+            'error': self.error,
+            'session': self.session,
+            'submitted_at': self.submitted_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class WarmSession(threading.Thread):
+    """One browser session that stays on the page and processes jobs from the queue."""
+
+    def __init__(self, index, daemon_state):
+        super().__init__(name=f'session-{index}', daemon=True)
+        self.index = index
+        self.state = daemon_state
+        self.driver = None
+        self.countries = {}
+        self.jobs_done = 0
+
+    def start_browser(self):
+        self.stop_browser()
+        print(f"[session {self.index}] Starting browser...")
+        self.driver = load_website(headless=self.state.headless,
+                                   capture_network=(self.state.extraction == 'cdp'),
+                                   lean=self.state.lean)
+        self.countries = get_available_countries(self.driver)
+        self.jobs_done = 0
+
+    def stop_browser(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+    def run(self):
+        while not self.state.stopping.is_set():
+            try:
+                job = self.state.jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self.process(job)
+        self.stop_browser()
+
+    def process(self, job):
+        job.status = 'running'
+        job.session = self.index
+        try:
+            if self.driver is None or self.jobs_done >= self.state.recycle_after:
+                self.start_browser()
+            if job.country_code not in self.countries:
+                # A bad request, not a broken session: keep the browser warm
+                job.status = 'failed'
+                job.error = f"Country '{job.country_code}' not found in available countries"
+                print(f"[session {self.index}] Job {job.id} failed: {job.error}")
+                return
+
+            # Jobs for the same country write the same output files
+            with self.state.country_lock(job.country_code):
+                restaurants = scrape_country(
+                    self.driver, job.country_code, self.countries[job.country_code],
+                    extraction=job.extraction or self.state.extraction,
+                    sub_location_mode=job.sub_location_mode or self.state.sub_location_mode,
+                    output_format=job.output_format,
+                )
+            self.jobs_done += 1
+            if restaurants is None:
+                raise RuntimeError(f"Scrape of {job.country_code} failed")
+            job.rows = len(restaurants)
+            job.status = 'done'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            # A failed page may have left the session in a bad state
+            print(f"[session {self.index}] Job {job.id} failed, recycling session: {e}")
+            self.stop_browser()
+        finally:
+            job.finished_at = time.time()
+            # The daemon never writes a metrics report, so don't keep a scope per job
+            metrics.clear_countries()
+
+
+class DaemonState:
+
+    def __init__(self, sessions=1, recycle_after=20, headless=True, extraction='html', sub_location_mode='modal',
+                 lean=False, keep_jobs=1000):
+        self.jobs = queue.Queue()
+        self.all_jobs = {}
+        self.keep_jobs = keep_jobs
+        self.lock = threading.Lock()
+        self.country_locks = {}
+        self.stopping = threading.Event()
+        self.recycle_after = recycle_after
+        self.headless = headless
+        self.extraction = extraction
+        self.sub_location_mode = sub_location_mode
+        self.lean = lean
+        self.sessions = [WarmSession(i, self) for i in range(sessions)]
+
+    def start(self, warm=True):
+        for session in self.sessions:
+            if warm:
+                try:
+                    session.start_browser()
+                except Exception as e:
+                    # The session retries on its first job
+                    print(f"[session {session.index}] Could not warm up: {e}")
+            session.start()
+
+    def stop(self):
+        self.stopping.set()
+        for session in self.sessions:
+            session.join(timeout=30)
+
+    def submit(self, job):
+        with self.lock:
+            self.all_jobs[job.id] = job
+            self._prune()
+        self.jobs.put(job)
+        return job
+
+    def country_lock(self, country_code):
+        with self.lock:
+            return self.country_locks.setdefault(country_code, threading.Lock())
+
+    def _prune(self):
+        # Forget the oldest finished jobs; queued and running ones are always kept
+        excess = len(self.all_jobs) - self.keep_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self.all_jobs.items() if job.finished_at is not None]
+        for job_id in finished[:excess]:
+            del self.all_jobs[job_id]
+
+
+def make_handler(state):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            print(f"[http] {format % args}")
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, {
+                    'sessions': [
+                        {'index': s.index, 'warm': s.driver is not None, 'jobs_done': s.jobs_done}
+                        for s in state.sessions
+                    ],
+                    'queued': state.jobs.qsize(),
+                })
+            elif self.path == '/jobs':
+                with state.lock:
+                    self._send(200, [job.as_dict() for job in state.all_jobs.values()])
+            elif self.path.startswith('/jobs/'):
+                try:
+                    job = state.all_jobs.get(int(self.path[len('/jobs/'):]))
+                except ValueError:
+                    job = None
+                if job is None:
+                    self._send(404, {'error': 'job not found'})
+                else:
+                    self._send(200, job.as_dict())
+            else:
+                self._send(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/jobs':
+                self._send(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(body, dict):
+                    raise ValueError("body must be a JSON object")
+                country_code = str(body['country']).upper()
+                output_format = body.get('format', 'csv')
+                extraction = body.get('extraction')
+                sub_location_mode = body.get('sub_locations')
+                if output_format not in OUTPUT_FORMATS:
+                    raise ValueError(f"format must be one of {OUTPUT_FORMATS}")
+                if extraction is not None and extraction not in EXTRACTION_MODES:
+                    raise ValueError(f"extraction must be one of {EXTRACTION_MODES}")
+                if sub_location_mode is not None and sub_location_mode not in SUB_LOCATION_MODES:
+                    raise ValueError(f"sub_locations must be one of {SUB_LOCATION_MODES}")
+            except (KeyError, ValueError) as e:
+                self._send(400, {'error': f'invalid job: {e}'})
+                return
+            job = state.submit(Job(country_code, output_format, extraction, sub_location_mode))
+            self._send(202, job.as_dict())
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the AMEX Dining Benefits scraper as a daemon with warm browser sessions')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on. Default: 127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on. Default: 8765')
+    parser.add_argument('--sessions', type=int, default=1, help='Number of warm browser sessions. Default: 1')
+    parser.add_argument('--recycle-after', type=int, default=20, help='Restart a session after this many jobs. Default: 20')
+    parser.add_argument('--extraction', choices=EXTRACTION_MODES, default='html', help='Default extraction mode for jobs. Default: html')
+    parser.add_argument('--sub-locations', choices=SUB_LOCATION_MODES, default='modal', help='Default sub-location mode for jobs. Default: modal')
+    parser.add_argument('--wait-timeout', type=float, default=waits.DEFAULT_TIMEOUT, help=f'Seconds to wait for the page to settle. Default: {waits.DEFAULT_TIMEOUT}')
+    parser.add_argument('--visible', action='store_true', help='Run with visible browser windows')
+    parser.add_argument('--lean', action='store_true', help='Lightweight browser profile (block images, fonts and trackers, eager page loads)')
+    parser.add_argument('--keep-jobs', type=int, default=1000, help='Finished jobs to keep for GET /jobs. Default: 1000')
+    parser.add_argument('--debug', action='store_true', help='Enable debug output')
+    args = parser.parse_args()
+
+    scrape_restaurants.debug = args.debug
+    waits.DEFAULT_TIMEOUT = args.wait_timeout
+
+    state = DaemonState(sessions=max(1, args.sessions), recycle_after=max(1, args.recycle_after),
+                        headless=not args.visible, extraction=args.extraction,
+                        sub_location_mode=args.sub_locations, lean=args.lean, keep_jobs=max(0, args.keep_jobs))
+    state.start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Scraper daemon listening on http://{args.host}:{args.port} with {len(state.sessions)} sessions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        state.stop()
+        snapshotter.flush()
+        print("Browsers closed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,38 +3,83 @@ Script to scrape restaurants from American Express UK Dining Benefit page
 and save them to a CSV file.
 """
 
-from ast import parse
-from logging import raiseExceptions
-from sys import exception
 import time
-import csv
-import re
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from webdriver_manager.chrome import ChromeDriverManager
-import pandas as pd
-import urllib.robotparser
-from csv_utils import combine_amex_restaurants
+import records
+from metrics import metrics, METRICS_FORMATS
+from restaurant_parsing import (
+    clean_address,
+    clean_restaurant_name,
+    extract_details_from_element,
+    extract_restaurants_from_html,
+    find_google_maps_link,
+    format_restaurant_record,
+    parse_html,
+)
+
+
+# Verbose output, set from --debug
+debug = False
+
+# Hashed styled-components class names used to locate restaurant data
+location_div_tags = {
+    'restaurant': 'div.sc-kOPcWz',
+    'name': 'div.sc-dCFHLb',
+    'address': 'div.sc-fhzFiK',
+    'cuisine': 'div.sc-jxOSlx',
+}
+sub_location_div_tags = {
+    'restaurant': 'div.sc-dhKdcB',
+    'name': 'h2.sc-eldPxv',
+    'address': 'div.sc-fPXMVe',
+    'cuisine': 'div.sc-gFqAkR',
+}
+view_locations_button = 'button.sc-fXSgeo'
+close_locations_button = 'button.sc-iHGNWf'
+# Whether the modal selectors were checked against an open modal since the
+# selectors were last resolved
+modal_selectors_checked = False
+
+EXTRACTION_MODES = ['selenium', 'html', 'js', 'cdp']
+SUB_LOCATION_MODES = ['modal', 'bulk']
+OUTPUT_FORMATS = ['csv', 'parquet', 'both']
+
+# Requests blocked by the lean profile: we only read text and hrefs, so
+# images, media, fonts and third-party trackers are wasted bandwidth
+LEAN_BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.ico',
+    '*.mp4', '*.webm', '*.mp3', '*.m3u8',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*facebook.net*', '*facebook.com/tr*', '*hotjar.com*', '*demdex.net*',
+    '*omtrdc.net*', '*bing.com/action*', '*linkedin.com/px*', '*quantserve.com*',
+]
+
+# Chrome features the lean profile switches off
+LEAN_CHROME_ARGUMENTS = [
+    '--blink-settings=imagesEnabled=false',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-translate',
+    '--disable-notifications',
+    '--mute-audio',
+    '--no-first-run',
+]
 
 
 def check_robots_txt(url_to_check, user_agent='*'):
     # 1. Parse the base domain to find the robots.txt location
     from urllib.parse import urlparse
+    import run_cache
     
     parsed_url = urlparse(url_to_check)
     robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
 
-    # 2. Initialize the parser
-    rp = urllib.robotparser.RobotFileParser()
-    rp.set_url(robots_url)
-    
+    # 2. Initialize the parser (cached across runs)
     try:
-        rp.read()
+        rp = run_cache.cached_robots_parser(robots_url)
     except Exception as e:
         print(f"Could not read robots.txt: {e}")
         return False
@@ -49,9 +94,24 @@ def check_robots_txt(url_to_check, user_agent='*'):
     
     return can_fetch
 
-def setup_driver(headless=True):
-    """Setup and return a Chrome WebDriver instance."""
+def setup_driver(headless=True, capture_network=False, lean=False):
+    """
+    Setup and return a Chrome WebDriver instance.
+
+    lean=True blocks images, media, fonts and trackers, switches off unneeded
+    Chrome features and returns from driver.get() at DOMContentLoaded (the
+    condition-based waits take it from there).
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+    import cdp_capture
+    import run_cache
+
     chrome_options = Options()
+    if capture_network:
+        cdp_capture.enable_performance_logging(chrome_options)
     if headless:
         chrome_options.add_argument('--headless')  # Run in background
     chrome_options.add_argument('--no-sandbox')
@@ -61,78 +121,157 @@ def setup_driver(headless=True):
     chrome_options.add_experimental_option('useAutomationExtension', False)
     chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
     chrome_options.add_argument('--window-size=1920,1080')
+    if lean:
+        chrome_options.page_load_strategy = 'eager'
+        for argument in LEAN_CHROME_ARGUMENTS:
+            chrome_options.add_argument(argument)
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.default_content_setting_values.notifications': 2,
+            'profile.default_content_setting_values.geolocation': 2,
+            'profile.default_content_setting_values.media_stream': 2,
+        })
     
     try:
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        return driver
+        with metrics.phase('chromedriver_install'):
+            driver_path = run_cache.cached_driver_path(lambda: ChromeDriverManager().install())
+        with metrics.phase('browser_start'):
+            service = Service(driver_path)
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+        if lean:
+            block_resources(driver)
+        return metrics.instrument_driver(driver)
     except Exception as e:
         print(f"Error setting up Chrome driver: {e}")
         print("Make sure Google Chrome is installed on your system")
         raise
 
-def load_website(headless=True):
+def block_resources(driver, patterns=None):
+    """Block requests matching patterns (default LEAN_BLOCKED_URLS) through CDP."""
+    patterns = LEAN_BLOCKED_URLS if patterns is None else patterns
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+        if debug:
+            print(f"Blocking {len(patterns)} URL patterns")
+    except Exception as e:
+        # Still usable, just heavier
+        print(f"Warning: Could not enable resource blocking: {e}")
+
+def load_website(headless=True, capture_network=False, lean=False):
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    import waits
 
     print("Setting up browser...")
-    driver = setup_driver(headless=headless)
+    driver = setup_driver(headless=headless, capture_network=capture_network, lean=lean)
 
     """Load the HTML of the page."""
     url = 'https://www.americanexpress.com/en-gb/benefits/diningbenefit/'
-    can_fetch = check_robots_txt(url)
+    with metrics.phase('robots_txt'):
+        can_fetch = check_robots_txt(url)
     if not can_fetch:
         return driver
 
     print(f"Loading page: {url}")
-    driver.get(url)
+    with metrics.phase('page_load'):
+        driver.get(url)
 
     
     # Wait for page to load
     print("Waiting for page to load...")
 
-    # Dismiss Cookie Question
-    cookie_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.ID, "user-consent-management-granular-banner-decline-all-button")))
-    cookie_button.click()
-    
-    
-    # Wait for any restaurant content to appear
-    try:
-        WebDriverWait(driver, 15).until(
-            lambda d: len(d.find_elements(By.CSS_SELECTOR, "div, article, section")) > 10
-        )
-    except TimeoutException:
-        print("Warning: Page may not have loaded completely")
-
-    # Scroll to load dynamic content
-    print("Scrolling to load all content...")
-    last_height = driver.execute_script("return document.body.scrollHeight")
-    scroll_attempts = 0
-    max_scrolls = 15  # Increased scroll attempts
-    
-    while scroll_attempts < max_scrolls:
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(1)  # Increased wait between scrolls
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        if new_height == last_height:
-            scroll_attempts += 1
-            if scroll_attempts >= 3:  # If height doesn't change 3 times, break
-                break
-        else:
-            scroll_attempts = 0
-        last_height = new_height
-    
-    # Scroll back to top slowly
-    print("Scrolling back to top...")
-    driver.execute_script("window.scrollTo(0, 0);")
-    time.sleep(1)
+    with metrics.phase('page_ready'):
+        # Dismiss Cookie Question
+        cookie_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.ID, "user-consent-management-granular-banner-decline-all-button")))
+        cookie_button.click()
+        
+        
+        # Wait for any restaurant content to appear
+        try:
+            WebDriverWait(driver, 15).until(
+                lambda d: len(d.find_elements(By.CSS_SELECTOR, "div, article, section")) > 10
+            )
+        except TimeoutException:
+            metrics.count('wait_timeouts')
+            print("Warning: Page may not have loaded completely")
+
+    resolve_selectors(driver)
+
+    # Make sure lazy-loaded tiles are rendered (usually no scrolling needed)
+    print("Loading all content...")
+    with metrics.phase('scroll'):
+        waits.load_all_tiles(driver, location_div_tags['restaurant'], max_scrolls=15)
     
-    # Always save HTML for debugging
-    print("\nSaving page HTML for inspection...")
-    save_page_html(driver)
+    # Save HTML for debugging if the snapshot policy asks for it
+    with metrics.phase('save_page_html'):
+        save_page_html(driver)
 
     return driver
 
+def current_selectors():
+    """The selectors in use, as a JSON-friendly mapping."""
+    return {
+        'location': dict(location_div_tags),
+        'sub_location': dict(sub_location_div_tags),
+        'view_locations_button': view_locations_button,
+        'close_locations_button': close_locations_button,
+    }
+
+
+def resolve_selectors(driver, check_modal=False):
+    """
+    Make sure the module-level selectors match the loaded page.
+
+    Cached selectors for this page version are used if they still match,
+    then the current ones; structural discovery only runs when neither
+    does. With check_modal the sub-location and close selectors must also
+    match a chain's modal. Returns True if the selectors changed.
+    """
+    global view_locations_button, close_locations_button, modal_selectors_checked
+    import page_selectors
+    import run_cache
+
+    def matches(selectors):
+        if not page_selectors.selectors_match(driver, selectors):
+            return False
+        return not check_modal or page_selectors.modal_selectors_match(driver, selectors)
+
+    modal_selectors_checked = check_modal
+    current = current_selectors()
+    with metrics.phase('selectors'):
+        try:
+            selectors, source = run_cache.cached_selectors(
+                page_selectors.page_fingerprint(driver), current,
+                matches=matches,
+                discover=lambda: page_selectors.discover_selectors(driver, current),
+            )
+        except Exception as e:
+            print(f"Warning: Could not resolve selectors: {e}")
+            return False
+    if source is None:
+        print("Warning: Restaurant selectors do not match the page and could not be discovered")
+        return False
+    if source == 'discovered':
+        metrics.count('selector_discoveries')
+        print(f"Discovered new page selectors: {selectors}")
+    elif debug:
+        print(f"Using {source} selectors")
+
+    # Update in place so modules that imported the dicts see the new selectors
+    location_div_tags.update(selectors['location'])
+    sub_location_div_tags.update(selectors['sub_location'])
+    view_locations_button = selectors['view_locations_button']
+    close_locations_button = selectors['close_locations_button']
+    return selectors != current
+
+
 def get_available_countries(driver):
     """Get list of available country codes and names."""
+    from selenium.webdriver.common.by import By
+
     try:
         select = driver.find_element(By.ID, "country")
         options = select.find_elements(By.TAG_NAME, "option")
@@ -147,26 +286,51 @@ def get_available_countries(driver):
         print(f"Error getting available countries: {e}")
         return {}
 
+# Sets the #country select and fires its change event; returns whether the value changed
+SWITCH_COUNTRY_JS = """
+    const select = document.getElementById('country');
+    const changed = select.value !== arguments[0];
+    select.value = arguments[0];
+    select.dispatchEvent(new Event('change', { bubbles: true }));
+    return changed;
+"""
+
+SELECTED_COUNTRY_JS = "return document.getElementById('country').value;"
+
+
 def switch_country(driver, country_code):
     """Switch the country dropdown."""
     print(f"Switching to country code: {country_code}")
+    with metrics.phase('switch_country'):
+        _switch_country(driver, country_code)
+
+
+def _switch_country(driver, country_code):
+    from selenium.common.exceptions import TimeoutException
+    import waits
+
     try:
+        before = waits.page_state(driver)['mutations']
+
         # Use JavaScript to set value and trigger change event (as found in exploration)
-        driver.execute_script("""
-            const select = document.getElementById('country');
-            select.value = arguments[0];
-            select.dispatchEvent(new Event('change', { bubbles: true }));
-        """, country_code)
+        changed = driver.execute_script(SWITCH_COUNTRY_JS, country_code)
         
-        # Wait for content to update
+        # Wait for content to update; each wait gets its own chance, so a
+        # page that never goes idle still gets checked for tiles
         print("Waiting for content update...")
-        time.sleep(3) # Give it a moment to start loading
-        
-        # Wait for restaurant containers to be present
+        if changed:
+            try:
+                # Wait for the list to start re-rendering
+                waits.wait_for_dom_change(driver, before)
+            except TimeoutException:
+                print("Warning: The restaurant list did not change after switching country.")
         try:
-            WebDriverWait(driver, 15).until(
-                lambda d: len(d.find_elements(By.CSS_SELECTOR, "div.sc-kOPcWz")) > 0
-            )
+            waits.wait_for_page_idle(driver)
+        except TimeoutException:
+            print("Warning: The page did not settle after switching country.")
+        try:
+            # Wait for restaurant containers to be present
+            waits.wait_for_present(driver, location_div_tags['restaurant'])
         except TimeoutException:
             print("Warning: Content update timed out or no restaurants found for this country.")
             
@@ -174,17 +338,26 @@ def switch_country(driver, country_code):
         print(f"Error switching country: {e}")
         raise
 
-def save_page_html(driver, filename_params=''):
-    """Always save page HTML for debugging."""
-    filename = f'page_source{filename_params}.html'
+def save_page_html(driver, filename_params='', error=False):
+    """
+    Save page HTML for debugging, according to the --page-snapshots policy.
+
+    The page source is read here; compressing and writing it happens in the
+    background.
+    """
+    from page_snapshots import snapshotter
+
+    if not snapshotter.wants(error):
+        return
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(driver.page_source)
-        print(f"Page HTML saved to '{filename}' for debugging.")
+        filename = snapshotter.capture(driver, filename_params, error=error)
+        print(f"Saving page HTML to '{filename}' for inspection...")
     except Exception as e:
         print(f"Warning: Could not save HTML file: {e}")
 
 def extract_details_from_restuarant_container(restaurant_container, div_tags):
+    from selenium.common.exceptions import NoSuchElementException
+    from selenium.webdriver.common.by import By
 
     # Extract Name and Status
     name = ""
@@ -212,28 +385,8 @@ def extract_details_from_restuarant_container(restaurant_container, div_tags):
         except Exception:
             pass
 
-        # Get the full text and clean it up
-        full_text = name_div.text
-        
-        # Remove "NEW" if we found it (it comes from the flags div text)
-        if "NEW" in status:
-            # The text usually appears as "NEW\nRestaurantName" or "NEWRestaurantName" depending on layout
-            # But name_div.text includes all visible text.
-            # We can try to get the text of valid children and subtract, or simpler:
-            # The structure is <div flags>NEW</div> TextNode <div star>*</div>
-            
-            # Let's try to get just the text node. Selenium doesn't support getting text nodes directly easily.
-            # We can replace the known parts.
-            full_text = full_text.replace("NEW", "", 1)
-            
-        if "*" in status:
-            full_text = full_text.replace("*", "", 1)
-            
-        name = full_text.strip()
-        name = name.replace('\n', ' - ') # In case there are still newlines
-        
-        # Clean up any leading/trailing " - " or whitespace resulting from replacement
-        name = name.strip(" -")
+        # Get the full text and strip the NEW / * markers we found
+        name = clean_restaurant_name(name_div.text, status)
         
     except Exception as e:
         print(f"Error extracting name: {e}")
@@ -248,7 +401,7 @@ def extract_details_from_restuarant_container(restaurant_container, div_tags):
         if debug:
             print(address) 
         # Replace line breaks with commas
-        address = address.replace('<br>', ', ')
+        address = clean_address(address)
         if debug:
             print(address) 
     
@@ -266,15 +419,8 @@ def extract_details_from_restuarant_container(restaurant_container, div_tags):
         # Get all links in the container
         all_links = restaurant_container.find_elements(By.TAG_NAME, "a")
         
-        for link in all_links:
-            href = link.get_attribute('href')
-            if href:
-                # Check for common Google Maps URL patterns
-                if any(x in href for x in ['google.com/maps', 'goo.gl/maps', 'maps.app.goo.gl']):
-                    google_maps_link = href
-                    # Decode HTML entities if any
-                    google_maps_link = google_maps_link.replace('&amp;', '&')
-                    break
+        # Check for common Google Maps URL patterns (hrefs are fetched lazily)
+        google_maps_link = find_google_maps_link(link.get_attribute('href') for link in all_links)
     except Exception as e:
         print(f"Error extracting map link: {e}")
     
@@ -290,124 +436,396 @@ def extract_details_from_restuarant_container(restaurant_container, div_tags):
     return restaurant_data
 
 
-def scrape_restaurants(driver, country_code, country_name): 
+def check_modal_selectors(driver):
+    """
+    Before the first modal is opened, make sure the cached sub-location and
+    close selectors match a real modal, rediscovering them if not.
+    """
+    if not modal_selectors_checked:
+        resolve_selectors(driver, check_modal=True)
+
+
+def open_sub_locations(driver, view_location_btn):
+    """Open a chain's "view locations" modal and wait for its tiles."""
+    import waits
+
+    check_modal_selectors(driver)
+    metrics.count('modals_opened')
+    with metrics.phase('modal_open'):
+        view_location_btn.click()
+        # Wait until the modal's tile count stops changing
+        waits.wait_for_count_stable(driver, sub_location_div_tags["restaurant"])
+
+
+def close_sub_locations(driver):
+    """Close the open "view locations" modal and wait for it to disappear."""
+    from selenium.webdriver.common.by import By
+    import waits
+
+    with metrics.phase('modal_close'):
+        close_button = driver.find_element(By.CSS_SELECTOR, close_locations_button)
+        close_button.click()
+
+        waits.wait_for_absent(driver, close_locations_button)
+
+
+# Opens every chain's modal in turn inside the browser and returns the
+# outerHTML of its sub-location tiles, so the whole open/read/close cycle
+# for all chains costs a single WebDriver call.
+BULK_SUB_LOCATIONS_JS = """
+const [tileSel, buttonSel, subSel, closeSel, timeoutMs, done] = arguments;
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+async function waitFor(condition) {
+    const start = performance.now();
+    while (performance.now() - start < timeoutMs) {
+        if (condition()) return;
+        await sleep(50);
+    }
+    throw new Error('timed out after ' + timeoutMs + 'ms');
+}
+async function run() {
+    const tiles = Array.from(document.querySelectorAll(tileSel));
+    const results = [];
+    for (let index = 0; index < tiles.length; index++) {
+        const button = tiles[index].querySelector(buttonSel);
+        if (!button) continue;
+        try {
+            button.click();
+            // Wait until the modal's tile count is non-zero and stable
+            let last = -1;
+            await waitFor(() => {
+                const count = document.querySelectorAll(subSel).length;
+                const stable = count > 0 && count === last;
+                last = count;
+                return stable;
+            });
+            const html = Array.from(document.querySelectorAll(subSel), el => el.outerHTML);
+            const close = document.querySelector(closeSel);
+            if (close) close.click();
+            await waitFor(() => !document.querySelector(closeSel));
+            results.push({index: index, html: html});
+        } catch (e) {
+            results.push({index: index, error: String(e)});
+        }
+    }
+    return results;
+}
+run().then(done, e => done([{index: -1, error: String(e)}]));
+"""
+
+
+def fetch_sub_locations_in_bulk(driver, country_code, country_name):
+    """
+    Read every chain's sub-locations with one in-browser script.
+
+    Returns a dict mapping the chain's tile index to its sub-location records.
+    Chains that failed are left out so the caller can fall back to the modal.
+    """
+    import waits
+
+    chain_count = driver.execute_script(
+        "return document.querySelectorAll(arguments[0]).length;",
+        f"{location_div_tags['restaurant']} {view_locations_button}",
+    )
+    if not chain_count:
+        return {}
+
+    check_modal_selectors(driver)
+    print(f"Fetching sub-locations for {chain_count} chains in bulk...")
+    timeout = waits.DEFAULT_TIMEOUT
+    # Each chain may need up to two waits (open and close)
+    driver.set_script_timeout(timeout * 2 * chain_count + 10)
+    metrics.count('modals_opened', chain_count)
+    with metrics.phase('sub_locations_bulk'):
+        results = driver.execute_async_script(
+            BULK_SUB_LOCATIONS_JS,
+            location_div_tags['restaurant'], view_locations_button,
+            sub_location_div_tags['restaurant'], close_locations_button,
+            int(timeout * 1000),
+        )
+
+    sub_locations = {}
+    for result in results:
+        if 'error' in result:
+            print(f"Warning: Could not read sub-locations for tile {result['index']}: {result['error']}")
+            continue
+        sub_locations[result['index']] = extract_restaurants_from_html(
+            ''.join(result['html']), sub_location_div_tags, country_code, country_name
+        )
+    return sub_locations
+
+
+def extract_restaurants_with_selenium(driver, country_code, country_name, sub_locations=None):
+    """
+    Extract restaurants element by element through WebDriver.
+
+    sub_locations optionally maps chain tile indexes to records that were
+    already fetched, so their modals don't need to be opened here.
+    """
+    from selenium.webdriver.common.by import By
+
+    sub_locations = sub_locations or {}
+    restaurants = []
+    
+    # Based on HTML analysis, restaurants are structured as:
+    # Name: <div class="sc-dCFHLb..."><div id="flags"></div>RESTAURANT_NAME</div>
+    # Address: <div class="sc-fhzFiK...">ADDRESS</div>
+    
+    # Find all restaurant name containers and extract details from parent
+    try:
+        # Find divs with class containing "sc-dCFHLb" that have a flags div inside
+        restaurant_containers = driver.find_elements(By.CSS_SELECTOR, location_div_tags['restaurant'])
+        print(f"Found {len(restaurant_containers)} restaurant containers")
+
+        for index, restaurant_container in enumerate(restaurant_containers):
+            try:
+                if index in sub_locations:
+                    restaurants.extend(sub_locations[index])
+                    continue
+
+                view_location_btn = restaurant_container.find_elements(By.CSS_SELECTOR, view_locations_button)
+
+                if len(view_location_btn) > 0:
+
+                    # Open Sub Restaurant List
+                    open_sub_locations(driver, view_location_btn[0])
+                    sub_restaurant_containers = driver.find_elements(By.CSS_SELECTOR, sub_location_div_tags["restaurant"])
+                    print(f"Found {len(sub_restaurant_containers)} sub-restaurant containers")
+                    for sub_restaurant_container in sub_restaurant_containers:
+                        restaurant_data = extract_details_from_restuarant_container(sub_restaurant_container, sub_location_div_tags)
+                        # Format Address: Name, Address, Country Name
+                        restaurants.append(format_restaurant_record(restaurant_data, country_code, country_name))
+                    # Close Sub Restaurant List
+                    close_sub_locations(driver)
+
+                else:
+                    restaurant_data = extract_details_from_restuarant_container(restaurant_container, location_div_tags)
+                    # Format Address: Name, Address, Country Name
+                    restaurants.append(format_restaurant_record(restaurant_data, country_code, country_name))
+                
+            except Exception as e:
+                print(f"Error extracting individual restaurant: {e}")
+                continue
             
-    location_div_tags = {
-        'restaurant': 'div.sc-kOPcWz',
-        'name': 'div.sc-dCFHLb',
-        'address': 'div.sc-fhzFiK',
-        'cuisine': 'div.sc-jxOSlx',
+    except Exception as e:
+        print(f"Error extracting restaurants: {e}")
+        import traceback
+        traceback.print_exc()
+
+    return restaurants
+
+
+# Reads the raw fields of every tile matching div_tags['restaurant'] in one
+# call. Clean-up (NEW/* stripping, <br> and &amp; handling) stays in Python.
+TILE_FIELDS_JS = """
+const tags = arguments[0];
+function hasAsteriskDiv(root) {
+    // Same test as the XPath .//div[contains(text(), '*')]: first text node only
+    for (const div of root.querySelectorAll('div')) {
+        const text = Array.from(div.childNodes).find(n => n.nodeType === Node.TEXT_NODE);
+        if (text && text.textContent.includes('*')) return true;
     }
-    sub_location_div_tags = {
-        'restaurant': 'div.sc-dhKdcB',
-        'name': 'h2.sc-eldPxv',
-        'address': 'div.sc-fPXMVe',
-        'cuisine': 'div.sc-gFqAkR',
+    return false;
+}
+return Array.from(document.querySelectorAll(tags.restaurant), tile => {
+    const name = tile.querySelector(tags.name);
+    const flags = name ? name.querySelector('#flags') : null;
+    const address = tile.querySelector(tags.address);
+    const cuisine = tile.querySelector(tags.cuisine);
+    return {
+        name: name ? name.innerText : null,
+        flags: flags ? flags.innerText : '',
+        asterisk: name ? hasAsteriskDiv(name) : false,
+        address: address ? address.innerHTML : null,
+        cuisine: cuisine ? cuisine.innerText : '',
+        hrefs: Array.from(tile.querySelectorAll('a'), a => a.href),
+        chain: tags.button ? tile.querySelector(tags.button) !== null : false
+    };
+});
+"""
+
+
+def read_tile_fields(driver, div_tags, button=None):
+    """Fetch the raw fields of every tile matching div_tags with a single execute_script call."""
+    return driver.execute_script(TILE_FIELDS_JS, dict(div_tags, button=button))
+
+
+def restaurant_from_tile_fields(fields):
+    """Apply the scraper's clean-up rules to the raw fields returned by TILE_FIELDS_JS."""
+    status = []
+    if fields['flags'] and "NEW" in fields['flags']:
+        status.append("NEW")
+    if fields['asterisk']:
+        status.append("*")
+
+    return {
+        'Name': clean_restaurant_name(fields['name'], status) if fields['name'] is not None else "",
+        'Address': clean_address(fields['address']) if fields['address'] is not None else "",
+        'Cuisine': fields['cuisine'].strip(),
+        'Status': ', '.join(status),
+        'Google_Maps_Link': find_google_maps_link(fields['hrefs']),
     }
 
+
+def extract_restaurants_with_script(driver, country_code, country_name, sub_locations=None):
+    """
+    Extract restaurants with one execute_script call for all tiles.
+
+    Chains not already in sub_locations (tile index -> records) still have
+    their modal opened, but each modal is also read with a single call.
+    """
+    from selenium.webdriver.common.by import By
+
+    sub_locations = sub_locations or {}
+    restaurants = []
+
+    try:
+        tiles = read_tile_fields(driver, location_div_tags, button=view_locations_button)
+        print(f"Found {len(tiles)} restaurant containers")
+
+        live_containers = None
+        for index, fields in enumerate(tiles):
+            try:
+                if index in sub_locations:
+                    restaurants.extend(sub_locations[index])
+                elif fields['chain']:
+                    if live_containers is None:
+                        live_containers = driver.find_elements(By.CSS_SELECTOR, location_div_tags['restaurant'])
+                    view_location_btn = live_containers[index].find_element(By.CSS_SELECTOR, view_locations_button)
+
+                    open_sub_locations(driver, view_location_btn)
+                    sub_tiles = read_tile_fields(driver, sub_location_div_tags)
+                    print(f"Found {len(sub_tiles)} sub-restaurant containers")
+                    for sub_fields in sub_tiles:
+                        restaurant_data = restaurant_from_tile_fields(sub_fields)
+                        restaurants.append(format_restaurant_record(restaurant_data, country_code, country_name))
+                    close_sub_locations(driver)
+                else:
+                    restaurant_data = restaurant_from_tile_fields(fields)
+                    restaurants.append(format_restaurant_record(restaurant_data, country_code, country_name))
+            except Exception as e:
+                print(f"Error extracting individual restaurant: {e}")
+                continue
+
+    except Exception as e:
+        print(f"Error extracting restaurants: {e}")
+        import traceback
+        traceback.print_exc()
+
+    return restaurants
+
+
+# outerHTML of every tile matching a selector, e.g. the open modal's sub-locations
+TILE_HTML_JS = "return Array.from(document.querySelectorAll(arguments[0]), tile => tile.outerHTML);"
+
+
+def extract_restaurants_from_page_source(driver, country_code, country_name, sub_locations=None):
+    """
+    Extract restaurants by parsing driver.page_source in-process.
+
+    Plain tiles cost no WebDriver calls at all. Chains still need their modal
+    opened in the browser, but each modal's tiles are read with a single
+    execute_script call (just their HTML, not the whole page) instead of
+    several lookups per sub-location. Chains already present
+    in sub_locations (tile index -> records) are taken from there.
+    """
+    from selenium.webdriver.common.by import By
+
+    sub_locations = sub_locations or {}
+    restaurants = []
+
+    try:
+        root = parse_html(driver.page_source)
+        restaurant_containers = root.select(location_div_tags['restaurant'])
+        print(f"Found {len(restaurant_containers)} restaurant containers")
+
+        live_containers = None
+        for index, restaurant_container in enumerate(restaurant_containers):
+            try:
+                if index in sub_locations:
+                    restaurants.extend(sub_locations[index])
+                elif restaurant_container.select_one(view_locations_button) is not None:
+                    # Only chains need the live DOM, fetch the element handles once
+                    if live_containers is None:
+                        live_containers = driver.find_elements(By.CSS_SELECTOR, location_div_tags['restaurant'])
+                    view_location_btn = live_containers[index].find_element(By.CSS_SELECTOR, view_locations_button)
+
+                    open_sub_locations(driver, view_location_btn)
+                    tile_html = driver.execute_script(TILE_HTML_JS, sub_location_div_tags['restaurant'])
+                    sub_restaurants = extract_restaurants_from_html(
+                        ''.join(tile_html), sub_location_div_tags, country_code, country_name
+                    )
+                    print(f"Found {len(sub_restaurants)} sub-restaurant containers")
+                    restaurants.extend(sub_restaurants)
+                    close_sub_locations(driver)
+                else:
+                    restaurant_data = extract_details_from_element(restaurant_container, location_div_tags)
+                    restaurants.append(format_restaurant_record(restaurant_data, country_code, country_name))
+            except Exception as e:
+                print(f"Error extracting individual restaurant: {e}")
+                continue
+
+    except Exception as e:
+        print(f"Error extracting restaurants: {e}")
+        import traceback
+        traceback.print_exc()
+
+    return restaurants
+
+
+def scrape_restaurants(driver, country_code, country_name, extraction='selenium', sub_location_mode='modal'):
+    import cdp_capture
+    import waits
+
     try:        
+        # Selecting the country that is already shown fetches nothing, so keep
+        # the buffered page-load traffic in that case
+        if extraction == 'cdp' and driver.execute_script(SELECTED_COUNTRY_JS) != country_code:
+            # Only look at traffic caused by this country switch
+            cdp_capture.drain_performance_log(driver)
+
         # Switch to the requested country
         switch_country(driver, country_code)
         
-        # Scroll to load dynamic content (needs to be done AFTER switching country)
-        print("Scrolling to load all content...")
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        scroll_attempts = 0
-        max_scrolls = 20
-        
-        while scroll_attempts < max_scrolls:
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(1.5)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                scroll_attempts += 1
-                if scroll_attempts >= 3:
-                    break
-            else:
-                scroll_attempts = 0
-            last_height = new_height
-            
-        driver.execute_script("window.scrollTo(0, 0);")
-        
-        print(f"Extracting restaurant data for {country_code}...")
-        
-        restaurants = []
+        if extraction == 'cdp':
+            with metrics.phase('network_capture'):
+                restaurants = cdp_capture.records_from_payloads(
+                    cdp_capture.capture_json_responses(driver), country_code, country_name
+                )
+            if restaurants:
+                print(f"Found {len(restaurants)} restaurants for {country_code} in network responses")
+                return restaurants
+            print("Warning: No restaurant data found in network responses, falling back to page parsing")
+            extraction = 'html'
+
+        # Load any lazy-loaded tiles (needs to be done AFTER switching country)
+        print("Loading all content...")
+        with metrics.phase('scroll'):
+            tiles = waits.load_all_tiles(driver, location_div_tags['restaurant'], max_scrolls=20)
+        # No tiles may mean the site was redeployed with new class names
+        if not tiles and resolve_selectors(driver):
+            with metrics.phase('scroll'):
+                tiles = waits.load_all_tiles(driver, location_div_tags['restaurant'], max_scrolls=20)
+        if debug:
+            print(f"{tiles} restaurant tiles rendered")
         
-        # Based on HTML analysis, restaurants are structured as:
-        # Name: <div class="sc-dCFHLb..."><div id="flags"></div>RESTAURANT_NAME</div>
-        # Address: <div class="sc-fhzFiK...">ADDRESS</div>
+        print(f"Extracting restaurant data for {country_code} ({extraction} mode)...")
         
-        # Find all restaurant name containers and extract details from parent
-        try:
-            # Find divs with class containing "sc-dCFHLb" that have a flags div inside
-            restaurant_containers = driver.find_elements(By.CSS_SELECTOR, "div.sc-kOPcWz")
-            print(f"Found {len(restaurant_containers)} restaurant containers")
-
-            for restaurant_container in restaurant_containers:
-                try:
+        sub_locations = {}
+        if sub_location_mode == 'bulk':
+            try:
+                sub_locations = fetch_sub_locations_in_bulk(driver, country_code, country_name)
+            except Exception as e:
+                print(f"Warning: Bulk sub-location fetch failed, opening modals one by one: {e}")
 
-                    view_location_btn = restaurant_container.find_elements(By.CSS_SELECTOR, "button.sc-fXSgeo")
-
-                    if len(view_location_btn) > 0:
-
-                        # Open Sub Restaurant List
-                        view_location_btn[0].click()
-                        WebDriverWait(driver, 5).until(
-                            lambda d: len(d.find_elements(By.CSS_SELECTOR, sub_location_div_tags["restaurant"])) > 0
-                        )
-                        time.sleep(1)
-                        sub_restaurant_containers = driver.find_elements(By.CSS_SELECTOR, sub_location_div_tags["restaurant"])
-                        print(f"Found {len(sub_restaurant_containers)} sub-restaurant containers")
-                        for sub_restaurant_container in sub_restaurant_containers:
-                            restaurant_data = extract_details_from_restuarant_container(sub_restaurant_container, sub_location_div_tags)
-                            
-                            # Format Address: Name, Address, Country Name
-                            try:
-                                current_address = restaurant_data.get('Address', '')
-                                restaurant_name = restaurant_data.get('Name', '')
-                                # Only format if we have an address
-                                if current_address:
-                                    restaurant_data['Address'] = f"{restaurant_name}, {current_address}, {country_name}"
-                            except Exception as e:
-                                print(f"Error formatting address: {e}")
-
-                            restaurant_data['CountryCode'] = country_code
-                            restaurants.append(restaurant_data)
-                        # Close Sub Restaurant List
-                        close_button = driver.find_element(By.CSS_SELECTOR, "button.sc-iHGNWf")
-                        close_button.click()
-
-                        WebDriverWait(driver, 5).until(
-                            lambda d: len(d.find_elements(By.CSS_SELECTOR, "button.sc-iHGNWf")) == 0
-                        )
-                        time.sleep(1)
-
-                    
-                    else:
-                        restaurant_data = extract_details_from_restuarant_container(restaurant_container, location_div_tags)
-                        
-                        # Format Address: Name, Address, Country Name
-                        try:
-                            current_address = restaurant_data.get('Address', '')
-                            restaurant_name = restaurant_data.get('Name', '')
-                            # Only format if we have an address
-                            if current_address:
-                                restaurant_data['Address'] = f"{restaurant_name}, {current_address}, {country_name}"
-                        except Exception as e:
-                            print(f"Error formatting address: {e}")
-
-                        restaurant_data['CountryCode'] = country_code
-                        restaurants.append(restaurant_data)
-                    
-                except Exception as e:
-                    print(f"Error extracting individual restaurant: {e}")
-                    continue
-                
-        except Exception as e:
-            print(f"Error extracting restaurants: {e}")
-            import traceback
-            traceback.print_exc()
-    
+        # Includes any per-chain modal time, which is also reported as modal_open/modal_close
+        with metrics.phase('extraction'):
+            if extraction == 'html':
+                restaurants = extract_restaurants_from_page_source(driver, country_code, country_name, sub_locations)
+            elif extraction == 'js':
+                restaurants = extract_restaurants_with_script(driver, country_code, country_name, sub_locations)
+            else:
+                restaurants = extract_restaurants_with_selenium(driver, country_code, country_name, sub_locations)
         
         print(f"Found {len(restaurants)} restaurants for {country_code}")
         
@@ -416,12 +834,15 @@ def scrape_restaurants(driver, country_code, country_name):
     except Exception as e:
         print(f"Error during scraping {country_code}: {e}")
         if driver:
-            save_page_html(driver, f'_{country_code}')
+            with metrics.phase('save_page_html'):
+                save_page_html(driver, f'_{country_code}', error=True)
         raise
 
 
 def save_to_csv(restaurants, country_code):
     """Save restaurant data to CSV file."""
+    import pandas as pd
+
     if not restaurants:
         print(f"No restaurants to save for {country_code}.")
         return
@@ -449,41 +870,303 @@ def save_to_csv(restaurants, country_code):
 
     
 
-def main():
-    """Main function to run the scraper."""
-    import sys
+def output_filenames(country_code, output_format='csv'):
+    """Per-country files written by save_restaurants for output_format."""
+    extensions = {'csv': ['csv'], 'parquet': ['parquet'], 'both': ['csv', 'parquet']}[output_format]
+    return [f'amex_restaurants_{country_code}.{extension}' for extension in extensions]
+
+
+def save_restaurants(restaurants, country_code, output_format='csv'):
+    """Save restaurant data as CSV, Parquet or both."""
+    if output_format in ('csv', 'both'):
+        save_to_csv(restaurants, country_code)
+    if output_format in ('parquet', 'both'):
+        from parquet_utils import save_to_parquet
+        save_to_parquet(restaurants, country_code)
+
+
+def scrape_country(driver, code, country_name, extraction='selenium', sub_location_mode='modal',
+                   output_format='csv', snapshot_db=None, enrich=False):
+    """
+    Scrape one country and save it, keeping failures isolated to that country.
+
+    Returns the scraped restaurants, or None if the country failed.
+    """
+    print(f"\n--- Starting scrape for {country_name} ({code}) ---")
+    with metrics.country(code) as country_metrics:
+        try:
+            restaurants = scrape_restaurants(driver, code, country_name, extraction=extraction,
+                                             sub_location_mode=sub_location_mode)
+            restaurants, merged = records.resolve_duplicates(restaurants)
+            if merged:
+                print(f"Merged {merged} duplicate rows for {code}")
+            country_metrics.rows = len(restaurants)
+            if enrich and restaurants:
+                import enrichment
+                with metrics.phase('enrich'):
+                    enrichment.enrich_restaurants(restaurants)
+            with metrics.phase('save'):
+                save_restaurants(restaurants, code, output_format)
+            # An empty scrape is more likely a broken page than every restaurant leaving
+            if snapshot_db and restaurants:
+                import snapshot_store
+                with metrics.phase('snapshot_db'):
+                    diff = snapshot_store.update_snapshot(snapshot_db, restaurants, code)
+                    snapshot_store.write_diff_report(diff, code)
+            return restaurants
+        except Exception as e:
+            print(f"Failed to scrape {code}: {e}")
+            country_metrics.success = False
+            country_metrics.error = str(e)
+            return None
+
+
+def scrape_country_with_retries(driver, code, country_name, restart, retries=2, backoff=5.0, checkpoint=None,
+                                **country_options):
+    """
+    Scrape one country, retrying failures with exponential backoff.
+
+    Each retry quits the current browser and calls restart() for a fresh
+    session, since a failure often leaves the page (or Chrome) in a bad
+    state. A scrape that finds no restaurants counts as a failure. Progress
+    is recorded in checkpoint if given. Returns (driver, restaurants): the
+    driver to keep using, which may be a new session or None if no session
+    could be started, and the restaurants or None if every attempt failed.
+    """
+    if checkpoint:
+        checkpoint.mark_started(code)
+    error = None
+    for attempt in range(1, retries + 2):
+        if attempt > 1:
+            delay = backoff * 2 ** (attempt - 2)
+            print(f"Retrying {code} in {delay:.0f}s with a fresh browser (attempt {attempt}/{retries + 1})")
+            metrics.count('country_retries')
+            time.sleep(delay)
+        if attempt > 1 or driver is None:
+            if driver is not None:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+            try:
+                driver = restart()
+            except Exception as e:
+                print(f"Could not start a new browser session: {e}")
+                driver, error = None, str(e)
+                continue
+
+        restaurants = scrape_country(driver, code, country_name, **country_options)
+        if restaurants:
+            if checkpoint:
+                files = output_filenames(code, country_options.get('output_format', 'csv'))
+                checkpoint.mark_done(code, len(restaurants), files, attempts=attempt)
+            return driver, restaurants
+        # An empty scrape is more likely a broken page than a country without restaurants
+        error = f"Scrape of {code} failed" if restaurants is None else f"No restaurants found for {code}"
+
+    if checkpoint:
+        checkpoint.mark_failed(code, error, attempts=retries + 1)
+    return driver, None
+
+
+def scrape_countries_parallel(driver, countries_to_scrape, available_countries, workers,
+                              headless=True, extraction='selenium', lean=False, retries=0, backoff=5.0,
+                              checkpoint=None, **country_options):
+    """
+    Scrape countries with a bounded pool of browser sessions.
+
+    Each worker loads the website once and then takes country codes off a
+    shared queue until it is empty. The already loaded driver is reused as
+    the first worker, so only workers - 1 new browsers are started.
+    Failed countries are retried by the same worker with a fresh browser
+    (see scrape_country_with_retries). Extra keyword arguments are passed on
+    to scrape_country.
+    """
+    import queue
+    import threading
+
+    country_queue = queue.Queue()
+    for code in countries_to_scrape:
+        country_queue.put(code)
+    stop = threading.Event()
+
+    def restart():
+        return load_website(headless=headless, capture_network=(extraction == 'cdp'), lean=lean)
+
+    def worker(worker_driver):
+        try:
+            while not stop.is_set():
+                try:
+                    code = country_queue.get_nowait()
+                except queue.Empty:
+                    return
+                # Starts this worker's browser on its first country
+                worker_driver, _ = scrape_country_with_retries(
+                    worker_driver, code, available_countries[code], restart, retries=retries, backoff=backoff,
+                    checkpoint=checkpoint, extraction=extraction, **country_options
+                )
+        except Exception as e:
+            # Remaining countries stay on the queue for the other workers
+            print(f"Worker failed: {e}")
+        finally:
+            # The shared driver is closed by main()
+            if worker_driver is not None and worker_driver is not driver:
+                worker_driver.quit()
+
+    workers = max(1, min(workers, len(countries_to_scrape)))
+    print(f"Scraping with {workers} browser sessions")
+    threads = [
+        threading.Thread(target=worker, args=(driver if i == 0 else None,), daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            # Join with a timeout so KeyboardInterrupt still reaches the main thread
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        raise
+
+    if not country_queue.empty():
+        remaining = []
+        while not country_queue.empty():
+            remaining.append(country_queue.get_nowait())
+        print(f"No worker left to scrape: {', '.join(remaining)}")
+
+
+# Subcommands of main(); each imports only what it needs, so combine, query
+# and report start without loading Selenium or pandas
+COMMANDS = ['scrape', 'combine', 'query', 'report']
+
+
+def combine(countries=None, suffix='ALL', dedupe=True, output_format='csv'):
+    """Combine per-country files; countries is a comma-separated list, None or 'ALL' for all of them."""
+    from csv_utils import combine_amex_restaurants
+
+    country_list = None
+    if countries and countries.upper() != 'ALL':
+        country_list = [c.strip().upper() for c in countries.split(',')]
+    combine_amex_restaurants(country_codes=country_list, output_suffix=suffix, dedupe=dedupe,
+                             output_format=output_format)
+
+
+def combine_command(argv):
     import argparse
-    import glob
-    
-    print("=" * 60)
-    print("American Express Dining Benefit Restaurant Scraper")
-    print("=" * 60)
-    
-    parser = argparse.ArgumentParser(description='Scrape AMEX Dining Benefits')
+
+    parser = argparse.ArgumentParser(prog='scrape_restaurants.py combine', description='Combine per-country files into one')
+    parser.add_argument('countries', nargs='?', help='Comma-separated country codes (e.g. AT,NZ). Default: every country file found')
+    parser.add_argument('--suffix', '--combine-suffix', dest='suffix', default='ALL', help='Suffix for the combined file (e.g. Oceania). Default: ALL')
+    parser.add_argument('--dedupe', '--combine-dedupe', dest='dedupe', action='store_true', default=True, help='Drop rows for the same restaurant. Default: on')
+    parser.add_argument('--no-dedupe', '--no-combine-dedupe', dest='dedupe', action='store_false', help='Keep every row')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help='Output format. Default: csv')
+    args = parser.parse_args(argv)
+    combine(args.countries, args.suffix, args.dedupe, args.format)
+
+
+def scrape_parser():
+    """Parser for scraping, which also takes the older --combine and --query flags."""
+    import argparse
+    import enrichment
+    import query
+    from checkpoint import DEFAULT_MANIFEST
+    from page_snapshots import SNAPSHOT_COMPRESSIONS, SNAPSHOT_POLICIES
+
+    parser = argparse.ArgumentParser(
+        description='Scrape AMEX Dining Benefits. Other commands: combine, query, report '
+                    '(e.g. "scrape_restaurants.py report --help")')
     parser.add_argument('--visible', action='store_true', help='Run with visible browser window')
     parser.add_argument('--debug', action='store_true', help='Enable debug output')
+    parser.add_argument('--lean', action='store_true', help='Lightweight browser profile: block images, media, fonts and trackers, disable unneeded Chrome features and use the eager page-load strategy')
     parser.add_argument('--country', type=str, default='GB', help='Country code to scrape (e.g., GB, US, FR) or "ALL"')
+    parser.add_argument('--extraction', choices=EXTRACTION_MODES, default='selenium', help='How to read restaurant tiles: per-element WebDriver calls (selenium), one page_source parsed offline (html), one execute_script call over the live DOM (js) or the JSON the page fetches, captured via DevTools (cdp)')
+    parser.add_argument('--sub-locations', choices=SUB_LOCATION_MODES, default='modal', help='How to read multi-site chains: open each "view locations" modal from Python (modal) or read all of them with a single in-browser script (bulk)')
+    parser.add_argument('--wait-timeout', type=float, help='Seconds to wait for the page, tiles or modals to settle before giving up. Default: 10')
+    parser.add_argument('--resume', action='store_true', help='Skip countries the checkpoint manifest records as done (and whose files still exist); scrape failed and unstarted ones')
+    parser.add_argument('--checkpoint', type=str, default=DEFAULT_MANIFEST, help=f'Checkpoint manifest recording finished countries, row counts and files. Default: {DEFAULT_MANIFEST}')
+    parser.add_argument('--retries', type=int, default=2, help='Times to retry a failed country with a fresh browser session. Default: 2')
+    parser.add_argument('--retry-backoff', type=float, default=5.0, help='Seconds before the first retry, doubled for each further retry. Default: 5')
+    parser.add_argument('--workers', type=int, default=1, help='Number of parallel browser sessions to use when scraping several countries. Default: 1')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help='Output format for per-country and combined files. Default: csv')
+    parser.add_argument('--snapshot-db', type=str, help='SQLite file to track restaurants across runs. Each scrape is upserted and a amex_restaurants_<CODE>_diff.csv change report is written')
+    parser.add_argument('--enrich', action='store_true', help='Add Street, City, Postcode, Latitude, Longitude and Place_ID columns (parsed from the address and maps link, cached between runs)')
+    parser.add_argument('--enrich-cache', type=str, help='SQLite file for cached enrichment results. Default: enrichment.sqlite in the cache directory')
+    parser.add_argument('--resolver', choices=enrichment.RESOLVERS, default='none', help='With --enrich, geocoder for restaurants whose maps link has no coordinates. Default: none')
+    parser.add_argument('--resolver-file', type=str, help='CSV with Address, Latitude and Longitude columns for --resolver local')
+    parser.add_argument('--page-snapshots', choices=SNAPSHOT_POLICIES, default='on-error', help='When to save the rendered page HTML for debugging. Default: on-error')
+    parser.add_argument('--snapshot-compression', choices=SNAPSHOT_COMPRESSIONS, default='gzip', help='Compression for saved page HTML. Default: gzip')
+    parser.add_argument('--snapshot-retention', type=int, default=20, help='Number of page HTML snapshots to keep. Default: 20')
+    parser.add_argument('--cache-ttl', type=float, default=24, help='Hours to reuse the cached chromedriver path and robots.txt. Default: 24')
+    parser.add_argument('--refresh-cache', action='store_true', help='Resolve chromedriver and re-download robots.txt instead of using the cache')
+    parser.add_argument('--metrics-file', type=str, help='Write per-phase timings and WebDriver/wait counters for the run to this file')
+    parser.add_argument('--metrics-format', choices=METRICS_FORMATS, help='Metrics file format. Default: prometheus for .prom files, JSON lines otherwise')
     parser.add_argument('--combine', type=str, nargs='?', const='ALL', help='Comma-separated list of country codes to combine (e.g. AT,NZ). If used without values, combines all available country CSVs.')
     parser.add_argument('--combine-suffix', type=str, default='ALL', help='Suffix for the output combined file (e.g. Oceania). Default: ALL')
-    
-    args = parser.parse_args()
-    
+    parser.add_argument('--combine-dedupe', dest='combine_dedupe', action='store_true', default=True, help='Drop rows for the same restaurant (same normalised name, address and maps link) while combining. Default: on')
+    parser.add_argument('--no-combine-dedupe', dest='combine_dedupe', action='store_false', help='Keep every row while combining')
+    parser.add_argument('--query', type=str, nargs='?', const='', help='Query the combined dataset (default: the --combine-suffix output) instead of scraping. Use with --near/--radius/--limit/--cuisine/--status/--query-country')
+    query.add_query_arguments(parser, country_flag='--query-country')
+    return parser
+
+
+def main(argv=None):
+    """
+    Run a subcommand: scrape (the default), combine, query or report.
+
+    Without a subcommand the older flat flags still work, e.g. --combine
+    and --query.
+    """
+    import sys
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    command = argv.pop(0) if argv and argv[0] in COMMANDS else 'scrape'
+    if command == 'combine':
+        return combine_command(argv)
+    if command == 'query':
+        import query
+        return query.main(argv, prog='scrape_restaurants.py query')
+    if command == 'report':
+        import report
+        return report.main(argv, prog='scrape_restaurants.py report')
+
+    args = scrape_parser().parse_args(argv)
+
     if args.combine is not None:
-        country_list = None
-        suffix = args.combine_suffix
-        
-        # If combine has a value and it's not the 'ALL' sentinel
-        if args.combine and args.combine != 'ALL':
-            # Parse the comma-separated list
-            country_list = [c.strip().upper() for c in args.combine.split(',')]
-            
-        combine_amex_restaurants(country_codes=country_list, output_suffix=suffix)
+        return combine(args.combine, args.combine_suffix, args.combine_dedupe, args.format)
+
+    if args.query is not None:
+        import query
+        query.run_query(args.query or query.default_source(args.combine_suffix), args.near, args.radius, args.limit,
+                        args.cuisine, args.query_country, args.status, rebuild=args.rebuild_index)
         return
 
+    scrape(args)
+
+
+def scrape(args):
+    """Scrape the countries selected on the command line."""
+    import enrichment
+    import run_cache
+    import waits
+    from checkpoint import Checkpoint
+    from page_snapshots import snapshotter
+
+    print("=" * 60)
+    print("American Express Dining Benefit Restaurant Scraper")
+    print("=" * 60)
 
     headless = not args.visible
     global debug 
     debug = args.debug
+    if args.wait_timeout is not None:
+        waits.DEFAULT_TIMEOUT = args.wait_timeout
+    snapshotter.configure(args.page_snapshots, args.snapshot_compression, args.snapshot_retention)
+    run_cache.configure(ttl_hours=args.cache_ttl, refresh=args.refresh_cache)
+    if args.enrich:
+        enrichment.configure(cache_path=args.enrich_cache,
+                             resolver=enrichment.make_resolver(args.resolver, args.resolver_file))
     target_country = args.country.upper()
     
     if not headless:
@@ -492,9 +1175,10 @@ def main():
         print("Running in HEADLESS mode")
 
     driver = None
+    checkpoint = Checkpoint(args.checkpoint, resume=args.resume)
     try:
         # Initialize driver once
-        driver = load_website(headless=headless)
+        driver = load_website(headless=headless, capture_network=(args.extraction == 'cdp'), lean=args.lean)
         
         available_countries = get_available_countries(driver)
         print(f"Available countries: {', '.join(available_countries.keys())}")
@@ -509,17 +1193,32 @@ def main():
             print(f"Available: {', '.join(available_countries.keys())}")
             return
 
+        if args.resume:
+            done = checkpoint.completed()
+            skipped = [code for code in countries_to_scrape if code in done]
+            countries_to_scrape = [code for code in countries_to_scrape if code not in done]
+            if skipped:
+                print(f"Skipping completed countries: {', '.join(skipped)}")
+
         print(f"Will scrape: {', '.join(countries_to_scrape)}")
+        country_options = dict(extraction=args.extraction, sub_location_mode=args.sub_locations,
+                               output_format=args.format, snapshot_db=args.snapshot_db, enrich=args.enrich)
         
-        for code in countries_to_scrape:
-            print(f"\n--- Starting scrape for {available_countries[code]} ({code}) ---")
-            try:
-                restaurants = scrape_restaurants(driver, code, available_countries[code])
-                save_to_csv(restaurants, code)
-            except Exception as e:
-                print(f"Failed to scrape {code}: {e}")
-                # Continue with next country
-                continue
+        if args.workers > 1 and len(countries_to_scrape) > 1:
+            scrape_countries_parallel(driver, countries_to_scrape, available_countries, args.workers,
+                                      headless=headless, lean=args.lean, retries=args.retries,
+                                      backoff=args.retry_backoff, checkpoint=checkpoint, **country_options)
+        else:
+            restart = lambda: load_website(headless=headless, capture_network=(args.extraction == 'cdp'), lean=args.lean)
+            for code in countries_to_scrape:
+                # Failures are retried, then isolated per country; continue with the next one
+                driver, _ = scrape_country_with_retries(driver, code, available_countries[code], restart,
+                                                        retries=args.retries, backoff=args.retry_backoff,
+                                                        checkpoint=checkpoint, **country_options)
+
+        done, failed = checkpoint.summary()
+        if failed:
+            print(f"\nFailed after retries: {', '.join(failed)}. Run again with --resume to retry them.")
                 
     except KeyboardInterrupt:
         print("\nScraping interrupted by user.")
@@ -529,8 +1228,15 @@ def main():
         traceback.print_exc()
     finally:
         if driver:
-            driver.quit()
+            try:
+                driver.quit()
+            except Exception:
+                # Already closed by a retry
+                pass
             print("Browser closed.")
+        snapshotter.flush()
+        if args.metrics_file:
+            metrics.write(args.metrics_file, args.metrics_format)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,174 @@
+"""
+Persistent SQLite snapshot of scraped restaurants with per-country change detection.
+
+Each scrape is upserted into the store keyed on a stable identity
+(normalised name + address + country). The store keeps first_seen,
+last_seen and removed_at timestamps, and logs every added / removed /
+modified entry so downstream jobs can process only the deltas.
+"""
+
+import csv
+import hashlib
+import re
+import sqlite3
+import unicodedata
+from datetime import datetime, timezone
+
+
+# Fields compared to decide whether a known restaurant was modified
+TRACKED_FIELDS = ['Name', 'Address', 'Cuisine', 'Status', 'Google_Maps_Link']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS restaurants (
+    identity TEXT PRIMARY KEY,
+    country_code TEXT NOT NULL,
+    name TEXT,
+    address TEXT,
+    cuisine TEXT,
+    status TEXT,
+    google_maps_link TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    removed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS restaurants_country ON restaurants (country_code);
+CREATE TABLE IF NOT EXISTS changes (
+    scraped_at TEXT NOT NULL,
+    country_code TEXT NOT NULL,
+    identity TEXT NOT NULL,
+    change TEXT NOT NULL,
+    changed_fields TEXT
+);
+CREATE INDEX IF NOT EXISTS changes_scraped_at ON changes (scraped_at);
+"""
+
+COLUMNS = {
+    'Name': 'name',
+    'Address': 'address',
+    'Cuisine': 'cuisine',
+    'Status': 'status',
+    'Google_Maps_Link': 'google_maps_link',
+}
+
+
+def normalize_text(value):
+    """Casefold, strip accents and punctuation, and collapse whitespace."""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    value = value.replace('&amp;', '&').casefold()
+    value = re.sub(r'[^\w\s]', ' ', value)
+    return ' '.join(value.split())
+
+
+def restaurant_identity(restaurant, country_code=None):
+    """Stable key for a restaurant: hash of normalised name, address and country."""
+    country_code = country_code or restaurant.get('CountryCode', '')
+    key = '|'.join([
+        normalize_text(restaurant.get('Name', '')),
+        normalize_text(restaurant.get('Address', '')),
+        country_code.upper(),
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def connect(db_path):
+    """Open (and create if needed) the snapshot database."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _row_to_record(row):
+    record = {field: row[column] or '' for field, column in COLUMNS.items()}
+    record['CountryCode'] = row['country_code']
+    return record
+
+
+def update_snapshot(db_path, restaurants, country_code, scraped_at=None):
+    """
+    Upsert one country's scrape into the store.
+
+    Returns a dict with 'added', 'removed' and 'modified' lists of records.
+    Modified records carry a 'Changed_Fields' entry naming what changed.
+    """
+    scraped_at = scraped_at or datetime.now(timezone.utc).isoformat(timespec='seconds')
+    diff = {'added': [], 'removed': [], 'modified': []}
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            existing = {
+                row['identity']: row
+                for row in conn.execute('SELECT * FROM restaurants WHERE country_code = ?', (country_code,))
+            }
+            seen = set()
+
+            for restaurant in restaurants:
+                identity = restaurant_identity(restaurant, country_code)
+                if identity in seen:
+                    continue
+                seen.add(identity)
+                values = [restaurant.get(field, '') or '' for field in TRACKED_FIELDS]
+                row = existing.get(identity)
+
+                if row is None:
+                    conn.execute(
+                        'INSERT INTO restaurants (identity, country_code, name, address, cuisine, status, '
+                        'google_maps_link, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        [identity, country_code, *values, scraped_at, scraped_at],
+                    )
+                    change, changed_fields = 'added', []
+                else:
+                    old = _row_to_record(row)
+                    changed_fields = [f for f, v in zip(TRACKED_FIELDS, values) if old[f] != v]
+                    conn.execute(
+                        'UPDATE restaurants SET name = ?, address = ?, cuisine = ?, status = ?, '
+                        'google_maps_link = ?, last_seen = ?, removed_at = NULL WHERE identity = ?',
+                        [*values, scraped_at, identity],
+                    )
+                    if row['removed_at'] is not None:
+                        # A restaurant that comes back counts as added again
+                        change = 'added'
+                    elif changed_fields:
+                        change = 'modified'
+                    else:
+                        continue
+
+                record = dict(restaurant, CountryCode=country_code)
+                if change == 'modified':
+                    record['Changed_Fields'] = ', '.join(changed_fields)
+                diff[change].append(record)
+                conn.execute(
+                    'INSERT INTO changes VALUES (?, ?, ?, ?, ?)',
+                    (scraped_at, country_code, identity, change, ', '.join(changed_fields)),
+                )
+
+            for identity, row in existing.items():
+                if identity in seen or row['removed_at'] is not None:
+                    continue
+                conn.execute('UPDATE restaurants SET removed_at = ? WHERE identity = ?', (scraped_at, identity))
+                conn.execute(
+                    'INSERT INTO changes VALUES (?, ?, ?, ?, ?)',
+                    (scraped_at, country_code, identity, 'removed', ''),
+                )
+                diff['removed'].append(_row_to_record(row))
+    finally:
+        conn.close()
+
+    return diff
+
+
+def write_diff_report(diff, country_code, filename=None):
+    """Write added/removed/modified entries to amex_restaurants_{code}_diff.csv."""
+    filename = filename or f'amex_restaurants_{country_code}_diff.csv'
+    fieldnames = ['Change'] + TRACKED_FIELDS + ['CountryCode', 'Changed_Fields']
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        for change in ('added', 'removed', 'modified'):
+            for record in diff[change]:
+                writer.writerow(dict(record, Change=change))
+    print(f"Changes for {country_code}: {len(diff['added'])} added, "
+          f"{len(diff['removed'])} removed, {len(diff['modified'])} modified ({filename})")
+    return filename
@@ -0,0 +1,108 @@
+"""
+Offline checks of the tile clean-up rules and the page_source parser.
+
+No browser is needed: the fixtures are a handcrafted tile covering the
+markup the clean-up rules deal with (NEW and * flags, <br> line breaks,
+&amp; and &nbsp;) and benchmark.py's synthetic page.
+
+Run with:
+    python -m pytest -q
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+from restaurant_parsing import (
+    clean_address,
+    clean_restaurant_name,
+    extract_details_from_element,
+    extract_restaurants_from_html,
+    parse_html,
+)
+from scrape_restaurants import location_div_tags
+
+
+TILE = """
+<div class="sc-kOPcWz">
+  <div class="sc-dCFHLb"><div id="flags">NEW</div>Fish &amp; Chips&nbsp;Co<div>*</div></div>
+  <div class="sc-jxOSlx"><svg width="8" height="8"></svg>British</div>
+  <div class="sc-fhzFiK">1&nbsp;High Street<br>Smith &amp; Sons Yard<br>London</div>
+  <a href="https://www.google.com/maps/search/?api=1&amp;query=Fish">Map</a>
+</div>
+"""
+
+PLAIN_TILE = """
+<div class="sc-kOPcWz">
+  <div class="sc-dCFHLb"><div id="flags"></div>Plain Kitchen</div>
+  <div class="sc-jxOSlx">Thai</div>
+  <div class="sc-fhzFiK">2 Low Road<br>Leeds</div>
+</div>
+"""
+
+
+class CleanUpRulesTest(unittest.TestCase):
+
+    def test_name_markers_are_stripped(self):
+        self.assertEqual(clean_restaurant_name("NEW\nThe Ivy\n*", ["NEW", "*"]), "The Ivy")
+
+    def test_markers_without_status_are_kept(self):
+        self.assertEqual(clean_restaurant_name("NEW Street Kitchen", []), "NEW Street Kitchen")
+
+    def test_remaining_line_breaks_become_dashes(self):
+        self.assertEqual(clean_restaurant_name("NEW\nDishoom\nShoreditch", ["NEW"]), "Dishoom - Shoreditch")
+
+    def test_address_line_breaks_become_commas(self):
+        self.assertEqual(clean_address(" 1 High Street<br>London "), "1 High Street, London")
+
+
+class ParserTest(unittest.TestCase):
+
+    def test_tile_with_every_marker(self):
+        container = parse_html(TILE).select_one(location_div_tags['restaurant'])
+        self.assertEqual(extract_details_from_element(container, location_div_tags), {
+            'Name': 'Fish & Chips Co',
+            'Cuisine': 'British',
+            'Status': 'NEW, *',
+            # innerHTML keeps entities escaped, as Selenium's get_attribute does
+            'Address': '1&nbsp;High Street, Smith &amp; Sons Yard, London',
+            'Google_Maps_Link': 'https://www.google.com/maps/search/?api=1&query=Fish',
+        })
+
+    def test_records_are_formatted(self):
+        restaurants = extract_restaurants_from_html(PLAIN_TILE, location_div_tags, 'GB', 'United Kingdom')
+        self.assertEqual(restaurants, [{
+            'Name': 'Plain Kitchen',
+            'Address': 'Plain Kitchen, 2 Low Road, Leeds, United Kingdom',
+            'Cuisine': 'Thai',
+            'Status': '',
+            'Google_Maps_Link': '',
+            'CountryCode': 'GB',
+        }])
+
+    def test_synthetic_page(self):
+        page = benchmark.static_page('AA', 30, 3, 2)
+        restaurants = extract_restaurants_from_html(page, location_div_tags, 'AA', 'AA Country')
+        self.assertEqual(len(restaurants), 30)
+        for i, restaurant in enumerate(restaurants):
+            name = f'AA Restaurant {i}'
+            self.assertEqual(restaurant['Name'], name)
+            self.assertEqual(restaurant['Cuisine'], benchmark.CUISINES[i % len(benchmark.CUISINES)])
+            if i % 10 == 0:
+                # Chains have a "view locations" button instead of an address
+                self.assertEqual(restaurant['Address'], '')
+                self.assertEqual(restaurant['Status'], '')
+                continue
+            status = [flag for flag, every in (('NEW', 7), ('*', 11)) if i % every == 0]
+            self.assertEqual(restaurant['Status'], ', '.join(status))
+            self.assertEqual(restaurant['Address'],
+                             f'{name}, {i} High Street, Town {i % 50}, AB{i % 90} 1CD, AA Country')
+            self.assertEqual(restaurant['Google_Maps_Link'],
+                             f'https://www.google.com/maps/search/?api=1&query={i}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,269 @@
+"""
+Condition based waits for the Amex dining benefit page.
+
+These replace the fixed time.sleep() calls in the scraper. A small observer
+is injected into the page once; it counts DOM mutations and in-flight
+fetch/XHR requests so we can move on as soon as the page has settled
+instead of always waiting for the worst case.
+"""
+
+import time
+import weakref
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+from metrics import metrics
+
+
+# Seconds to wait for any condition before giving up (set from --wait-timeout)
+DEFAULT_TIMEOUT = 10
+
+# How often conditions are polled
+POLL_FREQUENCY = 0.1
+
+# How long the DOM and network must stay quiet to count as idle
+QUIET_PERIOD = 0.3
+
+_INSTALL_OBSERVER_JS = """
+if (!window.__amexWait) {
+    const state = {mutations: 0, lastMutation: performance.now(), pending: 0};
+    new MutationObserver(() => {
+        state.mutations += 1;
+        state.lastMutation = performance.now();
+    }).observe(document, {childList: true, subtree: true, characterData: true});
+
+    const origFetch = window.fetch;
+    if (origFetch) {
+        window.fetch = function () {
+            state.pending += 1;
+            return origFetch.apply(this, arguments).finally(() => { state.pending -= 1; });
+        };
+    }
+    const origSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        state.pending += 1;
+        this.addEventListener('loadend', () => { state.pending -= 1; }, {once: true});
+        return origSend.apply(this, arguments);
+    };
+    window.__amexWait = state;
+}
+"""
+
+_STATE_JS = _INSTALL_OBSERVER_JS + """
+const s = window.__amexWait;
+return {
+    mutations: s.mutations,
+    quietFor: (performance.now() - s.lastMutation) / 1000,
+    pending: s.pending,
+    height: document.body ? document.body.scrollHeight : 0
+};
+"""
+
+# Tile count, the list total if the page shows one ("42 restaurants"), and
+# whether the document can scroll at all
+_TILE_STATE_JS = """
+const tiles = document.querySelectorAll(arguments[0]);
+let total = null;
+const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+    const match = /^\\s*(\\d[\\d,.]*)\\s+(restaurants?|results?|venues?)\\s*$/i.exec(node.nodeValue);
+    if (match) { total = parseInt(match[1].replace(/[,.]/g, ''), 10); break; }
+}
+return {
+    tiles: tiles.length,
+    total: total,
+    scrollable: document.documentElement.scrollHeight > window.innerHeight + 2
+};
+"""
+
+# Bring the last tile (and whatever lazy-load sentinel follows it) into view.
+# The scroll counts as activity so lazy loading gets a quiet period to start.
+SCROLL_PAST_LAST_TILE_JS = """
+const tiles = document.querySelectorAll(arguments[0]);
+if (tiles.length) { tiles[tiles.length - 1].scrollIntoView({block: 'end'}); }
+window.scrollBy(0, window.innerHeight);
+if (window.__amexWait) { window.__amexWait.lastMutation = performance.now(); }
+"""
+
+# Lazy-load batch size seen per browser session: the number of tiles shown
+# before scrolling, on a country where scrolling then loaded more. Kept per
+# driver, so a new session (or a restarted daemon) learns it again.
+_batch_sizes = weakref.WeakKeyDictionary()
+
+
+def _timeout(timeout):
+    return DEFAULT_TIMEOUT if timeout is None else timeout
+
+
+class _CountingWait(WebDriverWait):
+    """WebDriverWait that records waits, time spent waiting and timeouts."""
+
+    def until(self, method, message=''):
+        metrics.count('waits')
+        with metrics.phase('waiting'):
+            try:
+                return super().until(method, message)
+            except TimeoutException:
+                metrics.count('wait_timeouts')
+                raise
+
+
+def _wait(driver, timeout):
+    return _CountingWait(driver, _timeout(timeout), poll_frequency=POLL_FREQUENCY)
+
+
+def install_observer(driver):
+    """Inject the mutation/request observer (no-op if already installed)."""
+    driver.execute_script(_INSTALL_OBSERVER_JS)
+
+
+def page_state(driver):
+    """Return mutation count, seconds since last mutation, pending requests and scroll height."""
+    return driver.execute_script(_STATE_JS)
+
+
+# Condition factories, shared by the blocking waits below and async_scraper
+
+def page_idle(quiet_period=QUIET_PERIOD):
+    """Condition: no DOM mutations for quiet_period seconds and no requests in flight."""
+    def idle(driver):
+        state = page_state(driver)
+        if state['pending'] == 0 and state['quietFor'] >= quiet_period:
+            return state
+        return False
+    return idle
+
+
+def dom_changed(since_mutations):
+    """Condition: the mutation count moved past since_mutations."""
+    return lambda driver: page_state(driver)['mutations'] > since_mutations
+
+
+def present(css_selector):
+    """Condition: at least one element matches css_selector."""
+    return lambda driver: len(driver.find_elements(By.CSS_SELECTOR, css_selector)) > 0
+
+
+def absent(css_selector):
+    """Condition: no element matches css_selector."""
+    return lambda driver: len(driver.find_elements(By.CSS_SELECTOR, css_selector)) == 0
+
+
+def wait_for_page_idle(driver, quiet_period=QUIET_PERIOD, timeout=None):
+    """
+    Wait until no DOM mutations happened for quiet_period seconds and no
+    fetch/XHR requests are in flight. Returns the final page state.
+    """
+    return _wait(driver, timeout).until(page_idle(quiet_period))
+
+
+def wait_for_dom_change(driver, since_mutations, timeout=None):
+    """Wait until the mutation count moves past since_mutations."""
+    return _wait(driver, timeout).until(dom_changed(since_mutations))
+
+
+def wait_for_count_stable(driver, css_selector, minimum=1, stable_polls=2, timeout=None):
+    """
+    Wait until at least `minimum` elements match css_selector and the count
+    has stayed the same for `stable_polls` consecutive polls. Returns the count.
+    """
+    history = []
+
+    def stable(d):
+        count = len(d.find_elements(By.CSS_SELECTOR, css_selector))
+        history.append(count)
+        recent = history[-stable_polls:]
+        if count >= minimum and len(recent) == stable_polls and len(set(recent)) == 1:
+            return count
+        return False
+
+    return _wait(driver, timeout).until(stable)
+
+
+def wait_for_present(driver, css_selector, timeout=None):
+    """Wait until at least one element matches css_selector."""
+    return _wait(driver, timeout).until(present(css_selector))
+
+
+def wait_for_absent(driver, css_selector, timeout=None):
+    """Wait until no element matches css_selector."""
+    return _wait(driver, timeout).until(absent(css_selector))
+
+
+def tile_state(driver, tile_selector):
+    """Return the tile count, the total shown by the page (or None) and whether the page scrolls."""
+    return driver.execute_script(_TILE_STATE_JS, tile_selector)
+
+
+def list_complete(driver, state):
+    """
+    Whether a tile_state() shows the whole list, without scrolling.
+
+    True when the count matches the total the page shows, when the page
+    cannot scroll, or when this session has seen lazy loading and the list
+    is shorter than one batch. A list exactly one batch long may have more
+    to load, so it is scrolled.
+    """
+    if state['total'] is not None and state['tiles'] == state['total']:
+        return True
+    if not state['scrollable']:
+        return True
+    batch_size = _batch_sizes.get(driver)
+    return batch_size is not None and 0 < state['tiles'] < batch_size
+
+
+def learn_list_size(driver, initial_tiles, final_tiles):
+    """Record the batch size if scrolling loaded more tiles, for list_complete() on later countries."""
+    if final_tiles > initial_tiles > 0:
+        batch_size = _batch_sizes.get(driver)
+        _batch_sizes[driver] = initial_tiles if batch_size is None else min(batch_size, initial_tiles)
+
+
+def tiles_grew_or_idle(tile_selector, count, quiet_period=QUIET_PERIOD):
+    """Condition: more than count tiles, or the page went idle. Returns the tile state."""
+    idle = page_idle(quiet_period)
+
+    def check(driver):
+        state = tile_state(driver, tile_selector)
+        if state['tiles'] > count or idle(driver):
+            return state
+        return False
+    return check
+
+
+def load_all_tiles(driver, tile_selector, max_scrolls=20, timeout=None):
+    """
+    Make sure every tile matching tile_selector is rendered. Returns the tile count.
+
+    Lists that are already complete (see list_complete) are left alone.
+    Otherwise the last tile is scrolled into view, which is as far as lazy
+    loading needs to be triggered, until a scroll adds no tiles once the
+    page is idle. Moves on as soon as new tiles appear rather than waiting
+    for a quiet period after every batch.
+    """
+    install_observer(driver)
+    state = tile_state(driver, tile_selector)
+    if list_complete(driver, state):
+        metrics.count('scrolls_skipped')
+        return state['tiles']
+
+    initial = count = state['tiles']
+    for _ in range(max_scrolls):
+        driver.execute_script(SCROLL_PAST_LAST_TILE_JS, tile_selector)
+        metrics.count('scrolls')
+        started = time.monotonic()
+        try:
+            state = _wait(driver, timeout).until(tiles_grew_or_idle(tile_selector, count))
+        except TimeoutException:
+            print(f"Warning: page did not settle within {time.monotonic() - started:.1f}s while scrolling")
+            state = tile_state(driver, tile_selector)
+        if state['tiles'] <= count:
+            break
+        count = state['tiles']
+        if state['total'] is not None and count >= state['total']:
+            break
+    learn_list_size(driver, initial, count)
+    driver.execute_script("window.scrollTo(0, 0);")
+    return count